@@ -4,3 +4,4 @@ from .models import *
 admin.site.register(Article)
 admin.site.register(Comment)
 admin.site.register(Profile)
+admin.site.register(Job)
@@ -6,5 +6,4 @@ class BlogConfig(AppConfig):
     name = 'blog'
 
     def ready(self):
-        import blog.startup
         import blog.signals
@@ -0,0 +1,193 @@
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.http import HttpResponse
+from django.urls import path
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotAcceptable, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from blog import cache, routers
+from blog.serializers import CommentSerializer
+from blog.utils.comment_tree import nest_comments
+from blog.views import ArticlePagination, ArticleViewSet, CommentThreadPagination, CommentViewSet
+
+# Async GET handlers for the busiest read endpoints, routed ahead of the DRF
+# router when ASYNC_READS is on (asgi.py turns it on). They reuse the viewsets'
+# querysets, filters, paginators, serializers and the response cache, but the
+# queries are awaited through the async ORM, so a request waiting on the
+# database does not hold a thread. Everything else - writes, the browsable API,
+# cursor pages, requests with a bad token - goes to the DRF view unchanged.
+
+_jwt = JWTAuthentication()
+
+
+def _bearer(request):
+    # reads are public, but DRF answers 401 to a bad bearer token; leave those
+    # to it (False). A valid token needs no user lookup here: the user id in
+    # it is enough to route reads (blog.routers), so the result is that id,
+    # or None without a token.
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return _jwt.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+    except InvalidToken:
+        return False
+
+
+def _prepare(request, view_class, actions, kwargs):
+    # a viewset instance for its configuration; None when DRF should answer
+    user_id = _bearer(request)
+    if user_id is False:
+        return None
+    view = view_class(action_map=actions, args=(), kwargs=kwargs, format_kwarg=None, headers={})
+    view.token_user_id = user_id
+    view.request = view.initialize_request(request)  # also sets view.action
+    try:
+        renderer, media_type = view.perform_content_negotiation(view.request)
+    except NotAcceptable:
+        return None
+    if renderer.format != 'json':
+        return None
+    view.request.accepted_renderer, view.request.accepted_media_type = renderer, media_type
+    return view
+
+
+async def _filtered(view):
+    # filters can introspect the schema once (search.index_available), so
+    # they are applied off the event loop; the queryset itself stays lazy
+    return await sync_to_async(view.filter_queryset)(view.get_queryset())
+
+
+async def _get_object(queryset, pk):
+    try:
+        return await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        raise NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def _page(paginator, queryset, request):
+    # PageNumberPagination.paginate_queryset with the COUNT awaited; the page's
+    # object_list is still a lazy slice
+    django_paginator = paginator.django_paginator_class(queryset, paginator.get_page_size(request))
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(request, django_paginator)
+    try:
+        paginator.page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+    paginator.request = request
+    return paginator.page
+
+
+def _json(data):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json')
+
+
+async def article_list(request, view):
+    if not isinstance(view.paginator, ArticlePagination):
+        # keyset (cursor) pages stay on the DRF path
+        return None
+
+    async def build():
+        page = await _page(view.paginator, await _filtered(view), view.request)
+        articles = [article async for article in page.object_list]
+        return view.paginator.get_paginated_response(view.get_serializer(articles, many=True).data).data
+
+    return await cache.acached_json(request, ['articles'], build)
+
+
+async def article_detail(request, view):
+    pk = view.kwargs['pk']
+
+    async def build():
+        article = await _get_object(await _filtered(view), pk)
+        return view.get_serializer(article).data
+
+    return await cache.acached_json(request, [f'article:{pk}'], build)
+
+
+async def article_comments(request, view):
+    pk = view.kwargs['pk']
+
+    async def build():
+        article = await _get_object(await _filtered(view), pk)
+        comments = article.comments.select_related('author__profile')
+
+        paginator = CommentThreadPagination()
+        paginate = paginator.is_requested(view.request)
+        if paginate:
+            roots = comments.filter(reply_to__isnull=True).order_by('-created_at', '-id').values('id')
+            page = await _page(paginator, roots, view.request)
+            comments = comments.filter(root_id__in=page.object_list)
+
+        rows = [comment async for comment in comments.in_thread_order()]
+        root_comments = nest_comments(CommentSerializer(rows, many=True).data)
+        if paginate:
+            return paginator.get_paginated_response(root_comments).data
+        return root_comments
+
+    return await cache.acached_json(request, [f'comments:{pk}'], build)
+
+
+async def comment_list(request, view):
+    queryset = await _filtered(view)
+    # the keyset page is one query, run by DRF's paginator off the event loop
+    page = await sync_to_async(view.paginate_queryset)(view.list_queryset(queryset))
+    if view.by_thread():
+        comments = [comment async for comment in view.thread_queryset(page)]
+        data = nest_comments(view.get_serializer(comments, many=True).data)
+    else:
+        data = view.get_serializer(page, many=True).data
+    return _json(view.get_paginated_response(data).data)
+
+
+def read_view(view_class, actions, read):
+    # GET through read(), every other method (and any GET read() declines)
+    # through the DRF view the router would have used
+    fallback = sync_to_async(view_class.as_view(actions))
+    allow = ', '.join(
+        method.upper() for method in view_class.http_method_names
+        if method in actions or method == 'options' or (method == 'head' and 'get' in actions))
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            instance = _prepare(request, view_class, actions, kwargs)
+            if instance is not None:
+                try:
+                    async with routers.areplica_reads(instance.token_user_id):
+                        response = await read(request, instance)
+                except APIException as exc:
+                    # the body rest_framework.views.exception_handler would give
+                    response = _json(exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail})
+                    response.status_code = exc.status_code
+                if response is not None:
+                    response['Allow'] = allow
+                    patch_vary_headers(response, ['Accept'])
+                    return response
+        return await fallback(request, *args, **kwargs)
+
+    # as on DRF's view functions (blog.metrics labels requests with it)
+    view.actions = actions
+    return view
+
+
+DETAIL_ACTIONS = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+
+# mounted before the router in blog.urls (same paths and names, so reverse()
+# is unaffected)
+urlpatterns = [
+    path('articles/', read_view(ArticleViewSet, LIST_ACTIONS, article_list), name='article-list'),
+    path('articles/<int:pk>/', read_view(ArticleViewSet, DETAIL_ACTIONS, article_detail), name='article-detail'),
+    path('articles/<int:pk>/comments/',
+         read_view(ArticleViewSet, {'get': 'comments', 'post': 'comments'}, article_comments),
+         name='article-comments'),
+    path('comments/', read_view(CommentViewSet, LIST_ACTIONS, comment_list), name='comment-list'),
+]
@@ -0,0 +1,235 @@
+import json
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from blog.cache import response_cache
+from blog.datagen import generate
+from blog.models import Article, Comment
+
+# In-process API benchmarks. Every dataset size gets its own throwaway test
+# database filled by blog.datagen, each endpoint is timed with the response
+# cache cleared (so the view and its queries are measured, not a cache hit),
+# and the numbers are compared against the baselines checked in next to this
+# file, keyed by database vendor and size.
+
+BASELINES_PATH = Path(__file__).with_name('benchmark_baselines.json')
+
+SIZES = {
+    'small': {'users': 20, 'articles': 200, 'comments': 2000},
+    'medium': {'users': 200, 'articles': 2000, 'comments': 20000},
+    'large': {'users': 2000, 'articles': 20000, 'comments': 200000},
+}
+
+# a metric regresses when it exceeds baseline * (1 + tolerance) + slack
+TOLERANCE = {'time_ms': 0.5, 'sql_ms': 0.5, 'peak_kb': 0.25, 'queries': 0}
+SLACK = {'time_ms': 5, 'sql_ms': 2, 'peak_kb': 64, 'queries': 0}
+
+
+class Fixtures:
+    # ids and clients the scenarios need, looked up once per dataset
+    def __init__(self):
+        self.admin = User.objects.create_superuser('bench_admin', 'bench_admin@example.com', 'bench-pass')
+        self.member = User.objects.filter(username__startswith='load_user').order_by('id').first()
+        by_comments = Article.objects.annotate(n=Count('comments')).order_by('-n', 'id')
+        self.hot_article = by_comments.first()
+        self.hot_comment = Comment.objects.filter(article=self.hot_article).order_by('id').first()
+        self.search_term = self.hot_article.title.split()[0]
+        self.counter = 0
+
+        self.anonymous = APIClient()
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f'{prefix}{self.counter}'
+
+
+def _get(client, url):
+    return lambda: client.get(url, HTTP_ACCEPT='application/json')
+
+
+def scenarios(fx):
+    article = fx.hot_article.id
+
+    def register():
+        username = fx.unique('bench_reg')
+        return fx.anonymous.post('/api/register/', {
+            'username': username, 'email': f'{username}@example.com',
+            'password': 'Bench-pass-123', 'password2': 'Bench-pass-123',
+        }, HTTP_ACCEPT='application/json')
+
+    def obtain_token():
+        return fx.anonymous.post('/api/token/', {
+            'username': fx.member.username, 'password': 'loadtest-pass',
+        }, HTTP_ACCEPT='application/json')
+
+    def create_comment():
+        return fx.admin_client.post('/api/comments/', {
+            'article': article, 'reply_to': fx.hot_comment.id, 'content': fx.unique('benchmark reply '),
+        }, HTTP_ACCEPT='application/json')
+
+    def update_article():
+        return fx.admin_client.patch(
+            f'/api/articles/{article}/', {'content': fx.unique('benchmark edit ')}, HTTP_ACCEPT='application/json')
+
+    def bulk_import():
+        batch = fx.unique('bench-batch')
+        return fx.admin_client.post('/api/articles/bulk/', [
+            {'title': f'{batch} article {i}', 'content': f'imported {batch}', 'tags': ['imported', f'{batch}-{i % 5}']}
+            for i in range(100)
+        ], format='json', HTTP_ACCEPT='application/json')
+
+    return {
+        'articles.list': (_get(fx.anonymous, '/api/articles/'), 200),
+        'articles.list_deep_page': (_get(fx.anonymous, '/api/articles/?page=50'), 200),
+        'articles.list_cursor': (_get(fx.anonymous, '/api/articles/?pagination=cursor&page_size=20'), 200),
+        'articles.list_summary': (_get(fx.anonymous, '/api/articles/?view=summary&pagination=cursor&page_size=20'), 200),
+        'articles.list_by_activity': (_get(fx.anonymous, '/api/articles/?ordering=-last_comment_at'), 200),
+        'articles.search': (_get(fx.anonymous, f'/api/articles/?search={fx.search_term}'), 200),
+        'articles.retrieve': (_get(fx.anonymous, f'/api/articles/{article}/'), 200),
+        'articles.comments': (_get(fx.anonymous, f'/api/articles/{article}/comments/'), 200),
+        'articles.comments_threads': (_get(fx.anonymous, f'/api/articles/{article}/comments/?page_size=10'), 200),
+        'articles.update': (update_article, 200),
+        'articles.bulk_import_100': (bulk_import, 201),
+        'comments.list': (_get(fx.anonymous, '/api/comments/'), 200),
+        'comments.list_article': (_get(fx.anonymous, f'/api/comments/?article={article}'), 200),
+        'comments.list_author': (_get(fx.anonymous, f'/api/comments/?author={fx.hot_comment.author_id}'), 200),
+        'comments.retrieve': (_get(fx.anonymous, f'/api/comments/{fx.hot_comment.id}/'), 200),
+        'comments.create': (create_comment, 201),
+        'tags.list': (_get(fx.anonymous, '/api/tags/?limit=100'), 200),
+        'tags.prefix': (_get(fx.anonymous, '/api/tags/?prefix=load-topic-1'), 200),
+        'users.list': (_get(fx.admin_client, '/api/users/'), 200),
+        'register': (register, 201),
+        'token': (obtain_token, 200),
+    }
+
+
+class SQLTimer:
+    # connection.execute_wrapper hook; captured_queries only keeps millisecond precision
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+def _cold():
+    response_cache().clear()
+
+
+def measure(call, expected_status, repeat):
+    call()  # warm up imports, the role matrix and the connection
+    timings, sql_timings, query_counts = [], [], []
+    for _ in range(repeat):
+        _cold()
+        sql_timer = SQLTimer()
+        with connection.execute_wrapper(sql_timer), CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = call()
+            elapsed = time.perf_counter() - started
+        if response.status_code != expected_status:
+            raise AssertionError(f'expected HTTP {expected_status}, got {response.status_code}: {response.content[:200]!r}')
+        timings.append(elapsed * 1000)
+        sql_timings.append(sql_timer.seconds * 1000)
+        query_counts.append(len(queries))
+
+    # tracemalloc slows everything down, so memory gets a pass of its own
+    _cold()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    reset_queries()
+
+    return {
+        'time_ms': round(statistics.median(timings), 2),
+        'sql_ms': round(statistics.median(sql_timings), 2),
+        'queries': max(query_counts),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+@contextmanager
+def dataset(size, log=print):
+    # a throwaway test database filled with the generated dataset; yields the Fixtures
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        started = time.perf_counter()
+        generate(**SIZES[size], log=lambda line: None)
+        log(f'[{size}] dataset generated in {time.perf_counter() - started:.1f}s')
+        yield Fixtures()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def run_size(size, repeat=5, only=None, log=print):
+    with dataset(size, log) as fx:
+        results = {}
+        for name, (call, expected_status) in scenarios(fx).items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            cache.clear()
+            results[name] = measure(call, expected_status, repeat)
+        return results
+
+
+def run(sizes, repeat=5, only=None, log=print):
+    setup_test_environment()
+    try:
+        # the write scenarios repeat faster than the rate limits allow
+        with override_settings(THROTTLE_ENABLED=False):
+            return {size: run_size(size, repeat, only, log) for size in sizes}
+    finally:
+        teardown_test_environment()
+
+
+def load_baselines():
+    if not BASELINES_PATH.exists():
+        return {}
+    return json.loads(BASELINES_PATH.read_text())
+
+
+def save_baselines(vendor, results):
+    baselines = load_baselines()
+    for size, endpoints in results.items():
+        baselines.setdefault(vendor, {}).setdefault(size, {}).update(endpoints)
+    BASELINES_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+
+
+def compare(vendor, results, scale=1.0):
+    # returns (report rows, regressions); scale loosens the timing limits on slower machines
+    baselines = load_baselines().get(vendor, {})
+    rows, regressions = [], []
+    for size, endpoints in results.items():
+        for name, metrics in endpoints.items():
+            baseline = baselines.get(size, {}).get(name)
+            verdicts = []
+            for metric, value in metrics.items():
+                if baseline is None or metric not in baseline:
+                    verdicts.append(f'{metric}={value} (new)')
+                    continue
+                factor = scale if metric != 'queries' else 1.0
+                limit = baseline[metric] * (1 + TOLERANCE[metric]) * factor + SLACK[metric]
+                verdicts.append(f'{metric}={value} (base {baseline[metric]})')
+                if value > limit:
+                    regressions.append(f'{size} {name}: {metric} {value} > {limit:.1f} (baseline {baseline[metric]})')
+            rows.append(f'{size:<7} {name:<26} ' + '  '.join(verdicts))
+    return rows, regressions
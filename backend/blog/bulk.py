@@ -0,0 +1,171 @@
+from collections import Counter
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework.exceptions import ValidationError
+from taggit.models import Tag, TaggedItem
+
+from blog import cache, counters, rendering, search
+from blog.models import Article
+from blog.serializers import ArticleImportSerializer
+
+# Batch article import: the whole batch is validated up front (a handful of
+# queries, not a few per item), then written in one transaction with
+# bulk_create/bulk_update and bulk tag upserts. Bulk writes skip the model
+# signals and save(), so the rendered content, search index, tag counts and
+# response cache are refreshed here explicitly.
+
+MAX_BATCH_SIZE = 5000
+WRITE_BATCH_SIZE = 1000
+
+
+class ImportRejected(Exception):
+    def __init__(self, results):
+        super().__init__('The batch was rejected.')
+        self.results = results
+
+
+def _validate(items):
+    if not isinstance(items, list) or not items:
+        raise ImportRejected([{'index': None, 'status': 'error', 'errors': ['Expected a non-empty list of articles.']}])
+    if len(items) > MAX_BATCH_SIZE:
+        raise ImportRejected([{'index': None, 'status': 'error',
+                               'errors': [f'At most {MAX_BATCH_SIZE} articles per batch.']}])
+
+    child = ArticleImportSerializer()
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, child.run_validation(item)))
+            errors.append({})
+        except ValidationError as exc:
+            errors.append(exc.detail if isinstance(exc.detail, dict) else {'non_field_errors': exc.detail})
+
+    seen_titles = {}
+    for index, item in valid:
+        first = seen_titles.setdefault(item['title'], index)
+        if first != index:
+            errors[index].setdefault('title', []).append(f'Duplicate of item {first} in this batch.')
+
+    update_ids = {item['id'] for _, item in valid if 'id' in item}
+    existing_ids = set(Article.objects.filter(pk__in=update_ids).values_list('id', flat=True))
+    taken = dict(Article.objects.filter(title__in=list(seen_titles)).values_list('title', 'id'))
+    for index, item in valid:
+        if 'id' in item and item['id'] not in existing_ids:
+            errors[index].setdefault('id', []).append('Article not found.')
+        owner = taken.get(item['title'])
+        if owner is not None and owner != item.get('id'):
+            errors[index].setdefault('title', []).append('article with this title already exists.')
+
+    if any(errors):
+        raise ImportRejected([
+            {'index': index, 'status': 'error', 'errors': item_errors} if item_errors
+            else {'index': index, 'status': 'valid'}
+            for index, item_errors in enumerate(errors)
+        ])
+    return [item for _, item in valid]
+
+
+def _tag_names(names):
+    # de-duplicated (case-insensitively, like TAGGIT_CASE_INSENSITIVE), order kept, blanks dropped
+    unique = {}
+    for name in names:
+        name = name.strip()
+        if name:
+            unique.setdefault(name.lower(), name)
+    return list(unique.values())
+
+
+def _existing_tags(keys):
+    return {tag.key: tag for tag in Tag.objects.annotate(key=Lower('name')).filter(key__in=keys)}
+
+
+def upsert_tags(names):
+    # returns {lowercased name: Tag}, reusing existing tags whatever their case
+    names = {name.lower(): name for name in names}
+    if not names:
+        return {}
+    tags = _existing_tags(list(names))
+    missing = [name for key, name in names.items() if key not in tags]
+    if missing:
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=slugify(name)) for name in missing], ignore_conflicts=True,
+            batch_size=WRITE_BATCH_SIZE)
+        tags.update(_existing_tags([name.lower() for name in missing]))
+    for key, name in names.items():
+        if key not in tags:
+            # its slug clashed with another tag; let taggit pick a unique one
+            tags[key] = Tag.objects.create(name=name)
+    return tags
+
+
+def _write(items, author):
+    now = timezone.now()
+    statuses = ['updated' if 'id' in item else 'created' for item in items]
+    updates = [item for item in items if 'id' in item]
+    creates = [item for item in items if 'id' not in item]
+
+    articles = Article.objects.in_bulk([item['id'] for item in updates])
+    for item in updates:
+        article = articles[item['id']]
+        article.title, article.content, article.updated_at = item['title'], item['content'], now
+        article.render()
+    Article.objects.bulk_update(
+        [articles[item['id']] for item in updates], ['title', 'content', 'updated_at', *rendering.FIELDS],
+        batch_size=WRITE_BATCH_SIZE)
+
+    new_articles = [Article(author=author, title=item['title'], content=item['content']) for item in creates]
+    for article in new_articles:
+        article.render()
+    created = Article.objects.bulk_create(new_articles, batch_size=WRITE_BATCH_SIZE)
+    for item, article in zip(creates, created):
+        item['id'] = article.id
+
+    tagged = [item for item in items if 'tags' in item]
+    tags = upsert_tags(name for item in tagged for name in _tag_names(item['tags']))
+    content_type = ContentType.objects.get_for_model(Article)
+
+    current = {}
+    for pk, article_id, tag_id in TaggedItem.objects.filter(
+            content_type=content_type, object_id__in=[item['id'] for item in updates if 'tags' in item],
+    ).values_list('id', 'object_id', 'tag_id'):
+        current.setdefault(article_id, {})[tag_id] = pk
+
+    deltas, stale, fresh = Counter(), [], []
+    for item in tagged:
+        wanted = {tags[name.lower()].id for name in _tag_names(item['tags'])}
+        have = current.get(item['id'], {})
+        for tag_id, pk in have.items():
+            if tag_id not in wanted:
+                stale.append(pk)
+                deltas[tag_id] -= 1
+        for tag_id in wanted - have.keys():
+            fresh.append(TaggedItem(content_type=content_type, object_id=item['id'], tag_id=tag_id))
+            deltas[tag_id] += 1
+    TaggedItem.objects.filter(pk__in=stale).delete()
+    TaggedItem.objects.bulk_create(fresh, batch_size=WRITE_BATCH_SIZE)
+    counters.adjust_tags(deltas, when=now)
+
+    search.refresh_index([item['id'] for item in items])
+    return [
+        {'index': index, 'status': status, 'id': item['id']}
+        for index, (item, status) in enumerate(zip(items, statuses))
+    ], [item['id'] for item in updates]
+
+
+def import_articles(items, author):
+    # returns per-item results; raises ImportRejected (nothing written) if any item fails
+    cleaned = _validate(items)
+    try:
+        with transaction.atomic():
+            results, updated_ids = _write(cleaned, author)
+    except IntegrityError:
+        # a concurrent write took one of the titles after validation
+        raise ImportRejected([{'index': None, 'status': 'error',
+                               'errors': ['A title in this batch was taken concurrently, retry the batch.']}])
+
+    cache.bump('articles', 'tags', *[f'article:{pk}' for pk in updated_ids])
+    return results
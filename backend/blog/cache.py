@@ -0,0 +1,153 @@
+import hashlib
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from blog import routers
+
+# Cached responses are keyed by the current version of every scope they depend
+# on ('articles', 'article:<id>', 'comments:<article id>'). Signals bump those
+# versions on writes, so stale entries are simply never read again and expire
+# on their own.
+
+
+def response_cache():
+    return caches[settings.BLOG_RESPONSE_CACHE]
+
+
+def _version_key(scope):
+    return f'blog:version:{scope}'
+
+
+def bump(*scopes):
+    if scopes:
+        now = time.time_ns()
+        response_cache().set_many({_version_key(scope): now for scope in scopes}, timeout=None)
+
+
+def current_versions(scopes):
+    cache = response_cache()
+    keys = {_version_key(scope): scope for scope in scopes}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def acurrent_versions(scopes):
+    cache = response_cache()
+    keys = {_version_key(scope): scope for scope in scopes}
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def _response_key(request, query_params, renderer_format, versions):
+    # request.GET and DRF's request.query_params give the same key, so the
+    # sync and async views share entries. The scheme and host are part of it
+    # because responses embed absolute URLs (profile pictures, page links).
+    url = request.build_absolute_uri(request.path)
+    query = sorted(query_params.lists())
+    raw = repr((url, query, renderer_format, versions))
+    return 'blog:response:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in etags]
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def _with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def cache_response(*scopes):
+    # scopes are formatted with the view kwargs, e.g. 'article:{pk}'
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            # the browsable API embeds per-user forms and CSRF tokens, so only
+            # the data renderers (the same for every viewer) are cached
+            if request.method not in ('GET', 'HEAD') or request.accepted_renderer.media_type == 'text/html':
+                return func(view, request, *args, **kwargs)
+
+            versions = current_versions([scope.format(**kwargs) for scope in scopes])
+            key = _response_key(request, request.query_params, request.accepted_renderer.format, versions)
+            last_modified = math.ceil(max(versions) / 1e9)
+
+            entry = response_cache().get(key)
+            if entry is None:
+                request._response_cache_key = (key, last_modified)
+                routers.use_primary_after(max(versions))
+                return func(view, request, *args, **kwargs)
+
+            if _not_modified(request, entry['etag'], last_modified):
+                return _with_validators(HttpResponseNotModified(), entry['etag'], last_modified)
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            return _with_validators(response, entry['etag'], last_modified)
+        return wrapper
+    return decorator
+
+
+class CachedResponseMixin:
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        pending = getattr(request, '_response_cache_key', None)
+        if not pending or not isinstance(response, Response) or response.status_code != 200:
+            return response
+
+        key, last_modified = pending
+        response.render()
+        etag = quote_etag(hashlib.sha1(response.content).hexdigest())
+        response_cache().set(key, {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': etag,
+        })
+
+        if _not_modified(request, etag, last_modified):
+            return _with_validators(HttpResponseNotModified(), etag, last_modified)
+        return _with_validators(response, etag, last_modified)
+
+
+async def acached_json(request, scopes, build):
+    # cache_response + CachedResponseMixin for the async JSON views in
+    # blog.async_views; build() is awaited for the data on a miss
+    versions = await acurrent_versions(scopes)
+    key = _response_key(request, request.GET, 'json', versions)
+    last_modified = math.ceil(max(versions) / 1e9)
+
+    entry = await response_cache().aget(key)
+    if entry is None:
+        routers.use_primary_after(max(versions))
+        entry = {
+            'content': JSONRenderer().render(await build()),
+            'content_type': 'application/json',
+        }
+        entry['etag'] = quote_etag(hashlib.sha1(entry['content']).hexdigest())
+        await response_cache().aset(key, entry)
+
+    if _not_modified(request, entry['etag'], last_modified):
+        return _with_validators(HttpResponseNotModified(), entry['etag'], last_modified)
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    return _with_validators(response, entry['etag'], last_modified)
@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from blog import concurrency_server
+from blog.benchmark import SIZES
+from blog.cache import response_cache
+from blog.datagen import generate
+from blog.models import Article
+
+# Concurrency benchmark for the read endpoints: one throwaway dataset, then a
+# uvicorn server (a separate process, `workers` worker processes) is loaded by
+# `concurrency` keep-alive HTTP clients at once, first with the DRF views
+# (ASYNC_READS off) and then with blog.async_views. Going through a real
+# server measures what the deployment sees: socket and HTTP handling, the
+# server's workers and their database connections, not just the view code. A
+# throwaway query parameter makes every request a response cache miss unless
+# use_cache is set.
+
+MODES = ('sync', 'async')
+SERVER_START_TIMEOUT = 30
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(process, port):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'uvicorn exited with status {process.returncode} before serving.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'uvicorn did not start listening within {SERVER_START_TIMEOUT}s.')
+
+
+def start_server(database, mode, workers=1):
+    # (process, port) of a uvicorn serving the ASGI app on the benchmark database
+    port = _free_port()
+    env = {
+        **os.environ,
+        concurrency_server.DATABASE_ENV: str(database),
+        concurrency_server.ASYNC_READS_ENV: str(mode == 'async'),
+        'PYTHONPATH': os.pathsep.join(filter(None, [str(settings.BASE_DIR), os.environ.get('PYTHONPATH')])),
+    }
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'blog.concurrency_server:application', '--factory',
+         '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+         '--log-level', 'warning', '--no-access-log'],
+        cwd=settings.BASE_DIR, env=env)
+    try:
+        _wait_for_server(process, port)
+    except BaseException:
+        stop_server(process)
+        raise
+    return process, port
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def http_get(reader, writer, url):
+    # one GET on a keep-alive connection: (status, whether it stays open)
+    writer.write(f'GET {url} HTTP/1.1\r\nHost: localhost\r\nAccept: application/json\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while size := int((await reader.readline()).split(b';')[0], 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+def scenarios(seed=42):
+    # name -> endless iterator of URLs
+    rng = random.Random(seed)
+    ids = list(Article.objects.values_list('id', flat=True))
+    pages = max(1, len(ids) // 3)
+    hot = list(Article.objects.order_by('-comment_count', 'id').values_list('id', flat=True)[:20])
+    return {
+        'articles.list': (f'/api/articles/?page={rng.randint(1, min(pages, 50))}' for _ in itertools.count()),
+        'articles.retrieve': (f'/api/articles/{rng.choice(ids)}/' for _ in itertools.count()),
+        'articles.comments': (f'/api/articles/{rng.choice(hot)}/comments/' for _ in itertools.count()),
+    }
+
+
+async def load(port, urls, requests, concurrency, use_cache=False):
+    latencies, errors = [], 0
+    counter = itertools.count()
+
+    async def client():
+        nonlocal errors
+        reader = writer = None
+        try:
+            while next(counter) < requests:
+                url = next(urls)
+                if not use_cache:
+                    url += ('&' if '?' in url else '?') + f'nocache={time.perf_counter_ns()}'
+                started = time.perf_counter()
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                try:
+                    status, keep_alive = await http_get(reader, writer, url)
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                    status, keep_alive = None, False
+                latencies.append((time.perf_counter() - started) * 1000)
+                if status != 200:
+                    errors += 1
+                if not keep_alive:
+                    writer.close()
+                    reader = writer = None
+        finally:
+            if writer is not None:
+                writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(quantiles[49], 1),
+        'p95_ms': round(quantiles[94], 1),
+        'p99_ms': round(quantiles[98], 1),
+        'max_ms': round(max(latencies), 1),
+        'errors': errors,
+    }
+
+
+def run(size='small', requests=1000, concurrency=100, only=None, use_cache=False, workers=1, log=print):
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    scratch = None
+    if connection.vendor == 'sqlite':
+        # the server processes need a file, not the test runner's in-memory database
+        scratch = tempfile.TemporaryDirectory()
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}),
+                                            'NAME': os.path.join(scratch.name, 'benchmark.sqlite3')}
+    database = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        started = time.perf_counter()
+        generate(**SIZES[size], log=lambda line: None)
+        log(f'[{size}] dataset generated in {time.perf_counter() - started:.1f}s')
+
+        results = {}
+        for mode in MODES:
+            process, port = start_server(database, mode, workers)
+            try:
+                for name, urls in scenarios().items():
+                    if only and not any(name.startswith(prefix) for prefix in only):
+                        continue
+                    response_cache().clear()
+                    asyncio.run(load(port, urls, min(requests, concurrency), concurrency, use_cache))  # warm up
+                    results.setdefault(name, {})[mode] = asyncio.run(
+                        load(port, urls, requests, concurrency, use_cache))
+                    log(f'[{size}] {name} {mode}: {results[name][mode]}')
+            finally:
+                stop_server(process)
+        return results
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if scratch is not None:
+            scratch.cleanup()
+
+
+def report(results):
+    rows = [f'{"endpoint":<20} {"mode":<6} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8} {"errors":>6}']
+    for name, modes in results.items():
+        for mode, metrics in modes.items():
+            rows.append(f'{name:<20} {mode:<6} {metrics["rps"]:>8} {metrics["p50_ms"]:>8} {metrics["p95_ms"]:>8} '
+                        f'{metrics["p99_ms"]:>8} {metrics["max_ms"]:>8} {metrics["errors"]:>6}')
+        if set(MODES) <= set(modes):
+            sync, async_ = modes['sync'], modes['async']
+            rows.append(f'{"":<20} async/sync rps x{async_["rps"] / sync["rps"]:.2f}, '
+                        f'p99 x{async_["p99_ms"] / sync["p99_ms"]:.2f}')
+    return rows
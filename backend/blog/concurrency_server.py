@@ -0,0 +1,23 @@
+import os
+
+# uvicorn --factory entry point for blog.concurrency's server processes:
+# djangoFinalProject_blog.asgi pointed at the benchmark's throwaway database,
+# with ASYNC_READS set per run. Nothing here may touch the ORM before the
+# settings are patched, so Django is only imported inside the factory.
+
+DATABASE_ENV = 'BLOG_BENCHMARK_DATABASE'
+ASYNC_READS_ENV = 'BLOG_BENCHMARK_ASYNC_READS'
+
+
+def application():
+    from django.conf import settings
+    from django.core.asgi import get_asgi_application
+
+    settings.DATABASES['default']['NAME'] = os.environ[DATABASE_ENV]
+    # as asgi.py: persistent connections don't suit async workers
+    settings.DATABASES['default']['CONN_MAX_AGE'] = 0
+    settings.DATABASE_REPLICAS = []
+    settings.ASYNC_READS = os.environ[ASYNC_READS_ENV] == 'True'
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['localhost', '127.0.0.1']
+    return get_asgi_application()
@@ -0,0 +1,142 @@
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from taggit.models import Tag
+
+from blog.models import Article, Comment, TagStat
+
+# Article.comment_count / reply_count / last_comment_at are denormalized from
+# the comment table, and TagStat from the article tags. The signals in
+# blog.signals apply F() updates as comments and tags come and go; bulk
+# writes bypass them, so anything that bulk_creates comments or tagged items
+# calls recount() / recount_tags() afterwards (or run the recount_comments
+# and recount_tags commands).
+
+
+def _latest_comment_at():
+    return Subquery(
+        Comment.objects.filter(article_id=OuterRef('pk')).order_by('-created_at').values('created_at')[:1])
+
+
+def comment_added(comment):
+    created_at = Value(comment.created_at)
+    Article.objects.filter(pk=comment.article_id).update(
+        comment_count=F('comment_count') + 1,
+        reply_count=F('reply_count') + (1 if comment.reply_to_id else 0),
+        last_comment_at=Case(
+            When(last_comment_at__gte=created_at, then=F('last_comment_at')),
+            default=created_at,
+        ),
+    )
+
+
+def comment_removed(comment):
+    # runs after the row is gone, so the subquery only sees the survivors
+    Article.objects.filter(pk=comment.article_id).update(
+        comment_count=Greatest(F('comment_count') - 1, 0),
+        reply_count=Greatest(F('reply_count') - (1 if comment.reply_to_id else 0), 0),
+        last_comment_at=Case(
+            When(last_comment_at__gt=Value(comment.created_at), then=F('last_comment_at')),
+            default=_latest_comment_at(),
+        ),
+    )
+
+
+def reply_moved(comment, was_reply):
+    # a thread root became a reply or the other way around
+    is_reply = bool(comment.reply_to_id)
+    if is_reply != was_reply:
+        Article.objects.filter(pk=comment.article_id).update(
+            reply_count=Greatest(F('reply_count') + (1 if is_reply else -1), 0))
+
+
+def recount(article_ids=None):
+    # one UPDATE for every article (or the given ones), straight from the comment table
+    def aggregate(expression, **filters):
+        return Subquery(
+            Comment.objects.filter(article_id=OuterRef('pk'), **filters)
+            .order_by().values('article_id').annotate(value=expression).values('value'))
+
+    articles = Article.objects.all()
+    if article_ids is not None:
+        articles = articles.filter(pk__in=list(article_ids))
+    return articles.update(
+        comment_count=Coalesce(aggregate(Count('id')), 0, output_field=IntegerField()),
+        reply_count=Coalesce(aggregate(Count('id'), reply_to__isnull=False), 0, output_field=IntegerField()),
+        last_comment_at=aggregate(Max('created_at')),
+    )
+
+
+def find_drift(article_ids=None):
+    # ids of articles whose stored counters disagree with the comment table
+    articles = Article.objects.all()
+    if article_ids is not None:
+        articles = articles.filter(pk__in=list(article_ids))
+    return list(
+        articles.annotate(
+            actual_comments=Count('comments'),
+            actual_replies=Count('comments', filter=Q(comments__reply_to__isnull=False)),
+            actual_last=Max('comments__created_at'),
+        ).exclude(
+            comment_count=F('actual_comments'),
+            reply_count=F('actual_replies'),
+            last_comment_at=F('actual_last'),
+        ).exclude(
+            comment_count=0, reply_count=0, last_comment_at__isnull=True, actual_comments=0,
+        ).values_list('pk', flat=True)
+    )
+
+
+def adjust_tags(deltas, when=None):
+    # deltas maps tag id -> change in article count; one UPDATE per distinct delta
+    deltas = {tag_id: delta for tag_id, delta in deltas.items() if delta}
+    added = [tag_id for tag_id, delta in deltas.items() if delta > 0]
+    if added:
+        missing = set(added) - set(TagStat.objects.filter(tag_id__in=added).values_list('tag_id', flat=True))
+        if missing:
+            TagStat.objects.bulk_create([
+                TagStat(tag_id=tag.id, name=tag.name, key=tag.name.lower())
+                for tag in Tag.objects.filter(pk__in=missing)
+            ], ignore_conflicts=True)
+
+    by_delta = {}
+    for tag_id, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(tag_id)
+    for delta, tag_ids in by_delta.items():
+        changes = {'article_count': Greatest(F('article_count') + delta, 0)}
+        if delta > 0:
+            changes['last_used_at'] = when or timezone.now()
+        TagStat.objects.filter(tag_id__in=tag_ids).update(**changes)
+
+
+def tags_added(tag_ids, when=None):
+    adjust_tags(dict.fromkeys(tag_ids, 1), when)
+
+
+def tags_removed(tag_ids):
+    adjust_tags(dict.fromkeys(tag_ids, -1))
+
+
+def tag_renamed(tag):
+    TagStat.objects.filter(tag_id=tag.pk).update(name=tag.name, key=tag.name.lower())
+
+
+def recount_tags():
+    # rebuild the whole table with one GROUP BY over the article tags
+    rows = (
+        Article.objects.filter(tags__isnull=False)
+        .values('tags__id', 'tags__name')
+        .annotate(article_count=Count('id'), last_used_at=Max('created_at'))
+        .order_by()
+    )
+    # keep the tracked last-use times, the article dates are only a lower bound
+    last_used = dict(TagStat.objects.values_list('tag_id', 'last_used_at'))
+    stats = [
+        TagStat(tag_id=row['tags__id'], name=row['tags__name'], key=row['tags__name'].lower(),
+                article_count=row['article_count'],
+                last_used_at=max(filter(None, [row['last_used_at'], last_used.get(row['tags__id'])])))
+        for row in rows
+    ]
+    TagStat.objects.all().delete()
+    TagStat.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
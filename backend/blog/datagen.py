@@ -0,0 +1,265 @@
+import bisect
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from blog import cache, counters, search
+from blog.models import Article, Comment, Profile
+
+# Synthetic data for load and capacity testing. Every primary key is assigned
+# up front, so whole comment trees (root, depth, path) are computed in Python
+# and written with plain batched INSERTs - no per-row saves, no read-backs.
+
+WORDS = (
+    'django model query index cache thread reply article comment tag search '
+    'latency throughput request response serializer view router token user '
+    'profile migration schema table column row page cursor batch queue worker '
+    'signal transaction database postgres sqlite python api json http async '
+    'benchmark memory plan scan join filter order group count limit offset'
+).split()
+
+UserGroup = User.groups.through
+
+
+class ZipfSampler:
+    # rank r (0-based) is drawn with probability proportional to 1 / (r + 1) ** s
+    def __init__(self, rng, size, s):
+        self.rng = rng
+        self.size = size
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(size)))
+
+    def sample(self):
+        x = self.rng.random() * self.cum_weights[-1]
+        return min(bisect.bisect_left(self.cum_weights, x), self.size - 1)
+
+    def sample_distinct(self, k):
+        k = min(k, self.size)
+        picked = []
+        while len(picked) < k:
+            rank = self.sample()
+            if rank not in picked:
+                picked.append(rank)
+        return picked
+
+
+def next_id(model):
+    return (model.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    # let generated rows keep the created_at/updated_at we give them
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Generator:
+    def __init__(self, users, articles, comments, tags=500, tags_per_article=3, zipf_s=1.1,
+                 root_ratio=0.3, deep_ratio=0.5, max_depth=30, days=365, batch_size=5000,
+                 password='loadtest-pass', seed=42, log=print):
+        self.counts = {'users': users, 'articles': articles, 'comments': comments, 'tags': tags}
+        self.tags_per_article = tags_per_article
+        self.zipf_s = zipf_s
+        self.root_ratio = root_ratio
+        self.deep_ratio = deep_ratio
+        self.max_depth = min(max_depth, Comment.MAX_DEPTH)
+        self.batch_size = batch_size
+        self.password = password
+        self.rng = random.Random(seed)
+        self.log = log
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=days)
+
+    def words(self, count):
+        return ' '.join(self.rng.choices(WORDS, k=count))
+
+    def content(self):
+        paragraphs = []
+        for _ in range(self.rng.randint(2, 5)):
+            sentences = [
+                f'{self.words(self.rng.randint(6, 14)).capitalize()} `{self.rng.choice(WORDS)}`.'
+                for _ in range(self.rng.randint(3, 6))
+            ]
+            paragraphs.append(' '.join(sentences))
+        return '\n\n'.join(paragraphs)
+
+    def insert(self, model, rows):
+        for start in range(0, len(rows), self.batch_size):
+            model.objects.bulk_create(rows[start:start + self.batch_size], batch_size=self.batch_size)
+
+    def timed(self, label, func):
+        started = time.perf_counter()
+        with transaction.atomic():
+            rows = func()
+        elapsed = time.perf_counter() - started
+        self.log(f'{label}: {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)')
+        return rows
+
+    def run(self):
+        with explicit_timestamps(User, Profile, Article, Comment):
+            self.timed('users', self.generate_users)
+            self.timed('tags', self.generate_tags)
+            self.timed('articles', self.generate_articles)
+            self.timed('comments', self.generate_comments)
+        self.finish()
+
+    def generate_users(self):
+        count = self.counts['users']
+        first_id = next_id(User)
+        password = make_password(self.password)
+        members, _ = Group.objects.get_or_create(name='Members')
+
+        users, profiles, memberships = [], [], []
+        for user_id in range(first_id, first_id + count):
+            joined = self.start + (self.now - self.start) * self.rng.random() / 2
+            users.append(User(
+                id=user_id, username=f'load_user{user_id}', email=f'load_user{user_id}@example.com',
+                first_name=self.rng.choice(WORDS).title(), last_name=self.rng.choice(WORDS).title(),
+                password=password, date_joined=joined,
+            ))
+            profiles.append(Profile(
+                user_id=user_id, bio=self.words(self.rng.randint(5, 20)), created_at=joined, updated_at=joined))
+            memberships.append(UserGroup(user_id=user_id, group_id=members.id))
+
+        self.insert(User, users)
+        self.insert(Profile, profiles)
+        self.insert(UserGroup, memberships)
+        self.user_ids = list(range(first_id, first_id + count))
+        return count * 3
+
+    def generate_tags(self):
+        count = self.counts['tags']
+        first_id = next_id(Tag)
+        tags = [Tag(id=tag_id, name=f'load-topic-{tag_id}', slug=f'load-topic-{tag_id}')
+                for tag_id in range(first_id, first_id + count)]
+        self.insert(Tag, tags)
+        self.tag_ids = [tag.id for tag in tags]
+        return count
+
+    def generate_articles(self):
+        count = self.counts['articles']
+        first_id = next_id(Article)
+        first_tagged_id = next_id(TaggedItem)
+        content_type = ContentType.objects.get_for_model(Article)
+        # a few prolific authors and a long tail, the same shape as the tags
+        authors = ZipfSampler(self.rng, len(self.user_ids), self.zipf_s)
+        tags = ZipfSampler(self.rng, len(self.tag_ids), self.zipf_s)
+
+        self.article_times = {}
+        tagged_id = first_tagged_id
+        articles, tagged = [], []
+        span = self.now - self.start
+        for n, article_id in enumerate(range(first_id, first_id + count)):
+            created = self.start + span * (n / max(count, 1))
+            self.article_times[article_id] = created
+            article = Article(
+                id=article_id, author_id=self.user_ids[authors.sample()],
+                title=f'{self.words(4).title()} #{article_id}', content=self.content(),
+                created_at=created, updated_at=created,
+            )
+            article.render()
+            articles.append(article)
+            for rank in tags.sample_distinct(self.rng.randint(1, self.tags_per_article)):
+                tagged.append(TaggedItem(
+                    id=tagged_id, content_type_id=content_type.id, object_id=article_id, tag_id=self.tag_ids[rank]))
+                tagged_id += 1
+
+            if len(articles) >= self.batch_size:
+                self.insert(Article, articles)
+                self.insert(TaggedItem, tagged)
+                articles, tagged = [], []
+
+        self.insert(Article, articles)
+        self.insert(TaggedItem, tagged)
+        return count + (tagged_id - first_tagged_id)
+
+    def generate_comments(self):
+        total = self.counts['comments']
+        article_ids = list(self.article_times)
+        if not article_ids or not total:
+            return 0
+
+        # hot articles attract most of the discussion
+        hotness = ZipfSampler(self.rng, len(article_ids), self.zipf_s)
+        per_article = {}
+        for _ in range(total):
+            article_id = article_ids[hotness.sample()]
+            per_article[article_id] = per_article.get(article_id, 0) + 1
+
+        comment_id = next_id(Comment)
+        batch = []
+        for article_id, count in per_article.items():
+            created = self.article_times[article_id]
+            times = sorted(created + (self.now - created) * self.rng.random() for _ in range(count))
+            thread = []  # (id, root_id, depth, path) of this article's comments so far
+            for when in times:
+                parent = None
+                if thread and self.rng.random() > self.root_ratio:
+                    # deep: answer the latest comment; wide: answer any earlier one
+                    parent = thread[-1] if self.rng.random() < self.deep_ratio else self.rng.choice(thread)
+                    if parent[2] >= self.max_depth:
+                        parent = self.rng.choice(thread)
+                        if parent[2] >= self.max_depth:
+                            parent = None
+
+                segment = Comment.path_segment(comment_id)
+                if parent is None:
+                    node = (comment_id, comment_id, 0, segment)
+                else:
+                    node = (comment_id, parent[1], parent[2] + 1, parent[3] + segment)
+                thread.append(node)
+                batch.append(Comment(
+                    id=comment_id, article_id=article_id, author_id=self.rng.choice(self.user_ids),
+                    content=self.words(self.rng.randint(5, 40)), created_at=when, updated_at=when,
+                    reply_to_id=parent[0] if parent else None, root_id=node[1], depth=node[2], path=node[3],
+                ))
+                comment_id += 1
+
+            if len(batch) >= self.batch_size:
+                self.insert(Comment, batch)
+                batch = []
+
+        self.insert(Comment, batch)
+        return total
+
+    def finish(self):
+        # explicit ids leave Postgres sequences behind; SQLite needs nothing
+        models = [User, Profile, UserGroup, Tag, TaggedItem, Article, Comment]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+        # bulk inserts skip the signals that maintain these
+        started = time.perf_counter()
+        counters.recount()
+        counters.recount_tags()
+        self.log(f'comment and tag counters: recounted in {time.perf_counter() - started:.1f}s')
+        started = time.perf_counter()
+        search.refresh_index()
+        cache.bump('articles', 'tags')
+        self.log(f'search index: rebuilt in {time.perf_counter() - started:.1f}s')
+
+
+def generate(**options):
+    Generator(**options).run()
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from blog import jobs
+from blog.models import Article, CommentEvent
+from blog.serializers import CommentSerializer
+
+# Server-sent events for comment changes. Every comment save/delete appends a
+# CommentEvent row in the same transaction (blog.signals), and after commit
+# the in-process broker wakes the streams subscribed to that article, which
+# then read the new rows. The table makes Last-Event-ID resume work across
+# reconnects and processes: streams also re-check it every
+# COMMENT_STREAM_POLL_SECONDS, which is how writes made by another process
+# reach them. Rows older than COMMENT_EVENT_RETENTION_HOURS are pruned; a
+# client resuming from before that gets a 'reset' event and should refetch.
+#
+# The event id is the resume cursor, so an article's events must commit in id
+# order: each write locks the article row before taking its id, and holds the
+# lock until it commits. (SQLite has one writer at a time anyway.)
+
+RETRY_MS = 3000
+BATCH_SIZE = 100
+PRUNE_INTERVAL = 3600
+
+_last_prune = None
+
+
+class Broker:
+    # article id -> waiters of the streams following it
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+
+    def subscribe(self, article_id, waiter):
+        with self._lock:
+            self._waiters.setdefault(article_id, set()).add(waiter)
+
+    def unsubscribe(self, article_id, waiter):
+        with self._lock:
+            waiters = self._waiters.get(article_id, set())
+            waiters.discard(waiter)
+            if not waiters:
+                self._waiters.pop(article_id, None)
+
+    def publish(self, article_id):
+        with self._lock:
+            waiters = list(self._waiters.get(article_id, ()))
+        for waiter in waiters:
+            waiter.notify()
+
+
+broker = Broker()
+
+
+class AsyncWaiter:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            pass  # the stream's loop has closed
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.event.clear()
+        return True
+
+
+class ThreadWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def notify(self):
+        self.event.set()
+
+    def wait(self, timeout):
+        notified = self.event.wait(timeout)
+        self.event.clear()
+        return notified
+
+
+def _record(article_id, comment_id, kind, data):
+    global _last_prune
+    locking = connection.features.has_select_for_update
+    with transaction.atomic(savepoint=False) if locking else nullcontext():
+        if locking:
+            list(Article.objects.select_for_update().filter(pk=article_id).values_list('pk'))
+        CommentEvent.objects.create(article_id=article_id, comment_id=comment_id, kind=kind, data=data)
+    transaction.on_commit(lambda: broker.publish(article_id))
+    if _last_prune is None or time.monotonic() - _last_prune > PRUNE_INTERVAL:
+        _last_prune = time.monotonic()
+        jobs.enqueue('prune_comment_events', dedupe_key='prune_comment_events')
+
+
+def comment_saved(comment, created):
+    data = dict(CommentSerializer(comment).data)
+    # a new thread root only gets its root id after this signal
+    data['root'] = data['root'] or comment.pk
+    _record(comment.article_id, comment.pk, CommentEvent.CREATED if created else CommentEvent.UPDATED, data)
+
+
+def comment_deleted(comment):
+    # recorded after the delete commits, and only if the article is still
+    # there: deleting an article (or its author) takes the comments and the
+    # article's event log along in the same cascade
+    article_id, comment_id = comment.article_id, comment.pk
+    data = {'id': comment_id, 'article': article_id, 'reply_to': comment.reply_to_id}
+
+    def record():
+        if Article.objects.filter(pk=article_id).exists():
+            _record(article_id, comment_id, CommentEvent.DELETED, data)
+    transaction.on_commit(record)
+
+
+@jobs.task('prune_comment_events')
+def prune():
+    cutoff = timezone.now() - timedelta(hours=settings.COMMENT_EVENT_RETENTION_HOURS)
+    return CommentEvent.objects.filter(created_at__lt=cutoff).delete()[0]
+
+
+def parse_event_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _encode(event):
+    return f'id: {event.id}\nevent: {event.kind}\ndata: {json.dumps(event.data, separators=(",", ":"))}\n\n'
+
+
+def _encode_reset(last_id):
+    return f'id: {last_id}\nevent: reset\ndata: {{}}\n\n'
+
+
+def _encode_start(last_id):
+    # the id alone sets the client's Last-Event-ID, so a reconnect resumes
+    # here even if no event came in the meantime
+    return f'retry: {RETRY_MS}\nid: {last_id}\n\n'
+
+
+def _pending(article_id, last_id):
+    return list(CommentEvent.objects.filter(article_id=article_id, id__gt=last_id).order_by('id')[:BATCH_SIZE])
+
+
+def _latest(article_id):
+    return CommentEvent.objects.filter(article_id=article_id).aggregate(latest=Max('id'))['latest'] or 0
+
+
+def _start(article_id, last_id):
+    # (id to stream from, whether the client must refetch): a fresh client
+    # starts at the latest event, a resuming one where it left off unless
+    # events after that may have been pruned
+    if last_id is not None:
+        oldest = CommentEvent.objects.aggregate(oldest=Min('id'))['oldest']
+        if last_id == 0 or (oldest is not None and last_id >= oldest - 1):
+            return last_id, False
+    return _latest(article_id), last_id is not None
+
+
+def stream(article_id, last_id=None):
+    # blocking generator for WSGI servers: it holds a worker thread (and its
+    # database connection) per client, so it ends after
+    # COMMENT_STREAM_SYNC_SECONDS and EventSource reconnects from the last id
+    deadline = time.monotonic() + settings.COMMENT_STREAM_SYNC_SECONDS
+    waiter = ThreadWaiter()
+    broker.subscribe(article_id, waiter)
+    try:
+        last_id, reset = _start(article_id, last_id)
+        yield _encode_start(last_id)
+        if reset:
+            yield _encode_reset(last_id)
+        while True:
+            events = _pending(article_id, last_id)
+            for event in events:
+                yield _encode(event)
+                last_id = event.id
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if len(events) < BATCH_SIZE and not waiter.wait(min(settings.COMMENT_STREAM_POLL_SECONDS, remaining)):
+                yield ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(article_id, waiter)
+
+
+async def astream(article_id, last_id=None):
+    # the same under ASGI: idle clients cost no thread
+    waiter = AsyncWaiter()
+    broker.subscribe(article_id, waiter)
+    try:
+        last_id, reset = await sync_to_async(_start)(article_id, last_id)
+        yield _encode_start(last_id)
+        if reset:
+            yield _encode_reset(last_id)
+        while True:
+            events = await sync_to_async(_pending)(article_id, last_id)
+            for event in events:
+                yield _encode(event)
+                last_id = event.id
+            if len(events) < BATCH_SIZE and not await waiter.wait(settings.COMMENT_STREAM_POLL_SECONDS):
+                yield ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(article_id, waiter)
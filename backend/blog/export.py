@@ -0,0 +1,125 @@
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from blog.models import Article, Comment, Deletion
+from blog.utils.comment_tree import nest_comments
+
+# NDJSON export: one line per article with its tags and nested comment tree.
+# Articles (id order) and their comments (article id, then tree path order)
+# are read as two parallel iterator(chunk_size) streams - server-side cursors
+# on Postgres - and merged, so at most one chunk of articles and a single
+# article's comments are in memory at any time, whatever the corpus size.
+#
+# Everything is read in one transaction (REPEATABLE READ on Postgres), so the
+# streams agree with each other. An incremental export (since) also covers
+# deletions, recorded as Deletion rows by blog.signals: an article that lost
+# a comment is exported again with its current tree, and a deleted article
+# becomes a {"id": ..., "deleted": true} line after the others.
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def parse_since(value):
+    # ISO date or datetime; naive values are taken in the server time zone
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid since value: {value!r} (expected an ISO date or datetime).')
+        since = datetime.combine(day, time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def article_deleted(article_id):
+    # its comments' rows are covered by the article's
+    Deletion.objects.filter(article_id=article_id, comment_id__isnull=False).delete()
+    Deletion.objects.create(article_id=article_id)
+
+
+def comment_deleted(comment):
+    Deletion.objects.create(article_id=comment.article_id, comment_id=comment.pk)
+
+
+def export_queryset(since=None):
+    articles = Article.objects.select_related('author').order_by('id')
+    if since is not None:
+        # the article itself was edited, or one of its comments was added,
+        # edited or deleted
+        changed_comments = Comment.objects.filter(article_id=OuterRef('pk'), updated_at__gte=since)
+        deleted_comments = Deletion.objects.filter(article_id=OuterRef('pk'), deleted_at__gte=since)
+        articles = articles.filter(
+            Q(updated_at__gte=since) | Q(last_comment_at__gte=since)
+            | Exists(changed_comments) | Exists(deleted_comments))
+    return articles
+
+
+def deleted_articles(since):
+    return (Deletion.objects.filter(comment_id__isnull=True, deleted_at__gte=since)
+            .order_by('article_id').values_list('article_id', 'deleted_at'))
+
+
+def comment_rows(articles):
+    return (
+        Comment.objects.filter(article__in=articles.values('id'))
+        .order_by('article_id', 'path')
+        .values('id', 'article_id', 'author__username', 'content', 'created_at', 'updated_at', 'reply_to_id')
+    )
+
+
+def _comment(row):
+    return {
+        'id': row['id'],
+        'author': row['author__username'],
+        'content': row['content'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+        'reply_to': row['reply_to_id'],
+    }
+
+
+def article_record(article, comments):
+    return {
+        'id': article.id,
+        'title': article.title,
+        'content': article.content,
+        'author': article.author.username,
+        'created_at': article.created_at,
+        'updated_at': article.updated_at,
+        'tags': sorted(tag.name for tag in article.tags.all()),
+        'comments': nest_comments(_comment(row) for row in comments),
+    }
+
+
+def export_lines(since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            # has to come before any other statement of the transaction
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
+        articles = export_queryset(since)
+        comments = comment_rows(articles).iterator(chunk_size=chunk_size * 10)
+        pending = next(comments, None)
+
+        for article in articles.prefetch_related('tags').iterator(chunk_size=chunk_size):
+            thread = []
+            while pending is not None and pending['article_id'] <= article.id:
+                if pending['article_id'] == article.id:
+                    thread.append(pending)
+                pending = next(comments, None)
+            yield encoder.encode(article_record(article, thread)) + '\n'
+
+        if since is not None:
+            for article_id, deleted_at in deleted_articles(since).iterator(chunk_size=chunk_size):
+                yield encoder.encode({'id': article_id, 'deleted': True, 'deleted_at': deleted_at}) + '\n'
@@ -0,0 +1,139 @@
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+from PIL import Image, ImageOps
+
+from blog import jobs
+from blog.models import Profile
+
+# Square WEBP avatars derived from Profile.profile_pic. File names carry a hash
+# of the source bytes, so a URL never changes content and can be cached
+# forever; a new upload simply gets new names. Profile.profile_pic_variants
+# maps size -> storage name, plus 'source' (the original they were built from).
+#
+# A replaced or cleared picture's files (original and variants) are deleted by
+# a background job once nothing uses them any more: profiles with the same
+# picture share variant files, and a re-upload of the same image gets the
+# same names back.
+
+VARIANT_SIZES = (48, 96, 256)
+# the avatar next to articles and comments: 48px CSS, 96px for 2x screens
+AVATAR_SIZE = 96
+VARIANT_DIR = 'profile_pics/variants'
+WEBP_QUALITY = 80
+
+
+def variant_name(digest, size):
+    return posixpath.join(VARIANT_DIR, f'{digest}-{size}.webp')
+
+
+def render_variant(image, size):
+    square = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    buffer = BytesIO()
+    square.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=6)
+    return buffer.getvalue()
+
+
+def build_variants(profile_id, source=None):
+    # source: the profile_pic name the job was queued for; skip if it changed since
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None or not profile.profile_pic:
+        return None
+    if source is not None and profile.profile_pic.name != source:
+        return None
+    if profile.profile_pic_variants.get('source') == profile.profile_pic.name:
+        return profile.profile_pic_variants
+
+    with profile.profile_pic.open('rb') as original:
+        data = original.read()
+    digest = hashlib.sha256(data).hexdigest()[:20]
+
+    variants = {'source': profile.profile_pic.name}
+    image = None
+    for size in VARIANT_SIZES:
+        name = variant_name(digest, size)
+        if not default_storage.exists(name):
+            if image is None:
+                image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            name = default_storage.save(name, ContentFile(render_variant(image, size)))
+        variants[str(size)] = name
+
+    # only write if the picture is still the one we rendered
+    updated = Profile.objects.filter(pk=profile_id, profile_pic=profile.profile_pic.name)
+    if updated.exists():
+        profile.profile_pic_variants = variants
+        profile.save(update_fields=['profile_pic_variants'])
+    return variants
+
+
+@jobs.task('build_profile_variants', max_attempts=3)
+def build_variants_job(profile_id):
+    # renders whatever picture the profile has by the time the job runs
+    build_variants(profile_id)
+
+
+def schedule_variants(profile):
+    # a background job; repeated uploads before it runs share one job
+    jobs.enqueue('build_profile_variants', profile.pk, dedupe_key=f'build_profile_variants:{profile.pk}')
+
+
+def files_in_use(names):
+    # the names some profile still points at, as its picture or a current variant
+    query = Q()
+    for name in names:
+        query |= Q(profile_pic=name) | Q(variants_text__contains=name)
+    in_use = set()
+    profiles = Profile.objects.annotate(variants_text=Cast('profile_pic_variants', TextField())).filter(query)
+    for picture, variants in profiles.values_list('profile_pic', 'profile_pic_variants'):
+        in_use.add(picture)
+        # variants of an earlier picture are only kept until new ones are built
+        if (variants or {}).get('source') == picture:
+            in_use.update(variants.values())
+    return in_use & set(names)
+
+
+@jobs.task('delete_files')
+def delete_files(names):
+    # checked when the job runs, after the change that dropped them committed
+    in_use = files_in_use(names)
+    for name in names:
+        if name not in in_use:
+            default_storage.delete(name)
+
+
+def discard_files(names):
+    names = sorted({name for name in names if name})
+    if names:
+        jobs.enqueue('delete_files', names)
+
+
+def build_missing_variants():
+    # for profiles saved without signals (bulk seeds, imports) or from before variants existed
+    built = 0
+    profiles = Profile.objects.exclude(profile_pic='').exclude(profile_pic__isnull=True)
+    for profile_id, source, variants in profiles.values_list('id', 'profile_pic', 'profile_pic_variants').iterator():
+        if (variants or {}).get('source') != source and build_variants(profile_id, source) is not None:
+            built += 1
+    return built
+
+
+def has_variants(profile):
+    # rendered from the current picture (not a previous upload)
+    if not profile or not profile.profile_pic:
+        return False
+    return (profile.profile_pic_variants or {}).get('source') == profile.profile_pic.name
+
+
+def variant_url(profile, size=AVATAR_SIZE):
+    # the derivative if it is ready, else the original upload
+    if not profile or not profile.profile_pic:
+        return None
+    if has_variants(profile):
+        return default_storage.url(profile.profile_pic_variants[str(size)])
+    return profile.profile_pic.url
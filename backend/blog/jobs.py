@@ -0,0 +1,222 @@
+import logging
+import os
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from blog.models import Job
+
+# Database-backed job queue for work that can happen after the response: a
+# write enqueues a Job row in its own transaction (so the job exists exactly
+# when the write commits), and workers claim due jobs with a conditional
+# UPDATE, which works the same on SQLite and PostgreSQL without a broker.
+# A claim is a lease (JOBS_LEASE_SECONDS) that the worker keeps renewing; if
+# the worker dies the lease lapses and another worker picks the job up, so
+# tasks must be safe to run twice. Failures are retried with exponential
+# backoff until the task's max_attempts.
+#
+# JOBS_MODE picks who runs them:
+#   thread - a small pool in the web process, woken after each commit (default)
+#   worker - only `manage.py run_jobs` processes
+#   eager  - inline right after the enqueueing transaction commits (tests)
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 3600
+
+_tasks = {}
+_executor = None
+
+
+class Task:
+    def __init__(self, name, func, max_attempts, retry_delay):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def backoff(self, attempts):
+        # seconds before the next try, doubling per failed attempt
+        return min(self.retry_delay * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+
+
+def task(name, max_attempts=5, retry_delay=10):
+    # registers func under name; args and kwargs must be JSON serializable
+    def decorator(func):
+        if name in _tasks:
+            raise ValueError(f'Job task {name!r} is already registered.')
+        _tasks[name] = Task(name, func, max_attempts, retry_delay)
+        return func
+    return decorator
+
+
+def enqueue(name, *args, dedupe_key=None, delay=0, **kwargs):
+    task = _tasks[name]
+    job = Job(task=name, args=list(args), kwargs=kwargs, dedupe_key=dedupe_key, max_attempts=task.max_attempts,
+              run_at=timezone.now() + timedelta(seconds=delay))
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        if dedupe_key is None:
+            raise
+        job = Job.objects.filter(dedupe_key=dedupe_key, status=Job.QUEUED).first() or job
+        if job.pk is None:
+            # the duplicate was claimed in the meantime
+            job.save()
+    transaction.on_commit(wake)
+    return job
+
+
+def _due(now):
+    # queued and due, or running on a lease that lapsed
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+
+
+def claim(worker, limit=1):
+    now = timezone.now()
+    lease = now + timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+    candidates = Job.objects.filter(_due(now)).order_by('run_at', 'id').values_list('id', flat=True)[:limit * 2]
+    claimed = []
+    for job_id in candidates:
+        # another worker may have won the row since the SELECT; the UPDATE re-checks
+        if Job.objects.filter(_due(now), pk=job_id).update(
+                status=Job.RUNNING, locked_by=worker, locked_until=lease, attempts=F('attempts') + 1):
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at', 'id'))
+
+
+def renew(worker, job_ids):
+    lease = timezone.now() + timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+    return Job.objects.filter(pk__in=job_ids, status=Job.RUNNING, locked_by=worker).update(locked_until=lease)
+
+
+def _owned(job, worker):
+    # the job row, unless its lease lapsed and someone else claimed it meanwhile
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=worker)
+
+
+def execute(job, worker):
+    task = _tasks.get(job.task)
+    try:
+        if task is None:
+            raise LookupError(f'Unknown job task {job.task!r}.')
+        if job.attempts > job.max_attempts:
+            raise RuntimeError(f'Lease lapsed on all {job.max_attempts} attempts.')
+        task.func(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception('Job %s failed (attempt %s of %s)', job, job.attempts, job.max_attempts)
+        _failed(job, worker, task, traceback.format_exc())
+        return False
+    _owned(job, worker).update(status=Job.DONE, locked_until=None, finished_at=timezone.now())
+    return True
+
+
+def _failed(job, worker, task, error):
+    if task is None or job.attempts >= job.max_attempts:
+        _owned(job, worker).update(status=Job.FAILED, last_error=error, locked_until=None, finished_at=timezone.now())
+        return
+
+    delay = task.backoff(job.attempts)
+    try:
+        with transaction.atomic():
+            _owned(job, worker).update(status=Job.QUEUED, last_error=error, locked_until=None,
+                                       run_at=timezone.now() + timedelta(seconds=delay))
+    except IntegrityError:
+        # the same dedupe key was queued again while this ran; that job retries it
+        _owned(job, worker).update(status=Job.FAILED, last_error=error + '\nRetry left to the queued duplicate.',
+                                   locked_until=None, finished_at=timezone.now())
+        return
+    if settings.JOBS_MODE == 'thread':
+        timer = threading.Timer(delay, wake)
+        timer.daemon = True
+        timer.start()
+
+
+def run_pending(worker):
+    # claim and run due jobs one at a time until none are left
+    ran = 0
+    while True:
+        jobs = claim(worker)
+        if not jobs:
+            return ran
+        execute(jobs[0], worker)
+        ran += 1
+
+
+def worker_name(suffix=''):
+    return f'{socket.gethostname()}:{os.getpid()}{suffix}'
+
+
+def _drain():
+    close_old_connections()
+    try:
+        run_pending(worker_name(f':{threading.get_ident()}'))
+    except Exception:
+        logger.exception('Running queued jobs failed')
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.JOBS_THREADS, thread_name_prefix='jobs')
+    return _executor
+
+
+def wake():
+    if settings.JOBS_MODE == 'eager':
+        run_pending(worker_name(':eager'))
+    elif settings.JOBS_MODE == 'thread':
+        _get_executor().submit(_drain)
+
+
+def purge(older_than_days):
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()[0]
+
+
+class Worker:
+    # the run_jobs process: claims up to `threads` jobs at a time and renews
+    # their leases on every poll while they run
+    def __init__(self, threads=4, poll_interval=1.0, name=None):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.name = name or worker_name()
+        self.stop = threading.Event()
+
+    def _run(self, job):
+        close_old_connections()
+        try:
+            execute(job, self.name)
+        finally:
+            close_old_connections()
+
+    def run(self, once=False):
+        # once: exit when nothing is due or running instead of polling forever
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='jobs') as pool:
+            while not self.stop.is_set():
+                running = {job_id: future for job_id, future in running.items() if not future.done()}
+                if running:
+                    renew(self.name, list(running))
+
+                free = self.threads - len(running)
+                jobs = claim(self.name, free) if free else []
+                for job in jobs:
+                    running[job.pk] = pool.submit(self._run, job)
+
+                if not jobs:
+                    if once and not running:
+                        break
+                    self.stop.wait(self.poll_interval)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from blog import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the API endpoints in-process against generated datasets and compare wall time, '
+            'SQL query count, SQL time and peak memory with the stored baselines. Runs in a throwaway '
+            'test database, so it is safe against any configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='small,medium',
+                            help=f'Comma separated dataset sizes: {", ".join(benchmark.SIZES)}.')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per endpoint (the median is kept).')
+        parser.add_argument('--only', default='',
+                            help='Comma separated endpoint prefixes to run, e.g. "articles.,users.list".')
+        parser.add_argument('--update-baselines', action='store_true',
+                            help='Store these results as the new baselines instead of comparing.')
+        parser.add_argument('--time-scale', type=float, default=1.0,
+                            help='Multiply the time and memory limits, e.g. 2 on a slower machine.')
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        unknown = set(sizes) - set(benchmark.SIZES)
+        if unknown:
+            raise CommandError(f'Unknown sizes: {", ".join(sorted(unknown))}')
+        only = [prefix.strip() for prefix in options['only'].split(',') if prefix.strip()]
+
+        vendor = connection.vendor
+        results = benchmark.run(sizes, repeat=options['repeat'], only=only, log=self.stdout.write)
+
+        if options['update_baselines']:
+            benchmark.save_baselines(vendor, results)
+            self.stdout.write(self.style.SUCCESS(f'Baselines for {vendor} written to {benchmark.BASELINES_PATH}.'))
+            return
+
+        rows, regressions = benchmark.compare(vendor, results, scale=options['time_scale'])
+        for row in rows:
+            self.stdout.write(row)
+        if regressions:
+            raise CommandError('Benchmark regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baselines.'))
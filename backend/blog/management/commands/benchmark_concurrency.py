@@ -0,0 +1,40 @@
+import importlib.util
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import benchmark, concurrency
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/s and tail latency of the article and comment reads under ASGI with many '
+            'concurrent clients, DRF views against the async views (ASYNC_READS). The app is served by '
+            'uvicorn in a separate process (pip install uvicorn) and loaded over HTTP keep-alive '
+            'connections. Runs in a throwaway test database, so it is safe against any configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', default='small', help=f'Dataset size: {", ".join(benchmark.SIZES)}.')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per endpoint and mode.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Clients sending requests at once.')
+        parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes.')
+        parser.add_argument('--only', default='', help='Comma separated endpoint prefixes to run, e.g. "articles.list".')
+        parser.add_argument('--cache', action='store_true',
+                            help='Let repeated URLs hit the response cache instead of busting it on every request.')
+
+    def handle(self, *args, **options):
+        if options['size'] not in benchmark.SIZES:
+            raise CommandError(f'Unknown size: {options["size"]}')
+        if options['concurrency'] < 1 or options['requests'] < options['concurrency']:
+            raise CommandError('--requests must be at least --concurrency, which must be positive.')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+        if importlib.util.find_spec('uvicorn') is None:
+            raise CommandError('benchmark_concurrency serves the app with uvicorn: pip install uvicorn')
+        only = [prefix.strip() for prefix in options['only'].split(',') if prefix.strip()]
+
+        results = concurrency.run(
+            options['size'], requests=options['requests'], concurrency=options['concurrency'],
+            only=only, use_cache=options['cache'], workers=options['workers'], log=self.stdout.write)
+        for row in concurrency.report(results):
+            self.stdout.write(row)
+        if any(metrics['errors'] for modes in results.values() for metrics in modes.values()):
+            raise CommandError('Some requests did not return HTTP 200.')
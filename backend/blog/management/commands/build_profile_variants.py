@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog import images
+
+
+class Command(BaseCommand):
+    help = 'Render missing or stale avatar variants for every profile picture.'
+
+    def handle(self, *args, **options):
+        built = images.build_missing_variants()
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {built} profile(s).'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from blog import benchmark, plans
+
+
+class Command(BaseCommand):
+    help = ('Run every benchmark endpoint once against a generated dataset, EXPLAIN the queries it sends and '
+            'fail on sequential scans of large tables. Runs in a throwaway test database, so it is safe '
+            'against any configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', default='medium', choices=list(benchmark.SIZES), help='Dataset size.')
+        parser.add_argument('--only', default='',
+                            help='Comma separated endpoint prefixes to check, e.g. "articles.,comments.list".')
+        parser.add_argument('--min-rows', type=int, default=plans.MIN_ROWS,
+                            help='Ignore scans of tables with fewer rows than this.')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plans of the failing queries.')
+
+    def handle(self, *args, **options):
+        only = [prefix.strip() for prefix in options['only'].split(',') if prefix.strip()]
+
+        setup_test_environment()
+        try:
+            with benchmark.dataset(options['size'], log=self.stdout.write) as fx:
+                problems = plans.check(fx, only=only, min_rows=options['min_rows'])
+        finally:
+            teardown_test_environment()
+
+        for name, scans in problems.items():
+            for table, sql, plan in scans:
+                self.stdout.write(f'{name:<26} seq scan of {table}: {sql[:200]}')
+                if options['verbose_plans']:
+                    self.stdout.write(''.join(f'    {line}\n' for line in plan))
+        if problems:
+            raise CommandError(f'Sequential scans in {len(problems)} endpoint(s).')
+        self.stdout.write(self.style.SUCCESS('No sequential scans of large tables.'))
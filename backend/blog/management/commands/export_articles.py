@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from blog.export import DEFAULT_CHUNK_SIZE, export_lines, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Export articles with their tags and nested comments as NDJSON (one article per line).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='File to write (default: stdout).')
+        parser.add_argument('--since', help='Only articles changed or commented on since this ISO date/datetime.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        started_at = timezone.now()
+        count = 0
+        out = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        try:
+            for line in export_lines(since, chunk_size=options['chunk_size']):
+                out.write(line)
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        self.stderr.write(f'Exported {count} article(s). Next incremental: --since {started_at.isoformat()}')
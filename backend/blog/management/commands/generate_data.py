@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from blog.datagen import generate
+from blog.models import Comment
+
+
+class Command(BaseCommand):
+    help = ('Generate a large synthetic dataset (users, Zipf-tagged articles, deep and wide '
+            'comment trees) for load testing. The same --seed always produces the same data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--articles', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=500)
+        parser.add_argument('--tags-per-article', type=int, default=3,
+                            help='Upper bound of tags per article (at least one is always added).')
+        parser.add_argument('--zipf-s', type=float, default=1.1,
+                            help='Skew of tag, author and comment popularity (higher = more skewed).')
+        parser.add_argument('--root-ratio', type=float, default=0.3,
+                            help='Share of comments that start a new thread.')
+        parser.add_argument('--deep-ratio', type=float, default=0.5,
+                            help='Share of replies that answer the latest comment instead of a random one.')
+        parser.add_argument('--max-depth', type=int, default=30,
+                            help=f'Deepest reply level, at most {Comment.MAX_DEPTH}.')
+        parser.add_argument('--days', type=int, default=365, help='Spread creation times over this many days.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='loadtest-pass', help='Password shared by every generated user.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['tags']) < 1 and options['articles']:
+            self.stderr.write('Articles need at least one user and one tag.')
+            return
+        if options['max_depth'] > Comment.MAX_DEPTH:
+            self.stderr.write(f'--max-depth can be at most {Comment.MAX_DEPTH}.')
+            return
+
+        generate(
+            users=options['users'], articles=options['articles'], comments=options['comments'],
+            tags=options['tags'], tags_per_article=options['tags_per_article'], zipf_s=options['zipf_s'],
+            root_ratio=options['root_ratio'], deep_ratio=options['deep_ratio'],
+            max_depth=options['max_depth'], days=options['days'], batch_size=options['batch_size'],
+            password=options['password'], seed=options['seed'], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS('Synthetic data generated.'))
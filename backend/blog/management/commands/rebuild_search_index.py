@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all articles.'
+
+    def handle(self, *args, **options):
+        if not search.index_available():
+            self.stdout.write(self.style.WARNING(
+                'No search index on this database - run migrate first.'))
+            return
+
+        search.refresh_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
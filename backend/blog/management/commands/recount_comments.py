@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from blog import cache, counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute Article.comment_count, reply_count and last_comment_at from the comment table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('article_ids', nargs='*', type=int, help='Only these articles (default: all).')
+        parser.add_argument('--check', action='store_true', help='Only report articles whose counters drifted.')
+
+    def handle(self, *args, **options):
+        article_ids = options['article_ids'] or None
+        drifted = counters.find_drift(article_ids)
+
+        if options['check']:
+            if drifted:
+                self.stdout.write(self.style.WARNING(
+                    f'{len(drifted)} article(s) with stale counters: {", ".join(map(str, drifted[:20]))}'))
+            else:
+                self.stdout.write(self.style.SUCCESS('All comment counters are correct.'))
+            return
+
+        updated = counters.recount(article_ids)
+        cache.bump('articles', *[f'article:{pk}' for pk in drifted])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {updated} article(s); {len(drifted)} had drifted.'))
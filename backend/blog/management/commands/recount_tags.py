@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from blog import cache, counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-tag article counts behind /api/tags/ from the article tags.'
+
+    def handle(self, *args, **options):
+        rebuilt = counters.recount_tags()
+        cache.bump('tags')
+        self.stdout.write(self.style.SUCCESS(f'Recounted {rebuilt} tag(s).'))
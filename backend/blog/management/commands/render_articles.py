@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blog import cache, rendering
+from blog.models import Article
+
+
+def _rendered(batches, workers):
+    # rendering.render_batch over the batches, in order, with at most two
+    # batches per worker in flight so the table is never read ahead into memory
+    if workers <= 1:
+        yield from map(rendering.render_batch, batches)
+        return
+    # spawned rather than forked: the workers only render and must not share
+    # this process's database connection
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = deque()
+        for rows in batches:
+            pending.append(pool.submit(rendering.render_batch, rows))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class Command(BaseCommand):
+    help = ('Fill the stored HTML, excerpt and reading time of articles saved before those columns existed '
+            'or by an older renderer. Batches are rendered in parallel worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every article, not only stale ones.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Articles per batch.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Rendering processes; 0 or 1 renders in this process.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        articles = Article.objects.all()
+        if not options['all']:
+            articles = articles.filter(render_version__lt=rendering.VERSION)
+
+        # updated_at marks each row as read, so an article edited (and so
+        # rendered by its own save) while the batch was out is left alone
+        versions = {}
+
+        def batches():
+            last = 0
+            while True:
+                rows = list(articles.filter(id__gt=last).order_by('id')
+                            .values_list('id', 'content', 'updated_at')[:options['batch_size']])
+                if not rows:
+                    return
+                last = rows[-1][0]
+                versions.update((pk, updated_at) for pk, _, updated_at in rows)
+                yield [(pk, content) for pk, content, _ in rows]
+
+        rendered = skipped = 0
+        for batch in _rendered(batches(), options['workers']):
+            done = []
+            with transaction.atomic():
+                for pk, columns in batch:
+                    # leaves updated_at alone: rendering is not an edit
+                    if Article.objects.filter(pk=pk, updated_at=versions.pop(pk)).update(**columns):
+                        done.append(pk)
+            cache.bump('articles', *[f'article:{pk}' for pk in done])
+            rendered += len(done)
+            skipped += len(batch) - len(done)
+            self.stdout.write(f'Rendered {rendered} article(s)...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} article(s); {skipped} changed while rendering and were left as saved.'))
@@ -0,0 +1,31 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from blog import jobs
+
+
+class Command(BaseCommand):
+    help = ('Run queued background jobs (blog.jobs) on a thread pool. Start one or more of these with '
+            'JOBS_MODE=worker; they coordinate through the job table, no broker needed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Jobs run at the same time.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks for due jobs.')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of polling.')
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help='On start, delete finished jobs older than this many days (0 keeps them).')
+
+    def handle(self, *args, **options):
+        if options['purge_days']:
+            purged = jobs.purge(options['purge_days'])
+            self.stdout.write(f'Purged {purged} finished jobs.')
+
+        worker = jobs.Worker(threads=options['threads'], poll_interval=options['poll_interval'])
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            # finish the running jobs, claim nothing new
+            signal.signal(signum, lambda *_: worker.stop.set())
+
+        self.stdout.write(f'Worker {worker.name} running with {worker.threads} threads.')
+        worker.run(once=options['once'])
+        self.stdout.write('Worker stopped.')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog.seed_data import run_seed
+
+
+class Command(BaseCommand):
+    help = 'Seed demo users, articles and comments. Safe to re-run: it is a no-op once applied.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Run again even if the seed marker exists (missing rows are added, existing ones kept).')
+
+    def handle(self, *args, **options):
+        run_seed(force=options['force'])
@@ -0,0 +1,241 @@
+import contextvars
+import heapq
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Per-request instrumentation, on when METRICS_ENABLED is set. For every
+# request the middleware counts and times the SQL it runs (a database execute
+# wrapper, so queries made from sync_to_async threads count too), times the
+# serializers (those with SerializeTimingMixin) and the response rendering,
+# and then
+#   - adds a Server-Timing header (db, app, serialize, render and total, in ms),
+#   - logs requests slower than METRICS_SLOW_REQUEST_MS with their slowest
+#     queries to the blog.metrics logger,
+#   - adds the numbers to the per-route histograms served at /api/metrics in
+#     the Prometheus text format.
+# Histograms live in process memory, so each worker process reports its own.
+# When METRICS_ENABLED is off the middleware drops out of the stack at
+# startup and no execute wrapper is installed.
+
+logger = logging.getLogger(__name__)
+
+# seconds; the Prometheus client's default buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERIES_LOGGED = 5
+SQL_LOG_LENGTH = 300
+
+_current = contextvars.ContextVar('blog_metrics_request', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rendering = None
+        self.queries = 0
+        self.sql_time = 0.0
+        # time in serializers' to_representation, less the SQL they ran
+        self.serialize_time = 0.0
+        self.serializing = False
+        # min-heap of (duration, n, sql): the slowest queries so far
+        self.slowest = []
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        entry = (duration, self.queries, sql)
+        if len(self.slowest) < SLOW_QUERIES_LOGGED:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+class SerializeTimingMixin:
+    # for serializers: the outermost to_representation call is timed, so a
+    # nested or many=True serializer counts once per object, not per level
+    def to_representation(self, instance):
+        stats = _current.get()
+        if stats is None or stats.serializing:
+            return super().to_representation(instance)
+        stats.serializing = True
+        started, sql_time = time.perf_counter(), stats.sql_time
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializing = False
+            stats.serialize_time += time.perf_counter() - started - (stats.sql_time - sql_time)
+
+
+def _install(sender=None, connection=None, **kwargs):
+    # connection_created fires on every reconnect of the same wrapper
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            # (method, route, action, status) -> count
+            self._requests = {}
+            # (method, route, action) -> [bucket counts..., sum, count, queries, sql seconds]
+            self._routes = {}
+
+    def observe(self, method, route, action, status, seconds, queries, sql_seconds):
+        key = (method, route, action)
+        with self._lock:
+            self._requests[key + (status,)] = self._requests.get(key + (status,), 0) + 1
+            row = self._routes.setdefault(key, [0] * len(BUCKETS) + [0.0, 0, 0, 0.0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-4] += seconds
+            row[-3] += 1
+            row[-2] += queries
+            row[-1] += sql_seconds
+
+    def render(self):
+        with self._lock:
+            requests = sorted(self._requests.items())
+            routes = sorted((key, list(row)) for key, row in self._routes.items())
+
+        lines = [
+            '# HELP blog_http_requests_total Requests handled, by route and response status.',
+            '# TYPE blog_http_requests_total counter',
+        ]
+        for (method, route, action, status), count in requests:
+            lines.append(f'blog_http_requests_total{_labels(method=method, route=route, action=action, status=status)} {count}')
+
+        lines += [
+            '# HELP blog_http_request_duration_seconds Time to the response, by route.',
+            '# TYPE blog_http_request_duration_seconds histogram',
+        ]
+        for (method, route, action), row in routes:
+            for bound, count in zip(BUCKETS, row):
+                labels = _labels(method=method, route=route, action=action, le=bound)
+                lines.append(f'blog_http_request_duration_seconds_bucket{labels} {count}')
+            labels = _labels(method=method, route=route, action=action, le='+Inf')
+            lines.append(f'blog_http_request_duration_seconds_bucket{labels} {row[-3]}')
+            labels = _labels(method=method, route=route, action=action)
+            lines.append(f'blog_http_request_duration_seconds_sum{labels} {row[-4]:.6f}')
+            lines.append(f'blog_http_request_duration_seconds_count{labels} {row[-3]}')
+
+        lines += [
+            '# HELP blog_http_request_queries_total SQL queries run by requests, by route.',
+            '# TYPE blog_http_request_queries_total counter',
+        ]
+        for (method, route, action), row in routes:
+            lines.append(f'blog_http_request_queries_total{_labels(method=method, route=route, action=action)} {row[-2]}')
+
+        lines += [
+            '# HELP blog_http_request_sql_seconds_total Time requests spent in SQL, by route.',
+            '# TYPE blog_http_request_sql_seconds_total counter',
+        ]
+        for (method, route, action), row in routes:
+            lines.append(f'blog_http_request_sql_seconds_total{_labels(method=method, route=route, action=action)} {row[-1]:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _route(request):
+    # the URL name (e.g. article-detail) and the viewset action, so the label
+    # values stay bounded whatever the path
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched', ''
+    return match.view_name, getattr(match.func, 'actions', {}).get(request.method.lower(), '')
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(_install, dispatch_uid='blog.metrics')
+        for connection in connections.all():
+            _install(connection=connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = request._metrics = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = request._metrics = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this returns
+        request._metrics.rendering = time.perf_counter()
+        return response
+
+    def finish(self, request, response, stats):
+        finished = time.perf_counter()
+        total = finished - stats.started
+        render = finished - stats.rendering if stats.rendering is not None else 0.0
+        serialize = stats.serialize_time
+        app = max(total - stats.sql_time - serialize - render, 0.0)
+
+        timing = (f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries", '
+                  f'app;dur={app * 1000:.1f}, serialize;dur={serialize * 1000:.1f}, '
+                  f'render;dur={render * 1000:.1f}, total;dur={total * 1000:.1f}')
+        response['Server-Timing'] = f'{response["Server-Timing"]}, {timing}' if response.has_header('Server-Timing') else timing
+
+        route, action = _route(request)
+        registry.observe(request.method, route, action, response.status_code, total, stats.queries, stats.sql_time)
+        if total * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            slowest = ''.join(
+                f'\n  {duration * 1000:8.1f} ms  {sql[:SQL_LOG_LENGTH]}'
+                for duration, _, sql in sorted(stats.slowest, reverse=True))
+            logger.warning(
+                'Slow request %s %s (%s) -> %s: %.1f ms, %d queries in %.1f ms, serialize %.1f ms, render %.1f ms%s',
+                request.method, request.get_full_path(), f'{route} {action}'.strip(), response.status_code, total * 1000,
+                stats.queries, stats.sql_time * 1000, serialize * 1000, render * 1000, slowest)
+        return response
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from blog import search
+
+
+def install_search_index(apps, schema_editor):
+    search.install_index(schema_editor.connection, apps)
+    search.refresh_index(conn=schema_editor.connection, apps=apps)
+
+
+def uninstall_search_index(apps, schema_editor):
+    search.uninstall_index(schema_editor.connection, apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_article_updated_at_alter_article_title_comment'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
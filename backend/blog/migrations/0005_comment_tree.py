@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_comment_tree(apps, schema_editor):
+    Comment = apps.get_model('blog', 'Comment')
+    parents = dict(Comment.objects.values_list('id', 'reply_to_id'))
+    positions = {}
+
+    for pk in parents:
+        chain = []
+        node = pk
+        while node is not None and node not in positions:
+            chain.append(node)
+            node = parents.get(node)
+        for node in reversed(chain):
+            parent = positions.get(parents[node])
+            segment = str(node).zfill(10) + '/'
+            if parent is None:
+                positions[node] = (node, 0, segment)
+            else:
+                positions[node] = (parent[0], parent[1] + 1, parent[2] + segment)
+
+    batch = []
+    for pk, (root_id, depth, path) in positions.items():
+        batch.append(Comment(id=pk, root_id=root_id, depth=depth, path=path))
+        if len(batch) >= 1000:
+            Comment.objects.bulk_update(batch, ['root', 'depth', 'path'])
+            batch = []
+    Comment.objects.bulk_update(batch, ['root', 'depth', 'path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_article_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='root',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread', to='blog.comment'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['root', 'path'], name='blog_comment_root_path_idx'),
+        ),
+        migrations.RunPython(build_comment_tree, migrations.RunPython.noop),
+    ]
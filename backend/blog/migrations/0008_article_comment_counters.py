@@ -0,0 +1,59 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    Comment = apps.get_model('blog', 'Comment')
+
+    def aggregate(expression, **filters):
+        return Subquery(
+            Comment.objects.filter(article_id=OuterRef('pk'), **filters)
+            .order_by().values('article_id').annotate(value=expression).values('value'))
+
+    Article.objects.update(
+        comment_count=Coalesce(aggregate(Count('id')), 0, output_field=IntegerField()),
+        reply_count=Coalesce(aggregate(Count('id'), reply_to__isnull=False), 0, output_field=IntegerField()),
+        last_comment_at=aggregate(Max('created_at')),
+    )
+
+
+def create_last_comment_index(apps, schema_editor):
+    # newest discussion first, articles without comments last; Postgres needs
+    # NULLS LAST spelled out, SQLite sorts NULLs last on DESC already (and
+    # rejects the clause in index definitions)
+    nulls_last = ' NULLS LAST' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(
+        f'CREATE INDEX blog_article_last_comment_idx ON blog_article (last_comment_at DESC{nulls_last}, id DESC)')
+
+
+def drop_last_comment_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX IF EXISTS blog_article_last_comment_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_seedrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+        migrations.RunPython(create_last_comment_index, drop_last_comment_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tag_stats(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    TagStat = apps.get_model('blog', 'TagStat')
+
+    content_type = ContentType.objects.filter(app_label='blog', model='article').first()
+    if content_type is None:
+        return
+    rows = (
+        TaggedItem.objects.filter(content_type=content_type)
+        .values('tag_id', 'tag__name').annotate(article_count=Count('id'))
+    )
+    TagStat.objects.bulk_create([
+        TagStat(tag_id=row['tag_id'], name=row['tag__name'], key=row['tag__name'].lower(),
+                article_count=row['article_count'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_article_comment_counters'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStat',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='taggit.tag')),
+                ('name', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=100)),
+                ('article_count', models.PositiveIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-article_count', 'key'], name='blog_tagstat_count_idx'), models.Index(fields=['key'], name='blog_tagstat_key_idx', opclasses=['varchar_pattern_ops'])],
+            },
+        ),
+        migrations.RunPython(backfill_tag_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_commentevent'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # the composite indexes go in before the FK indexes they replace are dropped
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['article', '-created_at'], name='blog_comment_article_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('reply_to__isnull', True)), fields=['article', '-created_at', '-id'], name='blog_comment_article_roots_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['author', '-created_at'], name='blog_comment_author_idx'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='article',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='blog.article'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='author',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='root',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread', to='blog.comment'),
+        ),
+        # lookups on other apps' tables: the email uniqueness check at sign-up,
+        # and the case-insensitive tag matching of the bulk import (blog.bulk)
+        migrations.RunSQL(
+            'CREATE INDEX blog_auth_user_email_idx ON auth_user (email)',
+            'DROP INDEX blog_auth_user_email_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX blog_taggit_tag_lower_name_idx ON taggit_tag (LOWER(name))',
+            'DROP INDEX blog_taggit_tag_lower_name_idx',
+        ),
+    ]
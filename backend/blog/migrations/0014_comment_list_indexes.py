@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_comment_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # the new indexes go in before the ones they replace are dropped
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['reply_to', '-created_at', '-id'], name='blog_comment_reply_to_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='blog_comment_author_page_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='blog_comment_author_idx',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='reply_to',
+            field=models.ForeignKey(blank=True, db_index=False, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='blog.comment'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from blog import search
+
+
+def rebuild_search_index(apps, schema_editor):
+    # the index now keeps words as written (see blog.search), so rebuild it
+    search.uninstall_index(schema_editor.connection, apps)
+    search.install_index(schema_editor.connection, apps)
+    search.refresh_index(conn=schema_editor.connection, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_article_rendered_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
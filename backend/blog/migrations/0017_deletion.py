@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0016_search_index_unstemmed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Deletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('article_id', models.BigIntegerField()),
+                ('comment_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['article_id', 'deleted_at'], name='blog_deletion_article_idx'), models.Index(fields=['deleted_at'], name='blog_deletion_deleted_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+from blog import rendering
+
+BATCH_SIZE = 500
+
+
+def render_existing_articles(apps, schema_editor):
+    # fills the columns 0015 added for the rows that were already there, the
+    # same as `manage.py render_articles` does after a renderer change
+    Article = apps.get_model('blog', 'Article')
+    stale = Article.objects.filter(render_version__lt=rendering.VERSION).order_by('id')
+    last = 0
+    while True:
+        batch = list(stale.filter(id__gt=last).only('id', 'content')[:BATCH_SIZE])
+        if not batch:
+            return
+        last = batch[-1].id
+        for article in batch:
+            for field, value in rendering.render(article.content).items():
+                setattr(article, field, value)
+        Article.objects.bulk_update(batch, rendering.FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_deletion'),
+    ]
+
+    operations = [
+        migrations.RunPython(render_existing_articles, migrations.RunPython.noop),
+    ]
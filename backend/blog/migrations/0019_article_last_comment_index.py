@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+import blog.models
+from django.db import migrations, models
+
+
+def drop_raw_index(apps, schema_editor):
+    # 0008 created the index in raw SQL (SQLite table rebuilds since then may
+    # have dropped it); from here on it is declared in Article.Meta
+    schema_editor.execute('DROP INDEX IF EXISTS blog_article_last_comment_idx')
+
+
+def create_raw_index(apps, schema_editor):
+    nulls_last = ' NULLS LAST' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(
+        f'CREATE INDEX blog_article_last_comment_idx ON blog_article (last_comment_at DESC{nulls_last}, id DESC)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0018_render_existing_articles'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_raw_index, create_raw_index),
+        migrations.AddIndex(
+            model_name='article',
+            index=blog.models.NullsLastIndex(models.OrderBy(models.F('last_comment_at'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='blog_article_last_comment_idx'),
+        ),
+    ]
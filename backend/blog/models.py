@@ -1,6 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.expressions import OrderBy
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 from taggit.managers import TaggableManager
+from taggit.models import Tag
+
+from blog import rendering
 
 
 class Profile(models.Model):
@@ -8,10 +15,74 @@ class Profile(models.Model):
     bio = models.TextField(blank=True, max_length=1000)
     profile_pic = models.ImageField(
         upload_to='profile_pics/', blank=True, null=True)
+    # resized WEBP copies of profile_pic, built by blog.images
+    profile_pic_variants = models.JSONField(default=dict, blank=True, editable=False)
     birth_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the stored picture name, so blog.signals can discard a replaced one
+        self._saved_profile_pic = self.__dict__.get('profile_pic', models.DEFERRED)
+
+
+class SeedRun(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    applied_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+    # background work queued by blog.jobs and run by the job workers
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # at most one queued job per key; enqueueing a duplicate returns the queued one
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    # the claiming worker's lease; once it lapses (the worker died) the job is claimed again
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='blog_job_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=models.Q(status='queued'), name='blog_job_queued_dedupe_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk} ({self.status})'
+
+
+class NullsLastIndex(models.Index):
+    # NULLS LAST is kept on PostgreSQL, where a plain DESC index sorts NULLs
+    # first; SQLite sorts them last on DESC already and rejects the clause in
+    # index definitions
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        index = self.clone()
+        index.expressions = tuple(
+            OrderBy(expression.expression, descending=expression.descending)
+            if isinstance(expression, OrderBy) else expression
+            for expression in index.expressions)
+        return super(NullsLastIndex, index).create_sql(model, schema_editor, using=using, **kwargs)
+
 
 class Article(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -20,25 +91,209 @@ class Article(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     tags = TaggableManager()
+    # maintained by blog.counters; `manage.py recount_comments` repairs drift
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # rendered from content on save by blog.rendering; `manage.py render_articles` backfills
+    content_html = models.TextField(blank=True, default='', editable=False)
+    excerpt = models.TextField(blank=True, default='', editable=False)
+    reading_time = models.PositiveIntegerField(default=0, editable=False, help_text='Minutes.')
+    render_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='blog_article_created_id_idx'),
+            # ?ordering=-last_comment_at, uncommented articles last
+            NullsLastIndex(F('last_comment_at').desc(nulls_last=True), F('id').desc(),
+                           name='blog_article_last_comment_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def render(self):
+        for field, value in rendering.render(self.content).items():
+            setattr(self, field, value)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.render()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *rendering.FIELDS}
+        super().save(*args, **kwargs)
+
+
+class TagStat(models.Model):
+    # per-tag article counts for /api/tags/, maintained by blog.counters
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='stat')
+    name = models.CharField(max_length=100)
+    # lowercased name for prefix lookups
+    key = models.CharField(max_length=100)
+    article_count = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-article_count', 'key'], name='blog_tagstat_count_idx'),
+            models.Index(fields=['key'], name='blog_tagstat_key_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.article_count})'
+
+
+class CommentQuerySet(models.QuerySet):
+    def in_thread_order(self):
+        # newest threads first, each thread depth-first with replies oldest
+        # first (nest_comments turns them around)
+        return self.order_by('-root__created_at', '-root_id', 'path')
+
 
 class Comment(models.Model):
+    PATH_SEGMENT_WIDTH = 10
+    # replies nest at most this deep (roots are depth 0), which keeps the
+    # path, one segment of PATH_SEGMENT_WIDTH + 1 characters per level,
+    # within its max_length
+    MAX_DEPTH = 50
+
+    # the foreign keys are indexed as the leading column of the composite
+    # indexes in Meta, which serve their lookups as well
     article = models.ForeignKey(
-        Article, on_delete=models.CASCADE, related_name='comments')
+        Article, on_delete=models.CASCADE, related_name='comments', db_index=False)
     content = models.TextField(max_length=1000)
     author = models.ForeignKey(
-        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='comments')
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='comments', db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     reply_to = models.ForeignKey(
-        'self', on_delete=models.CASCADE, default=None, null=True, blank=True, related_name='replies')
+        'self', on_delete=models.CASCADE, default=None, null=True, blank=True, related_name='replies',
+        db_index=False)
+    root = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='thread',
+        db_index=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+    path = models.CharField(max_length=1000, blank=True, default='', editable=False)
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # an article's comments newest first, and its latest comment (blog.counters)
+            models.Index(fields=['article', '-created_at'], name='blog_comment_article_idx'),
+            # an article's thread roots, the pages of CommentThreadPagination and ?article=
+            models.Index(
+                fields=['article', '-created_at', '-id'], condition=models.Q(reply_to__isnull=True),
+                name='blog_comment_article_roots_idx'),
+            # replies of a comment, and (reply_to IS NULL) the thread roots of all
+            # articles newest first, the pages of /api/comments/
+            models.Index(fields=['reply_to', '-created_at', '-id'], name='blog_comment_reply_to_idx'),
+            # a user's comments (/api/comments/?author=, cache invalidation when their profile changes)
+            models.Index(fields=['author', '-created_at', '-id'], name='blog_comment_author_page_idx'),
+            models.Index(fields=['root', 'path'], name='blog_comment_root_path_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # read through __dict__ so a deferred reply_to doesn't cost a query
+        self._saved_reply_to_id = self.__dict__.get('reply_to_id', models.DEFERRED)
+
+    @classmethod
+    def path_segment(cls, pk):
+        return str(pk).zfill(cls.PATH_SEGMENT_WIDTH) + '/'
+
+    def is_in_subtree_of(self, other):
+        return bool(other.path) and self.path.startswith(other.path)
+
+    def subtree_height(self):
+        # levels of replies below this comment
+        if not self.path:
+            return 0
+        deepest = Comment.objects.filter(root_id=self.root_id, path__startswith=self.path).aggregate(
+            deepest=models.Max('depth'))['deepest']
+        return (deepest or self.depth) - self.depth
+
+    def save(self, *args, **kwargs):
+        creating = self._state.adding
+        moved = (
+            not creating
+            and self._saved_reply_to_id is not models.DEFERRED
+            and self.reply_to_id != self._saved_reply_to_id
+        )
+        old_root_id, old_path, old_depth = self.root_id, self.path, self.depth
+        parent = self.reply_to if self.reply_to_id else None
+
+        if moved and parent is not None and (parent.pk == self.pk or parent.is_in_subtree_of(self)):
+            raise ValueError('A comment cannot reply to itself or one of its replies.')
+        if parent is not None and (creating or moved):
+            if parent.depth + 1 + (self.subtree_height() if moved else 0) > self.MAX_DEPTH:
+                raise ValueError(f'Replies can nest at most {self.MAX_DEPTH} levels deep.')
+
+        if creating or moved:
+            self.depth = parent.depth + 1 if parent else 0
+            self.root_id = parent.root_id if parent else self.pk
+            self.path = ''
+            if self.pk is not None:
+                self.path = (parent.path if parent else '') + self.path_segment(self.pk)
+
+        super().save(*args, **kwargs)
+        self._saved_reply_to_id = self.reply_to_id
+
+        if not self.path:
+            # the path (and a thread root's id) need the primary key we just got
+            self.root_id = self.root_id or self.pk
+            self.path = (parent.path if parent else '') + self.path_segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(root_id=self.root_id, path=self.path)
+        elif moved and old_path:
+            Comment.objects.filter(root_id=old_root_id, path__startswith=old_path).exclude(pk=self.pk).update(
+                root_id=self.root_id,
+                depth=models.F('depth') + (self.depth - old_depth),
+                path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1)),
+            )
 
     def __str__(self):
         author = self.author.username if self.author else "Anonymous"
         return f'by {author} in reply to {self.article}: {self.content}'
+
+
+class CommentEvent(models.Model):
+    # append-only log of comment changes behind the SSE stream (blog.events);
+    # the ids double as the stream's event ids
+    CREATED, UPDATED, DELETED = 'created', 'updated', 'deleted'
+    KIND_CHOICES = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='comment_events')
+    # no foreign key: the comment of a 'deleted' event is gone
+    comment_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['article', 'id'], name='blog_commentevent_article_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} comment {self.comment_id} on article {self.article_id}'
+
+
+class Deletion(models.Model):
+    # deleted articles (comment_id is null) and comments, which incremental
+    # exports report (blog.export); plain ids, since the rows are gone
+    article_id = models.BigIntegerField()
+    comment_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['article_id', 'deleted_at'], name='blog_deletion_article_idx'),
+            models.Index(fields=['deleted_at'], name='blog_deletion_deleted_at_idx'),
+        ]
+
+    def __str__(self):
+        if self.comment_id is None:
+            return f'article {self.article_id} deleted'
+        return f'comment {self.comment_id} on article {self.article_id} deleted'
@@ -0,0 +1,118 @@
+import json
+import re
+
+from django.db import connection
+from django.test.utils import override_settings
+
+from blog import benchmark
+from blog.cache import response_cache
+
+# Query plan checks for the endpoints the benchmark exercises. Every scenario
+# of blog.benchmark runs once against a generated dataset, each statement it
+# sent is run again under EXPLAIN, and sequential scans of tables holding at
+# least min_rows rows are reported: on a big site those are the queries that
+# grow with the table instead of the page. Small tables are left out because
+# a planner working from statistics (Postgres) rightly scans them.
+#
+# `manage.py check_query_plans` runs this in a throwaway database, and
+# QueryPlanTests runs it in the test suite.
+
+MIN_ROWS = 100
+EXPLAINED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+# (scenario, table) -> why the scan is acceptable
+KNOWN_SCANS = {
+    ('users.list', 'auth_user'): 'pages in primary key order, which SQLite reports as a scan',
+}
+
+# a full count reads every row whatever the indexes
+FULL_COUNT_RE = re.compile(r'^SELECT COUNT\(\*\) AS "__count" FROM "\w+"$')
+# "SCAN blog_comment" or "SCAN U0", not "SCAN t USING INDEX ..." or a virtual table
+SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+SQL_ALIAS_RE = re.compile(r'"(\w+)" (\w+)\b')
+
+
+class StatementRecorder:
+    # connection.execute_wrapper hook keeping the statements with their parameters
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append((sql, params[0] if many and params else params))
+        return execute(sql, params, many, context)
+
+
+def _postgres_plan(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def _postgres_scans(node):
+    if node.get('Node Type') == 'Seq Scan':
+        yield node['Relation Name']
+    for child in node.get('Plans', ()):
+        yield from _postgres_scans(child)
+
+
+def explain(sql, params):
+    # the plan as text lines
+    if connection.vendor == 'postgresql':
+        return json.dumps(_postgres_plan(sql, params), indent=1).splitlines()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def seq_scans(sql, params):
+    # names of the tables the statement reads sequentially
+    if connection.vendor == 'postgresql':
+        return set(_postgres_scans(_postgres_plan(sql, params)[0]['Plan']))
+
+    # Django aliases subquery tables (FROM "blog_comment" U0)
+    aliases = {alias: table for table, alias in SQL_ALIAS_RE.findall(sql)}
+    tables = set()
+    for line in explain(sql, params):
+        match = SQLITE_SCAN_RE.match(line)
+        if match:
+            tables.add(aliases.get(match[1], match[1]))
+    return tables
+
+
+def row_counts():
+    tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        counts = {}
+        for table in tables:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            counts[table] = cursor.fetchone()[0]
+    return counts
+
+
+def check(fx, only=None, min_rows=MIN_ROWS):
+    # returns {scenario: [(table, sql, plan lines)]} for the unexpected scans
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    large = {table for table, count in row_counts().items() if count >= min_rows}
+
+    problems = {}
+    with override_settings(THROTTLE_ENABLED=False):
+        for name, (call, expected_status) in benchmark.scenarios(fx).items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            response_cache().clear()
+            recorder = StatementRecorder()
+            with connection.execute_wrapper(recorder):
+                response = call()
+            if response.status_code != expected_status:
+                raise AssertionError(f'{name}: expected HTTP {expected_status}, got {response.status_code}')
+
+            for sql, params in recorder.statements:
+                if not sql.lstrip().upper().startswith(EXPLAINED) or FULL_COUNT_RE.match(sql):
+                    continue
+                for table in sorted(seq_scans(sql, params) & large):
+                    if (name, table) not in KNOWN_SCANS:
+                        problems.setdefault(name, []).append((table, sql, explain(sql, params)))
+    return problems
@@ -0,0 +1,139 @@
+import html
+import math
+import re
+
+# Article bodies are Markdown-ish text: paragraphs split by blank lines,
+# `code` spans, ``` fenced blocks, # headings, - and 1. lists, **bold**,
+# *emphasis* and [links](https://...). Article.save() renders them once into
+# stored columns (content_html, excerpt, reading_time), so reads serve them as
+# they are; `manage.py render_articles` fills the columns for existing rows.
+#
+# The text is HTML-escaped before any markup is added, and links only take
+# http(s) URLs, so content_html is safe to insert into a page as is.
+# Bump VERSION when the output changes; render_articles re-renders rows with
+# an older render_version.
+
+VERSION = 1
+FIELDS = ('content_html', 'excerpt', 'reading_time', 'render_version')
+EXCERPT_WORDS = 50
+WORDS_PER_MINUTE = 200
+
+FENCE_RE = re.compile(r'^```\s*([\w+-]*)\s*$')
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*$')
+BULLET_RE = re.compile(r'^[-*+]\s+(.*)$')
+NUMBERED_RE = re.compile(r'^\d+[.)]\s+(.*)$')
+CODE_RE = re.compile(r'`([^`\n]+)`')
+STRONG_RE = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*')
+EM_RE = re.compile(r'(?<![*\w])\*(?=\S)(.+?)(?<=\S)\*(?![*\w])')
+LINK_RE = re.compile(r'\[([^\]\n]+)\]\((https?://[^\s)]+)\)')
+PLAIN_MARKUP_RE = re.compile(r'`+|\*\*|(?<![*\w])\*(?=\S)|(?<=\S)\*(?![*\w])')
+
+
+def _inline(text):
+    # escaped text with the inline markup turned into tags; code spans are
+    # left alone
+    parts = CODE_RE.split(html.escape(text))
+    for i, part in enumerate(parts):
+        if i % 2:
+            parts[i] = f'<code>{part}</code>'
+        else:
+            part = LINK_RE.sub(r'<a href="\2" rel="nofollow noopener">\1</a>', part)
+            part = STRONG_RE.sub(r'<strong>\1</strong>', part)
+            parts[i] = EM_RE.sub(r'<em>\1</em>', part)
+    return ''.join(parts)
+
+
+def _blocks(text):
+    # (kind, payload) for every block of the text: ('code', (language, lines)),
+    # ('heading', (level, text)), ('ul'|'ol', items) or ('p', lines)
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    paragraph = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        fence = FENCE_RE.match(line.strip())
+        heading = HEADING_RE.match(line.strip())
+        if fence or heading or not line.strip():
+            if paragraph:
+                yield from _paragraph(paragraph)
+                paragraph = []
+        if fence:
+            end = i + 1
+            while end < len(lines) and lines[end].strip() != '```':
+                end += 1
+            yield 'code', (fence[1], lines[i + 1:end])
+            i = end + 1
+            continue
+        if heading:
+            yield 'heading', (len(heading[1]), heading[2])
+        elif line.strip():
+            paragraph.append(line.strip())
+        i += 1
+    if paragraph:
+        yield from _paragraph(paragraph)
+
+
+def _paragraph(lines):
+    # a block whose every line is a list item is a list
+    for kind, pattern in (('ul', BULLET_RE), ('ol', NUMBERED_RE)):
+        items = [pattern.match(line) for line in lines]
+        if all(items):
+            yield kind, [item[1] for item in items]
+            return
+    yield 'p', lines
+
+
+def render_html(text):
+    out = []
+    for kind, payload in _blocks(text):
+        if kind == 'code':
+            language, lines = payload
+            attrs = f' class="language-{language}"' if language else ''
+            out.append(f'<pre><code{attrs}>{html.escape(chr(10).join(lines))}</code></pre>')
+        elif kind == 'heading':
+            level, heading = payload
+            out.append(f'<h{level}>{_inline(heading)}</h{level}>')
+        elif kind in ('ul', 'ol'):
+            items = ''.join(f'<li>{_inline(item)}</li>' for item in payload)
+            out.append(f'<{kind}>{items}</{kind}>')
+        else:
+            out.append(f'<p>{_inline(chr(10).join(payload))}</p>')
+    return '\n'.join(out)
+
+
+def plain_text(text):
+    # the words of the text without the markup
+    out = []
+    for kind, payload in _blocks(text):
+        if kind == 'code':
+            out.append(' '.join(payload[1]))
+        elif kind == 'heading':
+            out.append(payload[1])
+        else:
+            out.append(' '.join(payload))
+    return LINK_RE.sub(r'\1', PLAIN_MARKUP_RE.sub('', ' '.join(out)))
+
+
+def excerpt(text, words=EXCERPT_WORDS):
+    # the first `words` words
+    parts = text.split()
+    if len(parts) > words:
+        return ' '.join(parts[:words]) + '…'
+    return ' '.join(parts)
+
+
+def render(content):
+    # the stored columns for an article body, keyed by Article field name
+    plain = plain_text(content)
+    words = len(plain.split())
+    return {
+        'content_html': render_html(content),
+        'excerpt': excerpt(plain),
+        'reading_time': math.ceil(words / WORDS_PER_MINUTE) if words else 0,
+        'render_version': VERSION,
+    }
+
+
+def render_batch(rows):
+    # [(id, content)] -> [(id, columns)]; runs in render_articles' worker processes
+    return [(pk, render(content)) for pk, content in rows]
@@ -0,0 +1,89 @@
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+
+ROLES_CLAIM = 'roles'
+
+
+def load_roles(user_id):
+    return frozenset(Group.objects.filter(user__id=user_id).values_list('name', flat=True))
+
+
+def _resolve_roles(request):
+    user = request.user
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    # JWT access tokens carry the role set, so token-authenticated requests
+    # never touch the groups table
+    token = request.auth
+    if token is not None and hasattr(token, 'get'):
+        roles = token.get(ROLES_CLAIM)
+        if roles is not None:
+            return frozenset(roles)
+
+    return frozenset(user.groups.values_list('name', flat=True))
+
+
+def get_roles(request):
+    # resolved once per request, however many permission checks ask
+    roles = getattr(request, '_blog_roles', None)
+    if roles is None:
+        roles = _resolve_roles(request)
+        request._blog_roles = roles
+    return roles
+
+
+def has_role(request, *names):
+    return not get_roles(request).isdisjoint(names)
+
+
+# Group -> 'app_label.codename' permission strings, shared by every request
+# until a group or permission changes (see blog.signals). The timeout bounds
+# how long other worker processes keep a stale copy.
+ROLE_PERMISSIONS_KEY = 'blog:role-permissions'
+ROLE_PERMISSIONS_TIMEOUT = 300
+
+
+def build_role_permissions():
+    matrix = {}
+    rows = Group.permissions.through.objects.values_list(
+        'group__name', 'permission__content_type__app_label', 'permission__codename')
+    for group_name, app_label, codename in rows:
+        matrix.setdefault(group_name, set()).add(f'{app_label}.{codename}')
+
+    all_permissions = Permission.objects.values_list('content_type__app_label', 'codename')
+    return {
+        'groups': {name: frozenset(perms) for name, perms in matrix.items()},
+        'all': frozenset(f'{app_label}.{codename}' for app_label, codename in all_permissions),
+    }
+
+
+def role_permissions():
+    matrix = cache.get(ROLE_PERMISSIONS_KEY)
+    if matrix is None:
+        matrix = build_role_permissions()
+        cache.set(ROLE_PERMISSIONS_KEY, matrix, ROLE_PERMISSIONS_TIMEOUT)
+    return matrix
+
+
+def invalidate_role_permissions():
+    cache.delete(ROLE_PERMISSIONS_KEY)
+
+
+def permissions_for_roles(roles):
+    groups = role_permissions()['groups']
+    return frozenset().union(*(groups.get(role, ()) for role in roles))
+
+
+def user_permissions(user):
+    # same result as user.get_all_permissions(), built from prefetched
+    # groups/user_permissions and the matrix instead of two queries per user
+    if not user.is_active:
+        return set()
+    if user.is_superuser:
+        return set(role_permissions()['all'])
+
+    perms = set(permissions_for_roles(group.name for group in user.groups.all()))
+    perms.update(
+        f'{perm.content_type.app_label}.{perm.codename}' for perm in user.user_permissions.all())
+    return perms
@@ -0,0 +1,118 @@
+import contextvars
+import random
+import time
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# Read replicas for the article and comment GETs. ReplicaReadsMixin (on
+# ArticleViewSet and CommentViewSet) and the async read views open a replica
+# scope around safe-method requests, and ReplicaRouter sends the reads made
+# inside it to one of DATABASE_REPLICAS, picked per request so a page and its
+# count come from the same server. Everything else - writes, other views,
+# background jobs - stays on the primary, and so does the rest of a request
+# once it has written anything.
+#
+# Read-your-writes: a successful write through those viewsets pins the user
+# to the primary for REPLICA_PIN_SECONDS (longer than the replication lag),
+# recorded in the response cache, which RESPONSE_CACHE=file shares between
+# worker processes. Responses cached within that window of a write are also
+# built from the primary (blog.cache), or a lagging replica could fill the
+# cache with data that stays stale until the next write.
+
+_reads = contextvars.ContextVar('blog_replica_reads', default=None)
+
+
+class _ReplicaScope:
+    def __init__(self, alias):
+        self.alias = alias
+
+
+def _pins():
+    return caches[settings.BLOG_RESPONSE_CACHE]
+
+
+def _pin_key(user_id):
+    return f'blog:replica-pin:{user_id}'
+
+
+def pin(user_id):
+    if settings.DATABASE_REPLICAS and user_id is not None:
+        _pins().set(_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+
+def begin(user_id):
+    # a reset token for end(), or None when the primary should answer
+    if not settings.DATABASE_REPLICAS:
+        return None
+    if user_id is not None and _pins().get(_pin_key(user_id)) is not None:
+        return None
+    return _reads.set(_ReplicaScope(random.choice(settings.DATABASE_REPLICAS)))
+
+
+def end(token):
+    if token is not None:
+        _reads.reset(token)
+
+
+@asynccontextmanager
+async def areplica_reads(user_id):
+    token = None
+    if settings.DATABASE_REPLICAS and (
+            user_id is None or await _pins().aget(_pin_key(user_id)) is None):
+        token = _reads.set(_ReplicaScope(random.choice(settings.DATABASE_REPLICAS)))
+    try:
+        yield
+    finally:
+        end(token)
+
+
+def use_primary_after(version):
+    # version: time.time_ns() of the last write the data must include
+    scope = _reads.get()
+    if scope is not None and time.time_ns() - version < settings.REPLICA_PIN_SECONDS * 1_000_000_000:
+        scope.alias = None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        scope = _reads.get()
+        if scope is None or scope.alias is None:
+            return DEFAULT_DB_ALIAS
+        return scope.alias
+
+    def db_for_write(self, model, **hints):
+        scope = _reads.get()
+        if scope is not None:
+            # the rest of this request reads what it wrote
+            scope.alias = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadsMixin:
+    # for viewsets: safe-method requests read from a replica (after
+    # authentication, so the user is known), successful writes pin the user
+    # to the primary
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self._replica_token = begin(request.user.pk)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            self._replica_token = None
+            end(token)
+        elif request.method not in SAFE_METHODS and response.status_code < 400:
+            pin(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,196 @@
+import re
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+from taggit.models import Tag, TaggedItem
+
+from blog.models import Article
+
+# Postgres keeps a weighted tsvector column (GIN indexed) on the article table,
+# SQLite keeps an FTS5 shadow table keyed by article id. Both are maintained
+# from the Article/tag signals in blog.signals and never touched by the ORM.
+#
+# Terms match as prefixes, so the index has to keep the words as written: a
+# stemmer turns "serializers" into "serial", which the prefix "serializ" no
+# longer matches. SQLite indexes unstemmed words; Postgres indexes each field
+# under both the 'english' (stemmed) and the 'simple' (as written)
+# configurations and matches every term against either.
+#
+# Migrations pass their historical apps and schema_editor.connection, so the
+# index can be built whatever later migrations do to the live models.
+SEARCH_VECTOR_COLUMN = 'search_vector'
+SEARCH_VECTOR_INDEX = 'blog_article_search_vector_idx'
+FTS_TABLE = 'blog_article_fts'
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+_index_available = None
+
+
+def _model(apps, app_label, name, model):
+    return model if apps is None else apps.get_model(app_label, name)
+
+
+def _tables(apps=None):
+    return {
+        'article': _model(apps, 'blog', 'Article', Article)._meta.db_table,
+        'user': _model(apps, 'auth', 'User', User)._meta.db_table,
+        'tag': _model(apps, 'taggit', 'Tag', Tag)._meta.db_table,
+        'tagged': _model(apps, 'taggit', 'TaggedItem', TaggedItem)._meta.db_table,
+        'fts': FTS_TABLE,
+        'column': SEARCH_VECTOR_COLUMN,
+        'index': SEARCH_VECTOR_INDEX,
+    }
+
+
+def _tags_subquery(conn, apps=None):
+    aggregate = "string_agg(t.name, ' ')" if conn.vendor == 'postgresql' else "group_concat(t.name, ' ')"
+    return (
+        "coalesce((SELECT {aggregate} FROM {tag} t "
+        "JOIN {tagged} ti ON ti.tag_id = t.id "
+        "WHERE ti.content_type_id = %s AND ti.object_id = a.id), '')"
+    ).format(aggregate=aggregate, **_tables(apps))
+
+
+def _weighted(expression, weight):
+    return (f"setweight(to_tsvector('english', {expression}), '{weight}') || "
+            f"setweight(to_tsvector('simple', {expression}), '{weight}')")
+
+
+def install_index(conn, apps=None):
+    global _index_available
+    _index_available = None
+    if conn.vendor == 'postgresql':
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'ALTER TABLE {article} ADD COLUMN IF NOT EXISTS {column} tsvector'.format(**_tables(apps)))
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS {index} ON {article} USING gin ({column})'.format(**_tables(apps)))
+    elif conn.vendor == 'sqlite':
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                "title, tags, author, content, tokenize = 'unicode61')".format(**_tables(apps)))
+
+
+def uninstall_index(conn, apps=None):
+    global _index_available
+    _index_available = None
+    if conn.vendor == 'postgresql':
+        with conn.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS {index}'.format(**_tables(apps)))
+            cursor.execute('ALTER TABLE {article} DROP COLUMN IF EXISTS {column}'.format(**_tables(apps)))
+    elif conn.vendor == 'sqlite':
+        with conn.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {fts}'.format(**_tables(apps)))
+
+
+def index_available(conn=None):
+    global _index_available
+    conn = conn or connection
+    if _index_available is None:
+        if conn.vendor == 'postgresql':
+            with conn.cursor() as cursor:
+                columns = conn.introspection.get_table_description(cursor, Article._meta.db_table)
+            _index_available = any(column.name == SEARCH_VECTOR_COLUMN for column in columns)
+        elif conn.vendor == 'sqlite':
+            _index_available = FTS_TABLE in conn.introspection.table_names()
+        else:
+            _index_available = False
+    return _index_available
+
+
+def refresh_index(article_ids=None, conn=None, apps=None):
+    # article_ids=None rebuilds the whole index in one statement
+    conn = conn or connection
+    if not index_available(conn):
+        return
+
+    content_types = _model(apps, 'contenttypes', 'ContentType', ContentType).objects.db_manager(conn.alias)
+    content_type_id = content_types.get_for_model(_model(apps, 'blog', 'Article', Article)).id
+    ids = list(article_ids) if article_ids is not None else None
+    if ids is not None and not ids:
+        return
+
+    where, params = '', []
+    if ids is not None:
+        where = ' WHERE a.id IN ({})'.format(', '.join(['%s'] * len(ids)))
+        params = ids
+
+    tables = _tables(apps)
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            sql = (
+                "UPDATE {article} a SET {column} = "
+                + _weighted('a.title', 'A') + " || "
+                + _weighted('{tags}', 'B') + " || "
+                "setweight(to_tsvector('simple', coalesce(u.username, '')), 'C') || "
+                + _weighted('a.content', 'D') + " "
+                "FROM {user} u WHERE u.id = a.author_id"
+            ).format(tags=_tags_subquery(conn, apps), **tables)
+            # the tags subquery appears twice
+            cursor.execute(sql + where.replace(' WHERE', ' AND'), [content_type_id] * 2 + params)
+        else:
+            cursor.execute(
+                'DELETE FROM {fts}'.format(**tables) + where.replace('a.id', 'rowid'), params)
+            sql = (
+                "INSERT INTO {fts} (rowid, title, tags, author, content) "
+                "SELECT a.id, a.title, {tags}, coalesce(u.username, ''), a.content "
+                "FROM {article} a LEFT JOIN {user} u ON u.id = a.author_id"
+            ).format(tags=_tags_subquery(conn, apps), **tables)
+            cursor.execute(sql + where, [content_type_id] + params)
+
+
+def remove_from_index(article_id):
+    if index_available() and connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {fts} WHERE rowid = %s'.format(**_tables()), [article_id])
+
+
+def search_terms(query):
+    return [term.lower() for term in TERM_RE.findall(query or '')]
+
+
+def search_articles(queryset, query):
+    # every term must match, as a prefix so partial words still hit
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    table = Article._meta.db_table
+    order = ('-search_rank', '-created_at', '-id')
+    if connection.vendor == 'postgresql':
+        # each term, stemmed or as written, as a prefix
+        tsquery = ' && '.join(["(to_tsquery('english', %s) || to_tsquery('simple', %s))"] * len(terms))
+        params = [f'{term}:*' for term in terms for _ in range(2)]
+        match = RawSQL(
+            f'{table}.{SEARCH_VECTOR_COLUMN} @@ ({tsquery})', params, output_field=BooleanField())
+        rank = RawSQL(
+            f'ts_rank_cd({table}.{SEARCH_VECTOR_COLUMN}, {tsquery})', params, output_field=FloatField())
+        return queryset.filter(match).annotate(search_rank=rank).order_by(*order)
+
+    # the FTS table is joined once, so MATCH runs once and bm25() reads the
+    # matched row instead of re-running the query per article
+    fts_query = ' '.join(f'"{term}"*' for term in terms)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rowid = {table}.id'],
+        params=[fts_query],
+        select={'search_rank': f'-bm25({FTS_TABLE}, 10.0, 5.0, 2.0, 1.0)'},
+    ).order_by(*order)
+
+
+class ArticleSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        if not index_available():
+            return super().filter_queryset(request, queryset, view)
+
+        return search_articles(queryset, ' '.join(terms))
@@ -1,50 +1,39 @@
-from django.core.files import File
-from blog.models import Profile
 import os
+
+from decouple import config
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
-from blog.models import Article, Comment, Profile
-from taggit.models import Tag
-from decouple import config
-from django.db.models.signals import post_save
-from blog.signals import assign_member_group
-
-
-def run_seed():
-    post_save.disconnect(assign_member_group, sender=User)
-    print("Running initial data seed...")
-
-    group_permissions = {
-        "Moderators": [
-            "view_article", "add_article", "change_article", "delete_article",
-            "view_comment", "add_comment", "change_comment", "delete_comment",
-        ],
-        "Editors": [
-            "view_article", "change_article",
-            "change_comment",
-        ],
-        "Members": [
-            "view_article",
-            "view_comment", "add_comment", "delete_comment",
-        ]
-    }
+from django.core.files import File
+from django.db import transaction
+from django.utils.text import slugify
+from taggit.models import Tag, TaggedItem
 
-    groups = {}
-    for name, permissions in group_permissions.items():
-        group, _ = Group.objects.get_or_create(name=name)
-        for perm_code in permissions:
-            try:
-                model_name = perm_code.split("_")[1]
-                content_type = ContentType.objects.get(model=model_name)
-                permission = Permission.objects.get(codename=perm_code, content_type=content_type)
-                group.permissions.add(permission)
-            except Permission.DoesNotExist:
-                print(f"Warning: Permission '{perm_code}' not found.")
-        group.save()
-        groups[name] = group
-    print("Groups created or confirmed with permissions.")
+from blog import cache, counters, images, roles, search
+from blog.models import Article, Comment, Profile, SeedRun
 
-    user_specs = [
+SEED_NAME = 'demo-v1'
+SEED_IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'static', 'seed_images')
+
+GROUP_PERMISSIONS = {
+    "Moderators": [
+        "view_article", "add_article", "change_article", "delete_article",
+        "view_comment", "add_comment", "change_comment", "delete_comment",
+    ],
+    "Editors": [
+        "view_article", "change_article",
+        "change_comment",
+    ],
+    "Members": [
+        "view_article",
+        "view_comment", "add_comment", "delete_comment",
+    ]
+}
+
+
+
+def user_specs():
+    return [
         {
             'username': 'mod1',
             'password': config('MOD_PASS'),
@@ -113,58 +102,33 @@ def run_seed():
         },
     ]
 
-    users = {}
-    for spec in user_specs:
-        user, created = User.objects.get_or_create(username=spec['username'])
-        if created:
-            user.set_password(spec['password'])
-            user.email = spec['email']
-            user.first_name = spec['first_name']
-            user.last_name = spec['last_name']
-            user.save()
-            print(f"Created user: {spec['username']}")
-        user.groups.add(groups[spec['group']])
-        users[spec['username']] = user
-
-        profile, _ = Profile.objects.get_or_create(user=user)
-        profile.bio = spec['bio']
-        profile.birth_date = spec['birth_date']
-
-        if spec['pic']:
-            image_path = os.path.join(
-                'blog', 'static', 'seed_images', spec['pic'])
-            if os.path.exists(image_path):
-                with open(image_path, 'rb') as img_file:
-                    profile.profile_pic.save(
-                        spec['pic'], File(img_file), save=False)
-        profile.save()
-
-    article_info = [
-        {
-            'title': 'Django Models and Migrations',
-            'content': """Django’s ORM allows you to define your database schema entirely in Python using models. Each model represents a table and its fields map to columns. This abstraction provides a cleaner way to manage the database and helps you avoid raw SQL in most situations.
+
+ARTICLES = [
+    {
+        'title': 'Django Models and Migrations',
+        'content': """Django’s ORM allows you to define your database schema entirely in Python using models. Each model represents a table and its fields map to columns. This abstraction provides a cleaner way to manage the database and helps you avoid raw SQL in most situations.
 
 Once your models are defined, Django's migration system lets you apply changes to your database schema using simple commands. You generate migrations with `makemigrations` and apply them with `migrate`. These migrations are versioned Python files that Django uses to track changes to your schema.
 
 In this project, we use models to define articles, comments, and user profiles. The `Article` model includes a foreign key to the user who authored it, as well as fields for the title, content, and tags. The `Comment` model supports nested replies via a self-referencing foreign key. The `Profile` model extends the user with additional fields such as bio, birth date, and profile picture.
 
 By combining Django’s ORM with its migration system, we get a robust and maintainable way to handle data structures. Whether you’re deploying to production or collaborating with other developers, migrations ensure your database stays in sync with your models.""",
-            'tags': ['django', 'models', 'migrations']
-        },
-        {
-            'title': 'DRF ViewSets and Routers',
-            'content': """Django REST Framework (DRF) offers ViewSets and Routers to reduce the boilerplate involved in building APIs. A ViewSet is a class that combines logic for multiple actions like list, retrieve, create, update, and delete. Instead of writing separate views for each of these actions, DRF lets you group them together into a ViewSet.
+        'tags': ['django', 'models', 'migrations']
+    },
+    {
+        'title': 'DRF ViewSets and Routers',
+        'content': """Django REST Framework (DRF) offers ViewSets and Routers to reduce the boilerplate involved in building APIs. A ViewSet is a class that combines logic for multiple actions like list, retrieve, create, update, and delete. Instead of writing separate views for each of these actions, DRF lets you group them together into a ViewSet.
 
 Routers take a ViewSet and automatically generate URL patterns. For example, registering an `ArticleViewSet` with a router will create paths like `/articles/`, `/articles/<id>/`, and so on. This drastically reduces manual URL configuration and ensures consistency across your API.
 
 In this project, `ArticleViewSet` and `CommentViewSet` are both implemented as `ModelViewSet` classes. This means they inherit the default CRUD actions and can be extended as needed. For example, we’ve added a custom route to retrieve all comments under a specific article using DRF’s `@action` decorator.
 
 This modular design not only makes your code more maintainable but also ensures that your API is self-documenting and consistent. Combined with DRF’s browsable API, it becomes much easier to test and explore endpoints during development. Routers and ViewSets are fundamental to keeping your API code clean and scalable.""",
-            'tags': ['drf', 'viewsets', 'routers']
-        },
-        {
-            'title': 'Authentication with JWT',
-            'content': """JWT (JSON Web Token) is a stateless authentication method widely used in APIs. It allows secure, token-based user authentication where credentials are exchanged for a signed token. This token is included in every request and can be verified without storing session data on the server.
+        'tags': ['drf', 'viewsets', 'routers']
+    },
+    {
+        'title': 'Authentication with JWT',
+        'content': """JWT (JSON Web Token) is a stateless authentication method widely used in APIs. It allows secure, token-based user authentication where credentials are exchanged for a signed token. This token is included in every request and can be verified without storing session data on the server.
 
 In this project, we use the `djangorestframework-simplejwt` package to implement JWT-based login and registration. When a user logs in, they receive an access token and a refresh token. The access token is short-lived and used for regular API requests. When it expires, the refresh token is used to obtain a new access token.
 
@@ -173,11 +137,11 @@ This approach is ideal for modern applications, especially SPAs and mobile apps,
 Additionally, we’ve built a custom `/register/` endpoint that handles creating a user along with their profile and returns a token. All this logic is handled using DRF serializers and views, keeping the code clean and testable.
 
 JWT authentication is a modern standard, and its inclusion makes this project secure and production-ready.""",
-            'tags': ['authentication', 'jwt', 'drf']
-        },
-        {
-            'title': 'Managing Tags with Django-Taggit',
-            'content': """Django-Taggit is a simple and powerful tagging library that lets you associate tags with any model in Django. Tags are stored in a separate table and linked to objects via a generic relation, allowing you to filter and query content based on tags.
+        'tags': ['authentication', 'jwt', 'drf']
+    },
+    {
+        'title': 'Managing Tags with Django-Taggit',
+        'content': """Django-Taggit is a simple and powerful tagging library that lets you associate tags with any model in Django. Tags are stored in a separate table and linked to objects via a generic relation, allowing you to filter and query content based on tags.
 
 In this project, we’ve added tags to the `Article` model using Taggit’s `TaggableManager`. This makes it easy to assign and retrieve tags associated with an article. To make tag handling more intuitive in the API, we customized the serializer using a subclass of `TagListSerializerField`.
 
@@ -186,11 +150,11 @@ The custom `TagField` class lets users submit tags as comma-separated strings in
 Taggit also supports advanced features like tag clouds, tag suggestions, and tag-based search. In a real-world app, tags improve content discovery and navigation. They can also be used for analytics or recommendation systems.
 
 By incorporating Django-Taggit and customizing its integration, we’ve built a tagging system that’s both flexible and user-friendly.""",
-            'tags': ['taggit', 'tags', 'django']
-        },
-        {
-            'title': 'User Profiles and Serializers',
-            'content': """Extending Django’s built-in User model is a common requirement in most applications. Rather than modifying the User model directly, best practice is to create a separate Profile model linked via a `OneToOneField`. This way, you can store additional user information without breaking Django’s auth system.
+        'tags': ['taggit', 'tags', 'django']
+    },
+    {
+        'title': 'User Profiles and Serializers',
+        'content': """Extending Django’s built-in User model is a common requirement in most applications. Rather than modifying the User model directly, best practice is to create a separate Profile model linked via a `OneToOneField`. This way, you can store additional user information without breaking Django’s auth system.
 
 In this project, the `Profile` model stores a user’s bio, birth date, and profile picture. It also tracks creation and update timestamps. The `Profile` is linked to the User, and we expose both via serializers so they can be created and updated together.
 
@@ -199,40 +163,170 @@ DRF serializers give us full control over how profile data is presented. We’ve
 This setup makes user data management intuitive from a frontend perspective. A single API call can fetch or update everything related to a user, and sensitive fields like passwords are protected. You can also extend this to include settings, preferences, or activity stats.
 
 User profile management is a fundamental feature, and our implementation demonstrates how to handle it cleanly with Django and DRF.""",
-            'tags': ['profiles', 'serializers', 'users']
-        }
-    ]
+        'tags': ['profiles', 'serializers', 'users']
+    }
+]
 
-    mod_authors = [users['mod1'], users['mod2']]
-    articles = []
-    for i, art in enumerate(article_info):
-        article, created = Article.objects.get_or_create(
-            title=art['title'],
-            defaults={'content': art['content'], 'author': mod_authors[i % 2]}
-        )
-        if created:
-            article.tags.add(*art['tags'])
-            print(f"Created article: {article.title}")
-        articles.append(article)
 
-    member_users = [users['member1'], users['member2'], users['member3']]
+def seed_groups():
+    Group.objects.bulk_create(
+        [Group(name=name) for name in GROUP_PERMISSIONS], ignore_conflicts=True)
+    groups = {group.name: group for group in Group.objects.filter(name__in=GROUP_PERMISSIONS)}
+
+    codenames = {codename for codenames in GROUP_PERMISSIONS.values() for codename in codenames}
+    permissions = {
+        permission.codename: permission
+        for permission in Permission.objects.filter(content_type__app_label='blog', codename__in=codenames)
+    }
+    for codename in sorted(codenames - permissions.keys()):
+        print(f"Warning: Permission '{codename}' not found.")
+
+    GroupPermission = Group.permissions.through
+    GroupPermission.objects.bulk_create([
+        GroupPermission(group_id=groups[name].id, permission_id=permissions[codename].id)
+        for name, codenames in GROUP_PERMISSIONS.items()
+        for codename in codenames if codename in permissions
+    ], ignore_conflicts=True)
+    # bulk writes skip the m2m signals that normally clear the matrix
+    roles.invalidate_role_permissions()
+    print("Groups created or confirmed with permissions.")
+    return groups
+
+
+def seed_users(specs, groups):
+    usernames = [spec['username'] for spec in specs]
+    users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+
+    # the demo accounts share a few well-known passwords; hash each one once
+    hashes = {}
+    new_users = []
+    for spec in specs:
+        if spec['username'] in users:
+            continue
+        if spec['password'] not in hashes:
+            hashes[spec['password']] = make_password(spec['password'])
+        new_users.append(User(
+            username=spec['username'],
+            email=spec['email'],
+            first_name=spec['first_name'],
+            last_name=spec['last_name'],
+            password=hashes[spec['password']],
+        ))
+    User.objects.bulk_create(new_users)
+    for user in new_users:
+        users[user.username] = user
+        print(f"Created user: {user.username}")
+
+    UserGroup = User.groups.through
+    UserGroup.objects.bulk_create([
+        UserGroup(user_id=users[spec['username']].id, group_id=groups[spec['group']].id)
+        for spec in specs
+    ], ignore_conflicts=True)
+
+    with_profile = set(Profile.objects.filter(user__in=users.values()).values_list('user_id', flat=True))
+    profiles = []
+    for spec in specs:
+        user = users[spec['username']]
+        if user.id in with_profile:
+            continue
+        profile = Profile(user=user, bio=spec['bio'], birth_date=spec['birth_date'])
+        image_path = os.path.join(SEED_IMAGES_DIR, spec['pic']) if spec['pic'] else None
+        if image_path and os.path.exists(image_path):
+            with open(image_path, 'rb') as img_file:
+                profile.profile_pic.save(spec['pic'], File(img_file), save=False)
+        profiles.append(profile)
+    Profile.objects.bulk_create(profiles)
+    return users
+
+
+def seed_articles(authors):
+    existing = set(Article.objects.filter(
+        title__in=[art['title'] for art in ARTICLES]).values_list('title', flat=True))
+    new_articles = []
+    for i, art in enumerate(ARTICLES):
+        if art['title'] not in existing:
+            new_articles.append(Article(title=art['title'], content=art['content'], author=authors[i % len(authors)]))
+    for article in new_articles:
+        # bulk_create skips Article.save(), which renders the stored columns
+        article.render()
+    Article.objects.bulk_create(new_articles)
+
+    tag_names = {name for art in ARTICLES for name in art['tags']}
+    Tag.objects.bulk_create(
+        [Tag(name=name, slug=slugify(name)) for name in tag_names], ignore_conflicts=True)
+    tags = {tag.slug: tag for tag in Tag.objects.filter(slug__in=[slugify(name) for name in tag_names])}
+
+    tags_by_title = {art['title']: art['tags'] for art in ARTICLES}
+    content_type = ContentType.objects.get_for_model(Article)
+    TaggedItem.objects.bulk_create([
+        TaggedItem(content_type=content_type, object_id=article.id, tag=tags[slugify(name)])
+        for article in new_articles
+        for name in tags_by_title[article.title]
+    ])
+    for article in new_articles:
+        print(f"Created article: {article.title}")
+    return new_articles
+
+
+def seed_comments(articles, commenters):
+    tags_by_title = {art['title']: art['tags'] for art in ARTICLES}
+    roots = []
     for i, article in enumerate(articles):
-        comment1, _ = Comment.objects.get_or_create(
+        roots.append(Comment(
             article=article,
-            content=f"This is a great post about {article.tags.first()}!",
-            author=member_users[i % 3]
-        )
-        comment2, _ = Comment.objects.get_or_create(
+            content=f"This is a great post about {tags_by_title[article.title][0]}!",
+            author=commenters[i % 3],
+        ))
+        roots.append(Comment(
             article=article,
             content="Really insightful explanation. Thanks!",
-            author=member_users[(i + 1) % 3]
-        )
-        Comment.objects.get_or_create(
+            author=commenters[(i + 1) % 3],
+        ))
+    Comment.objects.bulk_create(roots)
+    for root in roots:
+        root.root_id = root.id
+        root.path = Comment.path_segment(root.id)
+    Comment.objects.bulk_update(roots, ['root', 'path'])
+
+    replies = [
+        Comment(
             article=article,
             content="Agreed! This helped me a lot.",
-            author=member_users[(i + 2) % 3],
-            reply_to=comment1
+            author=commenters[(i + 2) % 3],
+            reply_to=roots[2 * i],
+            root_id=roots[2 * i].id,
+            depth=1,
         )
-        
-    post_save.connect(assign_member_group, sender=User)
+        for i, article in enumerate(articles)
+    ]
+    Comment.objects.bulk_create(replies)
+    for reply in replies:
+        reply.path = reply.reply_to.path + Comment.path_segment(reply.id)
+    Comment.objects.bulk_update(replies, ['path'])
+
+
+def run_seed(force=False):
+    # one transaction, bulk writes only; the SeedRun marker makes re-runs no-ops
+    with transaction.atomic():
+        if not force and SeedRun.objects.filter(name=SEED_NAME).exists():
+            print("Data already seeded - skipping seed")
+            return False
+
+        print("Running initial data seed...")
+        specs = user_specs()
+        groups = seed_groups()
+        users = seed_users(specs, groups)
+        articles = seed_articles([users['mod1'], users['mod2']])
+        seed_comments(articles, [users['member1'], users['member2'], users['member3']])
+
+        # bulk writes skip the signals that maintain the counters, search index and cache
+        counters.recount([article.id for article in articles])
+        counters.recount_tags()
+        search.refresh_index([article.id for article in articles])
+        SeedRun.objects.get_or_create(name=SEED_NAME)
+
+    # bulk-created profiles never went through the upload signal
+    images.build_missing_variants()
+    cache.bump('articles', 'tags')
     print("Seeding complete.")
+    return True
@@ -6,24 +6,34 @@ from django.contrib.auth.password_validation import validate_password
 from rest_framework.validators import UniqueValidator
 from rest_framework.serializers import SerializerMethodField
 from taggit.serializers import TagListSerializerField, TaggitSerializer
+from blog.roles import user_permissions
+from blog import images
+from blog.metrics import SerializeTimingMixin
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(SerializeTimingMixin, serializers.ModelSerializer):
     remove_profile_pic = serializers.BooleanField(write_only=True, required=False)
     profile_pic = serializers.SerializerMethodField()
+    profile_pic_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
-        fields = ['bio', 'profile_pic', 'remove_profile_pic', 'birth_date']
+        fields = ['bio', 'profile_pic', 'profile_pic_variants', 'remove_profile_pic', 'birth_date']
 
     def get_profile_pic(self, obj):
         if obj.profile_pic:
             return obj.profile_pic.url
         return None
 
+    def get_profile_pic_variants(self, obj):
+        # {size: url}, empty until the variants are rendered
+        if not images.has_variants(obj):
+            return {}
+        return {str(size): images.variant_url(obj, size) for size in images.VARIANT_SIZES}
 
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(SerializeTimingMixin, serializers.ModelSerializer):
     profile = ProfileSerializer(required=False)
     is_superuser = serializers.BooleanField(read_only=True)
     groups = serializers.SerializerMethodField()
@@ -41,7 +51,7 @@ class UserSerializer(serializers.ModelSerializer):
         return [group.name for group in obj.groups.all()]
 
     def get_permissions(self, obj):
-        return list(obj.get_all_permissions())
+        return sorted(user_permissions(obj))
 
     def create(self, validated_data):
         profile_data = validated_data.pop('profile', {})
@@ -68,7 +78,7 @@ class UserSerializer(serializers.ModelSerializer):
 
         remove_pic = profile_data.pop('remove_profile_pic', False)
         if remove_pic and profile.profile_pic:
-            profile.profile_pic.delete(save=False)
+            # blog.signals deletes the files once the change has committed
             profile.profile_pic = None
 
         for attr, value in profile_data.items():
@@ -159,7 +169,8 @@ class TagField(TagListSerializerField):
             and request.accepted_renderer.format == 'html'
         )
 
-        tag_names = value.names() if hasattr(value, 'names') else value
+        # iterate the manager rather than value.names() so prefetched tags are reused
+        tag_names = [tag.name for tag in value.all()] if hasattr(value, 'all') else value
 
         if is_browsable_api:
             return ', '.join(tag_names)
@@ -167,29 +178,53 @@ class TagField(TagListSerializerField):
         return list(tag_names)
 
 
-class ArticleSerializer(TaggitSerializer, serializers.ModelSerializer):
+class SparseFieldsMixin:
+    # ?fields=a,b returns only those fields and ?omit=a,b leaves them out, on
+    # GET requests and for the top-level objects only (not nested serializers)
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD') or self.root not in (self, self.parent):
+            return fields
+
+        params = getattr(request, 'query_params', request.GET)
+        for param in ('fields', 'omit'):
+            names = [name.strip() for name in params.get(param, '').split(',') if name.strip()]
+            if not names:
+                continue
+            unknown = [name for name in names if name not in fields]
+            if unknown:
+                raise serializers.ValidationError({param: [f'Unknown field(s): {", ".join(unknown)}.']})
+            if param == 'fields':
+                fields = {name: field for name, field in fields.items() if name in names}
+            else:
+                fields = {name: field for name, field in fields.items() if name not in names}
+        return fields
+
+
+class ArticleSerializer(SerializeTimingMixin, SparseFieldsMixin, TaggitSerializer, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
     author_profile_pic = serializers.SerializerMethodField()
     tags = TagField(style={'base_template': 'textarea.html'})
 
     class Meta:
         model = Article
-        fields = "__all__"
+        exclude = ['render_version']
 
     def get_author_id(self, obj):
         return obj.author.id
 
     def get_author_profile_pic(self, obj):
-        profile = Profile.objects.filter(user=obj.author).first()
-        if profile and profile.profile_pic:
+        url = images.variant_url(getattr(obj.author, 'profile', None))
+        if url:
             request = self.context.get("request")
-            return request.build_absolute_uri(profile.profile_pic.url) if request else profile.profile_pic.url
+            return request.build_absolute_uri(url) if request else url
         return None
 
 
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SerializeTimingMixin, serializers.ModelSerializer):
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
     author_name = serializers.SerializerMethodField()
     author_profile_pic = serializers.SerializerMethodField()
@@ -206,8 +241,10 @@ class CommentSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
             'reply_to',
+            'root',
+            'depth',
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at', 'root', 'depth']
 
     def get_author_name(self, obj):
         if obj.author:
@@ -215,11 +252,56 @@ class CommentSerializer(serializers.ModelSerializer):
         return "Deleted User"
     
     def get_author_profile_pic(self, obj):
-        profile = Profile.objects.filter(user=obj.author).first()
-        if profile and profile.profile_pic:
-            return profile.profile_pic.url
-        return None
+        return images.variant_url(getattr(obj.author, 'profile', None))
+
+    def validate(self, data):
+        reply_to = data.get('reply_to')
+        # the nested /articles/<id>/comments/ POST saves to its own article
+        article = self.context.get('article') or data.get('article') or getattr(self.instance, 'article', None)
+        if self.instance and article and article.pk != self.instance.article_id:
+            raise serializers.ValidationError({'article': 'A comment cannot be moved to another article.'})
+        if reply_to and article and reply_to.article_id != article.pk:
+            raise serializers.ValidationError(
+                {'reply_to': 'Comment being replied to must be on the same article.'})
+        if self.instance and reply_to and (
+            reply_to.pk == self.instance.pk or reply_to.is_in_subtree_of(self.instance)
+        ):
+            raise serializers.ValidationError(
+                {'reply_to': 'A comment cannot reply to itself or one of its replies.'})
+        if reply_to:
+            depth = reply_to.depth + 1
+            if self.instance and self.instance.reply_to_id != reply_to.pk:
+                # the moved comment brings its replies along
+                depth += self.instance.subtree_height()
+            if depth > Comment.MAX_DEPTH:
+                raise serializers.ValidationError(
+                    {'reply_to': f'Replies can nest at most {Comment.MAX_DEPTH} levels deep.'})
+        return data
 
     def update(self, instance, validated_data):
         validated_data.pop('author', None)
         return super().update(instance, validated_data)
+
+
+class TagStatSerializer(SerializeTimingMixin, serializers.ModelSerializer):
+    class Meta:
+        model = TagStat
+        fields = ['name', 'article_count', 'last_used_at']
+
+
+class ArticleImportSerializer(serializers.Serializer):
+    # one item of a bulk import; titles are checked for the whole batch at once
+    id = serializers.IntegerField(required=False, min_value=1)
+    title = serializers.CharField(max_length=100)
+    content = serializers.CharField()
+    tags = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+
+
+class ArticleSummarySerializer(ArticleSerializer):
+    # ?view=summary on list/retrieve: previews without the article body,
+    # from the excerpt stored at save time
+    class Meta:
+        model = Article
+        fields = ['id', 'title', 'excerpt', 'reading_time', 'author', 'author_profile_pic', 'tags',
+                  'created_at', 'updated_at', 'comment_count']
+        read_only_fields = fields
@@ -1,6 +1,11 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import DEFERRED, QuerySet
+from taggit.models import Tag
+from blog.models import Article, Comment, Profile
+from blog import cache, counters, events, export, images, roles, search
 
 # automatically assign new users to Members group
 @receiver(post_save, sender=User)
@@ -11,3 +16,212 @@ def assign_member_group(sender, instance, created, **kwargs):
         if not instance.groups.exists():
             instance.groups.add(members_group)
 
+
+# keep the full-text search index in sync with articles and their tags
+@receiver(post_save, sender=Article)
+def index_article(sender, instance, **kwargs):
+    search.refresh_index([instance.pk])
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def index_article_tags(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, Article):
+        search.refresh_index([instance.pk])
+
+
+@receiver(post_delete, sender=Article)
+def unindex_article(sender, instance, **kwargs):
+    search.remove_from_index(instance.pk)
+
+
+def tagged_article_ids(tag):
+    return list(Article.tags.through.objects.filter(
+        tag=tag, content_type=ContentType.objects.get_for_model(Article)).values_list('object_id', flat=True))
+
+
+def reindex_articles(article_ids):
+    # tag names and author names are indexed (and shown) with the article
+    if article_ids:
+        search.refresh_index(article_ids)
+        cache.bump('articles', *[f'article:{pk}' for pk in article_ids])
+
+
+@receiver(post_save, sender=Tag)
+def index_renamed_tag(sender, instance, created, **kwargs):
+    if not created:
+        reindex_articles(tagged_article_ids(instance))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_articles(sender, instance, **kwargs):
+    # the tagged items go with the tag, without m2m_changed
+    instance._tagged_article_ids = tagged_article_ids(instance)
+
+
+@receiver(post_delete, sender=Tag)
+def index_deleted_tag(sender, instance, **kwargs):
+    reindex_articles(getattr(instance, '_tagged_article_ids', []))
+
+
+# keep Article.comment_count / reply_count / last_comment_at current
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.comment_added(instance)
+    elif instance._saved_reply_to_id is not DEFERRED:
+        counters.reply_moved(instance, was_reply=instance._saved_reply_to_id is not None)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, origin=None, **kwargs):
+    # deleting the article itself takes its comments along, nothing to count
+    if isinstance(origin, Article) or (isinstance(origin, QuerySet) and origin.model is Article):
+        return
+    counters.comment_removed(instance)
+
+
+# feed the per-article comment streams (blog.events)
+@receiver(post_save, sender=Comment)
+def log_comment_saved(sender, instance, created, **kwargs):
+    events.comment_saved(instance, created)
+
+
+@receiver(post_delete, sender=Comment)
+def log_comment_deleted(sender, instance, origin=None, **kwargs):
+    # shortcut for the common cascade; events.comment_deleted checks that
+    # the article survived whatever the delete started from
+    if isinstance(origin, Article) or (isinstance(origin, QuerySet) and origin.model is Article):
+        return
+    events.comment_deleted(instance)
+
+
+@receiver(post_delete, sender=Profile)
+def discard_profile_files(sender, instance, **kwargs):
+    if instance.profile_pic:
+        images.discard_files([instance.profile_pic.name, *(instance.profile_pic_variants or {}).values()])
+
+
+# record deletions for incremental exports
+@receiver(post_delete, sender=Article)
+def record_article_deleted(sender, instance, **kwargs):
+    export.article_deleted(instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def record_comment_deleted(sender, instance, **kwargs):
+    export.comment_deleted(instance)
+
+
+# keep the TagStat counts behind /api/tags/ current
+@receiver(m2m_changed, sender=Article.tags.through)
+def count_article_tags(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Article):
+        return
+    if action == 'pre_clear':
+        instance._cleared_tag_ids = list(instance.tags.values_list('id', flat=True))
+    elif action == 'post_clear':
+        counters.tags_removed(getattr(instance, '_cleared_tag_ids', []))
+    elif action == 'post_add' and pk_set:
+        counters.tags_added(pk_set)
+    elif action == 'post_remove' and pk_set:
+        counters.tags_removed(pk_set)
+    else:
+        return
+    cache.bump('tags')
+
+
+@receiver(pre_delete, sender=Article)
+def uncount_article_tags(sender, instance, **kwargs):
+    # the tagged items go without signals of their own
+    tag_ids = list(instance.tags.values_list('id', flat=True))
+    if tag_ids:
+        counters.tags_removed(tag_ids)
+        cache.bump('tags')
+
+
+@receiver(post_save, sender=Tag)
+def rename_tag_stat(sender, instance, created, **kwargs):
+    if not created:
+        counters.tag_renamed(instance)
+        cache.bump('tags')
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    cache.bump('tags')
+
+
+# render avatar variants for new uploads, drop them with the picture
+@receiver(post_save, sender=Profile)
+def schedule_profile_variants(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'profile_pic' not in update_fields:
+        return
+    saved, instance._saved_profile_pic = instance._saved_profile_pic, instance.profile_pic.name or None
+    if not created and saved is not DEFERRED and (saved or None) != (instance.profile_pic.name or None):
+        # the previous original and the variants built from it
+        images.discard_files([saved, *(instance.profile_pic_variants or {}).values()])
+    if instance.profile_pic:
+        if instance.profile_pic_variants.get('source') != instance.profile_pic.name:
+            images.schedule_variants(instance)
+    elif instance.profile_pic_variants:
+        Profile.objects.filter(pk=instance.pk).update(profile_pic_variants={})
+
+
+# invalidate cached API responses that render the changed rows
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def invalidate_article(sender, instance, **kwargs):
+    cache.bump('articles', f'article:{instance.pk}', f'comments:{instance.pk}')
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def invalidate_article_tags(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, Article):
+        cache.bump('articles', f'article:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    # the article list and detail show the comment counters too
+    cache.bump('articles', f'article:{instance.article_id}', f'comments:{instance.article_id}')
+
+
+def invalidate_author(user_id):
+    # an author's name and picture are embedded in their articles and comments
+    article_ids = Article.objects.filter(author_id=user_id).values_list('id', flat=True)
+    commented_ids = Comment.objects.filter(author_id=user_id).order_by().values_list('article_id', flat=True).distinct()
+    cache.bump(
+        'articles',
+        *[f'article:{pk}' for pk in article_ids],
+        *[f'comments:{pk}' for pk in commented_ids],
+    )
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile(sender, instance, **kwargs):
+    invalidate_author(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_username(sender, instance, created, update_fields=None, **kwargs):
+    # logins save last_login only, which no cached response shows
+    if not created and (update_fields is None or 'username' in update_fields):
+        invalidate_author(instance.pk)
+        search.refresh_index(Article.objects.filter(author=instance).values_list('id', flat=True))
+
+
+# rebuild the role -> permission matrix whenever it could have changed
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        roles.invalidate_role_permissions()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_roles(sender, **kwargs):
+    roles.invalidate_role_permissions()
@@ -1,3 +1,1465 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from taggit.models import Tag
+
+from . import benchmark, concurrency, counters, events, images, jobs, metrics, plans, rendering, routers, throttling
+from .cache import response_cache
+from .datagen import generate
+from .export import export_lines
+from .models import Article, Comment, CommentEvent, Deletion, Job, Profile, SeedRun
+from .seed_data import ARTICLES, run_seed
+from .serializers import UserSerializer
+from .views import ArticleCursorPagination
+
+
+def make_user(username):
+    user = User.objects.create(username=username)
+    Profile.objects.create(user=user, profile_pic=f'profile_pics/{username}.png')
+    return user
+
+
+# the token buckets go to a scratch file rather than the one next to manage.py
+throttle_dir = tempfile.TemporaryDirectory()
+THROTTLE_STORE_PATH = os.path.join(throttle_dir.name, 'throttle.sqlite3')
+
+
+# replica connections can't see the rows of the test's open transaction
+@override_settings(DATABASE_REPLICAS=[], THROTTLE_STORE_PATH=THROTTLE_STORE_PATH)
+class BlogAPITestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache().clear()
+        throttling.store().clear()
+
+    def get_json(self, url, **extra):
+        return self.client.get(url, HTTP_ACCEPT='application/json', **extra)
+
+
+class ArticleSearchTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.in_title = Article.objects.create(author=self.bob, title='Serializers in depth', content='Fields.')
+        self.in_content = Article.objects.create(author=self.bob, title='Views',
+                                                 content='Views call their serializers.')
+        self.tagged = Article.objects.create(author=self.alice, title='Routers', content='URL routing.')
+        self.tagged.tags.add('authentication')
+
+    def search(self, query):
+        res = self.get_json(f'/api/articles/?search={query}')
+        self.assertEqual(res.status_code, 200)
+        return [article['id'] for article in res.data['results']]
+
+    def test_partial_words_match(self):
+        self.assertEqual(self.search('serializ'), [self.in_title.id, self.in_content.id])
+        self.assertEqual(self.search('authenticat'), [self.tagged.id])
+        self.assertEqual(self.search('rout'), [self.tagged.id])
+
+    def test_title_matches_rank_first_and_every_term_must_match(self):
+        self.assertEqual(self.search('serializers'), [self.in_title.id, self.in_content.id])
+        self.assertEqual(self.search('view serial'), [self.in_content.id])
+        self.assertEqual(self.search('views missing'), [])
+
+    def test_tags_and_author_match(self):
+        self.assertEqual(self.search('alic'), [self.tagged.id])
+        self.assertEqual(self.search('authentication'), [self.tagged.id])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.in_title.title = 'Pagination in depth'
+        self.in_title.save()
+        self.tagged.tags.add('pagination')
+        self.assertEqual(self.search('serializers'), [self.in_content.id])
+        self.assertCountEqual(self.search('paginat'), [self.in_title.id, self.tagged.id])
+
+        deleted = self.tagged.id
+        self.tagged.delete()
+        self.assertEqual(self.search('paginat'), [self.in_title.id])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM blog_article_fts WHERE rowid = %s', [deleted])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_index_follows_tag_renames_and_deletes(self):
+        self.assertEqual(self.search('authentication'), [self.tagged.id])
+        tag = Tag.objects.get(name='authentication')
+        tag.name = 'permissions'
+        tag.save()
+        self.assertEqual(self.search('authentication'), [])
+        self.assertEqual(self.search('permission'), [self.tagged.id])
+
+        tag.delete()
+        self.assertEqual(self.search('permission'), [])
+        self.assertEqual(self.search('rout'), [self.tagged.id])
+
+    def test_index_follows_username_changes(self):
+        self.assertEqual(self.search('alic'), [self.tagged.id])
+        self.alice.username = 'carol'
+        self.alice.save()
+        self.assertEqual(self.search('alic'), [])
+        self.assertEqual(self.search('carol'), [self.tagged.id])
+
+
+class CommentTreeTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.article = Article.objects.create(author=self.author, title='Threads', content='text')
+
+    def comment(self, content, reply_to=None):
+        return Comment.objects.create(article=self.article, author=self.author, content=content, reply_to=reply_to)
+
+    def test_saves_store_root_depth_and_path(self):
+        root = self.comment('root')
+        reply = self.comment('reply', root)
+        nested = self.comment('nested', reply)
+        nested.refresh_from_db()
+        self.assertEqual((nested.root_id, nested.depth), (root.id, 2))
+        self.assertEqual(nested.path, Comment.path_segment(root.id) + Comment.path_segment(reply.id)
+                         + Comment.path_segment(nested.id))
+
+    def test_moving_a_comment_moves_its_replies(self):
+        first, second = self.comment('first'), self.comment('second')
+        moved = self.comment('moved', first)
+        below = self.comment('below', moved)
+
+        moved.reply_to = second
+        moved.save()
+        below.refresh_from_db()
+        self.assertEqual((below.root_id, below.depth), (second.id, 2))
+        self.assertTrue(below.path.startswith(second.path))
+
+        moved.reply_to = None
+        moved.save()
+        below.refresh_from_db()
+        self.assertEqual((below.root_id, below.depth, below.path),
+                         (moved.id, 1, Comment.path_segment(moved.id) + Comment.path_segment(below.id)))
+
+        moved.reply_to = below
+        with self.assertRaises(ValueError):
+            moved.save()
+
+    def test_threads_and_replies_are_listed_newest_first(self):
+        old_root = self.comment('old root')
+        early, late = self.comment('early', old_root), self.comment('late', old_root)
+        nested = self.comment('nested', early)
+        new_root = self.comment('new root')
+
+        res = self.get_json(f'/api/articles/{self.article.id}/comments/')
+
+        def shape(comments):
+            return [(comment['id'], shape(comment.get('replies', []))) for comment in comments]
+        self.assertEqual(shape(res.data), [
+            (new_root.id, []),
+            (old_root.id, [(late.id, []), (early.id, [(nested.id, [])])]),
+        ])
+
+    def test_replies_nest_at_most_max_depth(self):
+        deepest = self.comment('level 0')
+        for level in range(1, Comment.MAX_DEPTH + 1):
+            deepest = self.comment(f'level {level}', deepest)
+        self.assertEqual(deepest.depth, Comment.MAX_DEPTH)
+
+        self.client.force_authenticate(self.author)
+        res = self.client.post('/api/comments/', {'article': self.article.id, 'content': 'too deep',
+                                                  'reply_to': deepest.id})
+        self.assertEqual(res.data, {'reply_to': [f'Replies can nest at most {Comment.MAX_DEPTH} levels deep.']})
+        with self.assertRaises(ValueError):
+            self.comment('too deep', deepest)
+
+        # moving a thread under another counts its replies too
+        other = self.comment('other root')
+        self.comment('other reply', other)
+        res = self.client.patch(f'/api/comments/{other.id}/', {'reply_to': deepest.reply_to_id})
+        self.assertEqual(res.data, {'reply_to': [f'Replies can nest at most {Comment.MAX_DEPTH} levels deep.']})
+
+    def test_replies_stay_on_their_article(self):
+        elsewhere = Article.objects.create(author=self.author, title='Elsewhere', content='text')
+        foreign = Comment.objects.create(article=elsewhere, author=self.author, content='foreign')
+        root = self.comment('root')
+        self.client.force_authenticate(self.author)
+        mismatch = {'reply_to': ['Comment being replied to must be on the same article.']}
+
+        # the nested POST saves to the URL's article whatever the body says
+        res = self.client.post(f'/api/articles/{self.article.id}/comments/',
+                               {'article': elsewhere.id, 'content': 'reply', 'reply_to': foreign.id})
+        self.assertEqual((res.status_code, res.data), (400, mismatch))
+        res = self.client.patch(f'/api/comments/{root.id}/', {'reply_to': foreign.id})
+        self.assertEqual((res.status_code, res.data), (400, mismatch))
+        res = self.client.patch(f'/api/comments/{root.id}/', {'article': elsewhere.id})
+        self.assertEqual(res.data, {'article': ['A comment cannot be moved to another article.']})
+
+        self.assertEqual(Comment.objects.filter(article=self.article).count(), 1)
+        root.refresh_from_db()
+        self.assertEqual((root.reply_to_id, root.root_id), (None, root.id))
+
+
+class ArticleQueryBudgetTests(BlogAPITestCase):
+    # list: page count + page rows (author and profile joined) + tag prefetch
+    LIST_QUERIES = 3
+    # detail: article row + tag prefetch
+    DETAIL_QUERIES = 2
+    # comments: article row + every comment with its author and profile
+    COMMENTS_QUERIES = 2
+
+    def setUp(self):
+        super().setUp()
+        self.authors = [make_user(f'author{i}') for i in range(4)]
+        self.commenters = [make_user(f'reader{i}') for i in range(4)]
+
+    def create_articles(self, count):
+        for i in range(count):
+            article = Article.objects.create(
+                author=self.authors[i % len(self.authors)],
+                title=f'Article {Article.objects.count()}',
+                content='Some `code` and text.',
+            )
+            article.tags.add(f'tag{i}', f'topic{i % 3}', 'shared')
+
+    def test_list_query_count_is_independent_of_page_contents(self):
+        self.create_articles(2)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            res = self.get_json('/api/articles/')
+        self.assertEqual(len(res.data['results']), 2)
+
+        self.create_articles(10)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            res = self.get_json('/api/articles/')
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertTrue(all(article['author_profile_pic'] for article in res.data['results']))
+        self.assertEqual(len(res.data['results'][0]['tags']), 3)
+
+    def test_detail_query_count(self):
+        self.create_articles(1)
+        article = Article.objects.get()
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            res = self.get_json(f'/api/articles/{article.id}/')
+        self.assertEqual(res.data['author'], article.author.username)
+        self.assertCountEqual(res.data['tags'], ['tag0', 'topic0', 'shared'])
+
+    def test_comments_query_count_is_independent_of_comment_count(self):
+        self.create_articles(1)
+        article = Article.objects.get()
+        for i in range(12):
+            root = Comment.objects.create(
+                article=article, content=f'root {i}', author=self.commenters[i % 4])
+            Comment.objects.create(
+                article=article, content=f'reply {i}', author=self.commenters[(i + 1) % 4], reply_to=root)
+
+        with self.assertNumQueries(self.COMMENTS_QUERIES):
+            res = self.get_json(f'/api/articles/{article.id}/comments/')
+        self.assertEqual(len(res.data), 12)
+        self.assertTrue(all(comment['author_profile_pic'] for comment in res.data))
+
+
+class ArticleCursorPaginationTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        author = make_user('author')
+        for i in range(7):
+            Article.objects.create(author=author, title=f'Article {i}', content='text')
+
+    def test_cursor_pages_cover_the_feed_in_order(self):
+        titles = []
+        url = '/api/articles/?pagination=cursor&page_size=2'
+        while url:
+            res = self.get_json(url)
+            self.assertNotIn('count', res.data)
+            titles += [article['title'] for article in res.data['results']]
+            url = res.data['next']
+        self.assertEqual(titles, [f'Article {i}' for i in reversed(range(7))])
+
+    def test_page_size_is_capped(self):
+        author = User.objects.get(username='author')
+        Article.objects.bulk_create(
+            Article(author=author, title=f'Bulk {i}', content='text') for i in range(60))
+        res = self.get_json('/api/articles/?pagination=cursor&page_size=1000')
+        self.assertEqual(len(res.data['results']), ArticleCursorPagination.max_page_size)
+
+    def test_page_numbers_remain_the_default(self):
+        res = self.get_json('/api/articles/?page=2')
+        self.assertEqual(res.data['count'], 7)
+        self.assertEqual(len(res.data['results']), 3)
+
+
+class SparseFieldsTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.long = Article.objects.create(author=self.author, title='Long', content=' '.join(['word'] * 200))
+        self.long.tags.add('django')
+        self.short = Article.objects.create(author=self.author, title='Short', content='Just a few words.')
+
+    def test_summary_leaves_the_content_column_out(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.get_json('/api/articles/?view=summary')
+        self.assertEqual(res.status_code, 200)
+        short, long = res.data['results']
+        self.assertEqual(list(long), ['id', 'title', 'excerpt', 'reading_time', 'author', 'author_profile_pic',
+                                      'tags', 'created_at', 'updated_at', 'comment_count'])
+        self.assertEqual(long['excerpt'], ' '.join(['word'] * 50) + '…')
+        self.assertEqual(long['tags'], ['django'])
+        self.assertEqual(short['excerpt'], 'Just a few words.')
+        page_query = ctx.captured_queries[1]['sql']
+        self.assertIn('"blog_article"."excerpt"', page_query)
+        self.assertNotIn('"blog_article"."content"', page_query)
+
+    def test_fields_and_omit(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.get_json('/api/articles/?fields=id,title&pagination=cursor')
+        self.assertEqual(res.data['results'], [{'id': self.short.id, 'title': 'Short'},
+                                               {'id': self.long.id, 'title': 'Long'}])
+        # no author join, no tag prefetch
+        self.assertEqual(len(ctx), 1)
+        self.assertNotIn('auth_user', ctx.captured_queries[0]['sql'])
+
+        res = self.get_json(f'/api/articles/{self.long.id}/?omit=content,tags,author_profile_pic')
+        self.assertNotIn('content', res.data)
+        self.assertEqual((res.data['title'], res.data['author']), ('Long', 'author'))
+
+    def test_unknown_names_are_rejected(self):
+        res = self.get_json('/api/articles/?fields=id,body')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.data, {'fields': ['Unknown field(s): body.']})
+        self.assertEqual(self.get_json('/api/articles/?view=compact').status_code, 400)
+
+
+class RenderedContentTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+
+    def test_markup_is_rendered_and_escaped(self):
+        html = rendering.render_html(
+            '# Title\n\nSome **bold** and *em* text with `a<b`\nand [a link](https://example.com).\n\n'
+            '- one\n- two\n\n```python\nif a < b:\n    pass\n```\n\n'
+            '<script>alert(1)</script> [bad](javascript:alert(1))')
+        self.assertEqual(html.split('\n'), [
+            '<h1>Title</h1>',
+            '<p>Some <strong>bold</strong> and <em>em</em> text with <code>a&lt;b</code>',
+            'and <a href="https://example.com" rel="nofollow noopener">a link</a>.</p>',
+            '<ul><li>one</li><li>two</li></ul>',
+            '<pre><code class="language-python">if a &lt; b:',
+            '    pass</code></pre>',
+            '<p>&lt;script&gt;alert(1)&lt;/script&gt; [bad](javascript:alert(1))</p>',
+        ])
+
+    def test_save_stores_the_rendered_columns(self):
+        article = Article.objects.create(author=self.author, title='Long',
+                                         content='## Intro\n\n' + ' '.join(['**word**'] * 450))
+        article.refresh_from_db()
+        self.assertTrue(article.content_html.startswith('<h2>Intro</h2>\n<p><strong>word</strong> '))
+        self.assertEqual(article.excerpt, 'Intro ' + ' '.join(['word'] * 49) + '…')
+        self.assertEqual((article.reading_time, article.render_version), (3, rendering.VERSION))
+
+        article.title = 'Renamed'
+        article.save(update_fields=['title'])
+        article.content = 'Short now.'
+        article.save(update_fields=['content'])
+        article.refresh_from_db()
+        self.assertEqual((article.content_html, article.excerpt, article.reading_time),
+                         ('<p>Short now.</p>', 'Short now.', 1))
+
+        res = self.get_json(f'/api/articles/{article.id}/')
+        self.assertEqual(res.data['content_html'], '<p>Short now.</p>')
+        self.assertNotIn('render_version', res.data)
+
+    def test_render_articles_fills_stale_rows(self):
+        articles = [Article.objects.create(author=self.author, title=f'Old {i}', content=f'Body *{i}*')
+                    for i in range(5)]
+        Article.objects.filter(pk__in=[a.pk for a in articles[1:]]).update(
+            content_html='', excerpt='', reading_time=0, render_version=0)
+        updated_at = Article.objects.get(pk=articles[3].pk).updated_at
+
+        out = io.StringIO()
+        call_command('render_articles', workers=0, batch_size=2, stdout=out)
+        self.assertIn('Rendered 4 article(s);', out.getvalue())
+        article = Article.objects.get(pk=articles[3].pk)
+        self.assertEqual((article.content_html, article.excerpt, article.render_version),
+                         ('<p>Body <em>3</em></p>', 'Body 3', rendering.VERSION))
+        self.assertEqual(article.updated_at, updated_at)
+
+        out = io.StringIO()
+        call_command('render_articles', workers=0, stdout=out)
+        self.assertIn('Rendered 0 article(s);', out.getvalue())
+
+    def test_migration_renders_existing_rows(self):
+        backfill = import_module('blog.migrations.0018_render_existing_articles')
+        articles = [Article.objects.create(author=self.author, title=f'Old {i}', content=f'Body *{i}*')
+                    for i in range(3)]
+        Article.objects.update(content_html='', excerpt='', reading_time=0, render_version=0)
+
+        with mock.patch.object(backfill, 'BATCH_SIZE', 2):
+            backfill.render_existing_articles(django_apps, None)
+        self.assertEqual(
+            list(Article.objects.order_by('id').values_list('content_html', 'render_version')),
+            [(f'<p>Body <em>{i}</em></p>', rendering.VERSION) for i in range(3)])
+        self.assertEqual(Article.objects.get(pk=articles[0].pk).updated_at, articles[0].updated_at)
+
+
+class CommentListTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        self.articles = [Article.objects.create(author=self.author, title=f'Article {i}', content='text')
+                         for i in range(2)]
+
+    def create_threads(self, article, count, author=None):
+        for i in range(count):
+            root = Comment.objects.create(article=article, content=f'root {i}', author=author or self.author)
+            Comment.objects.create(article=article, content=f'reply {i}', author=self.reader, reply_to=root)
+
+    def test_pages_are_threads_with_their_replies(self):
+        self.create_threads(self.articles[0], 3)
+        self.create_threads(self.articles[1], 2)
+        roots, url = [], '/api/comments/?page_size=2'
+        while url:
+            res = self.get_json(url)
+            self.assertLessEqual(len(res.data['results']), 2)
+            for root in res.data['results']:
+                self.assertIsNone(root['reply_to'])
+                self.assertEqual([reply['reply_to'] for reply in root['replies']], [root['id']])
+            roots += [root['id'] for root in res.data['results']]
+            url = res.data['next']
+        self.assertEqual(roots, list(Comment.objects.filter(reply_to=None).order_by('-created_at', '-id')
+                                     .values_list('id', flat=True)))
+
+    def test_filters(self):
+        self.create_threads(self.articles[0], 2)
+        self.create_threads(self.articles[1], 1)
+        res = self.get_json(f'/api/comments/?article={self.articles[1].id}')
+        self.assertEqual([root['content'] for root in res.data['results']], ['root 0'])
+
+        # a user's comments come flat, replies included, newest first
+        res = self.get_json(f'/api/comments/?author={self.reader.id}&article={self.articles[0].id}')
+        self.assertEqual([comment['content'] for comment in res.data['results']], ['reply 1', 'reply 0'])
+        self.assertNotIn('replies', res.data['results'][0])
+
+        self.assertEqual(self.get_json('/api/comments/?article=first').status_code, 400)
+
+    def test_query_count_stays_flat(self):
+        self.create_threads(self.articles[0], 3)
+        urls = ['/api/comments/', f'/api/comments/?article={self.articles[0].id}', f'/api/comments/?author={self.reader.id}']
+        with CaptureQueriesContext(connection) as small:
+            for url in urls:
+                self.get_json(url)
+        self.create_threads(self.articles[0], 30)
+        with CaptureQueriesContext(connection) as large:
+            responses = [self.get_json(url) for url in urls]
+        self.assertEqual([len(res.data['results']) for res in responses], [10, 10, 10])
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(large), 2 + 2 + 1)
+
+
+class ResponseCacheTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.article = Article.objects.create(author=self.author, title='Cached', content='text')
+        self.comments_url = f'/api/articles/{self.article.id}/comments/'
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.get_json('/api/articles/')
+        with self.assertNumQueries(0):
+            second = self.get_json('/api/articles/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_matching_etag_answers_not_modified(self):
+        etag = self.get_json(f'/api/articles/{self.article.id}/')['ETag']
+        with self.assertNumQueries(0):
+            res = self.get_json(f'/api/articles/{self.article.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_comment_write_invalidates_only_that_article(self):
+        other = Article.objects.create(author=self.author, title='Other', content='text')
+        self.get_json(self.comments_url)
+        self.get_json(f'/api/articles/{other.id}/comments/')
+
+        Comment.objects.create(article=self.article, content='new', author=self.author)
+
+        self.assertEqual(len(self.get_json(self.comments_url).data), 1)
+        with self.assertNumQueries(0):
+            self.get_json(f'/api/articles/{other.id}/comments/')
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_entries_are_kept_per_host_and_scheme(self):
+        url = f'/api/articles/{self.article.id}/'
+        self.get_json(url, HTTP_HOST='a.example')
+        # a cache hit is a plain HttpResponse, without .data
+        pictures = [self.get_json(url, HTTP_HOST='b.example').json()['author_profile_pic'],
+                    self.get_json(url, HTTP_HOST='b.example', secure=True).json()['author_profile_pic']]
+        self.assertEqual([picture.split('/media/')[0] for picture in pictures],
+                         ['http://b.example', 'https://b.example'])
+
+    def test_profile_change_invalidates_authored_articles(self):
+        self.get_json(f'/api/articles/{self.article.id}/')
+        profile = self.author.profile
+        profile.profile_pic = 'profile_pics/new.png'
+        profile.save()
+        res = self.get_json(f'/api/articles/{self.article.id}/')
+        self.assertTrue(res.data['author_profile_pic'].endswith('profile_pics/new.png'))
+
+
+class RoleClaimTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='editor', password='pass12345!')
+        self.user.groups.set([Group.objects.get_or_create(name='Editors')[0]])
+        self.author = make_user('author')
+        self.article = Article.objects.create(author=self.author, title='Roles', content='text')
+
+    def obtain_tokens(self):
+        res = self.client.post('/api/token/', {'username': 'editor', 'password': 'pass12345!'})
+        return res.data['access'], res.data['refresh']
+
+    def test_access_token_carries_roles(self):
+        access, _ = self.obtain_tokens()
+        self.assertEqual(AccessToken(access)['roles'], ['Editors'])
+
+    def test_role_checks_use_the_claim_instead_of_group_queries(self):
+        access, _ = self.obtain_tokens()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.delete(f'/api/articles/{self.article.id}/', HTTP_ACCEPT='application/json')
+        self.assertEqual(res.status_code, 403)
+        self.assertFalse(any('"auth_group"' in query['sql'] for query in queries.captured_queries))
+
+    def test_refresh_picks_up_role_changes(self):
+        _, refresh = self.obtain_tokens()
+        self.user.groups.add(Group.objects.get_or_create(name='Moderators')[0])
+        res = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(AccessToken(res.data['access'])['roles'], ['Editors', 'Moderators'])
+
+
+class UserListTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create(username='admin', is_superuser=True, is_staff=True)
+        self.members = Group.objects.get_or_create(name='Members')[0]
+        self.members.permissions.add(Permission.objects.get(codename='add_comment'))
+        self.client.force_authenticate(self.admin)
+
+    def list_users(self):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.get_json('/api/users/')
+        return res, len(queries)
+
+    def test_query_count_is_independent_of_user_count(self):
+        make_user('first')
+        self.list_users()  # builds the role -> permission matrix
+        _, baseline = self.list_users()
+
+        for i in range(10):
+            make_user(f'user{i}')
+        res, queries = self.list_users()
+
+        self.assertEqual(queries, baseline)
+        self.assertEqual(res.data['count'], 12)
+        member = next(user for user in res.data['results'] if user['username'] == 'user0')
+        self.assertEqual(member['groups'], ['Members'])
+        self.assertEqual(member['permissions'], sorted(User.objects.get(username='user0').get_all_permissions()))
+
+    def test_matrix_follows_group_permission_changes(self):
+        make_user('member')
+        self.members.permissions.add(Permission.objects.get(codename='view_article'))
+        res = self.get_json('/api/users/')
+        member = next(user for user in res.data['results'] if user['username'] == 'member')
+        self.assertEqual(member['permissions'], ['blog.add_comment', 'blog.view_article'])
+
+
+@override_settings(JOBS_MODE='worker')
+@mock.patch.dict(os.environ, {'MOD_PASS': 'mod-pass', 'EDITOR_PASS': 'editor-pass', 'MEMBER_PASS': 'member-pass'})
+class SeedTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def counts(self):
+        return [model.objects.count() for model in (User, Profile, Article, Comment)]
+
+    def test_seed_applies_once(self):
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(run_seed())
+            seeded = self.counts()
+            self.assertEqual(seeded[2:], [len(ARTICLES), 3 * len(ARTICLES)])
+            self.assertFalse(Article.objects.filter(render_version__lt=rendering.VERSION).exists())
+            self.assertEqual(list(SeedRun.objects.values_list('name', flat=True)), ['demo-v1'])
+
+            self.assertFalse(run_seed())
+            self.assertEqual(self.counts(), seeded)
+
+    def test_forced_run_only_adds_missing_rows(self):
+        with redirect_stdout(io.StringIO()):
+            run_seed()
+            seeded = self.counts()
+            Article.objects.get(title=ARTICLES[0]['title']).delete()
+            self.assertFalse(run_seed())
+            self.assertEqual(self.counts()[2], len(ARTICLES) - 1)
+
+            self.assertTrue(run_seed(force=True))
+        self.assertEqual(self.counts(), seeded)
+        self.assertCountEqual(Article.objects.get(title=ARTICLES[0]['title']).tags.names(), ARTICLES[0]['tags'])
+
+
+class DataGeneratorTests(BlogAPITestCase):
+    def generate(self):
+        generate(users=5, articles=20, comments=200, tags=10, max_depth=4, batch_size=7, log=lambda line: None)
+
+    def test_comment_trees_are_consistent(self):
+        self.generate()
+        self.assertEqual(Comment.objects.count(), 200)
+        for comment in Comment.objects.select_related('reply_to'):
+            parent = comment.reply_to
+            if parent is None:
+                self.assertEqual((comment.root_id, comment.depth), (comment.id, 0))
+            else:
+                self.assertEqual(comment.article_id, parent.article_id)
+                self.assertEqual((comment.root_id, comment.depth), (parent.root_id, parent.depth + 1))
+                self.assertEqual(comment.path, parent.path + Comment.path_segment(comment.id))
+        self.assertLessEqual(max(Comment.objects.values_list('depth', flat=True)), 4)
+
+    def test_same_seed_generates_the_same_data(self):
+        def shape():
+            return list(Comment.objects.order_by('id').values_list('depth', 'content'))
+
+        self.generate()
+        first = shape()
+        User.objects.all().delete()
+        self.generate()
+        self.assertEqual(shape(), first)
+
+
+class ConcurrencyClientTests(SimpleTestCase):
+    def get(self, *responses):
+        async def exchange():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b''.join(responses))
+            reader.feed_eof()
+            writer = mock.Mock(drain=mock.AsyncMock())
+            return [await concurrency.http_get(reader, writer, '/api/') for _ in responses]
+        return asyncio.run(exchange())
+
+    def test_reads_whole_responses_off_a_kept_alive_connection(self):
+        self.assertEqual(self.get(
+            b'HTTP/1.1 200 OK\r\ncontent-length: 5\r\n\r\nhello',
+            b'HTTP/1.1 404 Not Found\r\ntransfer-encoding: chunked\r\n\r\n3\r\nabc\r\n2\r\nde\r\n0\r\n\r\n',
+            b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n',
+        ), [(200, True), (404, True), (200, False)])
+
+
+class BenchmarkCompareTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = mock.patch.object(benchmark, 'BASELINES_PATH', Path(directory.name) / 'baselines.json')
+        path.start()
+        self.addCleanup(path.stop)
+        benchmark.save_baselines('sqlite', {'small': {
+            'articles.list': {'time_ms': 10.0, 'sql_ms': 1.0, 'queries': 3, 'peak_kb': 100.0},
+        }})
+
+    def test_saving_merges_per_endpoint(self):
+        benchmark.save_baselines('sqlite', {'small': {'tags.list': {'queries': 1}}})
+        self.assertEqual(sorted(benchmark.load_baselines()['sqlite']['small']), ['articles.list', 'tags.list'])
+
+    def test_limits(self):
+        def regressions(scale=1.0, **metrics):
+            results = {'small': {'articles.list': {
+                'time_ms': 10.0, 'sql_ms': 1.0, 'queries': 3, 'peak_kb': 100.0, **metrics}}}
+            return benchmark.compare('sqlite', results, scale=scale)[1]
+
+        self.assertEqual(regressions(time_ms=19.9, peak_kb=189.0), [])
+        self.assertEqual(regressions(time_ms=20.5), ['small articles.list: time_ms 20.5 > 20.0 (baseline 10.0)'])
+        self.assertEqual(regressions(time_ms=30.0, scale=2.0), [])
+        # no tolerance and no scaling for query counts
+        self.assertEqual(regressions(queries=4, scale=2.0), ['small articles.list: queries 4 > 3.0 (baseline 3)'])
+
+    def test_unknown_endpoints_and_vendors_are_reported_as_new(self):
+        rows, regressions = benchmark.compare('sqlite', {'small': {'users.list': {'queries': 9}}})
+        self.assertEqual((rows, regressions), (['small   users.list                 queries=9 (new)'], []))
+        self.assertEqual(benchmark.compare('postgresql', {'small': {'articles.list': {'queries': 9}}})[1], [])
+
+
+class QueryPlanTests(BlogAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(**benchmark.SIZES['small'], log=lambda line: None)
+
+    def test_endpoints_do_not_scan_large_tables(self):
+        problems = plans.check(benchmark.Fixtures())
+        self.assertEqual({name: [table for table, _, _ in scans] for name, scans in problems.items()}, {})
+
+    def test_sequential_scans_are_reported(self):
+        sql, params = Article.objects.filter(content='missing').query.sql_with_params()
+        self.assertEqual(plans.seq_scans(sql, params), {'blog_article'})
+        sql, params = Comment.objects.filter(article_id__in=Article.objects.filter(content='x')).query.sql_with_params()
+        self.assertIn('blog_article', plans.seq_scans(sql, params))
+
+    def test_thread_pages_read_the_root_comment_index(self):
+        article = Article.objects.order_by('id').first()
+        roots = Comment.objects.filter(article=article, reply_to__isnull=True).order_by('-created_at', '-id')
+        sql, params = roots.values('id')[:10].query.sql_with_params()
+        self.assertIn('blog_comment_article_roots_idx', '\n'.join(plans.explain(sql, params)))
+
+
+class CommentCounterTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.article = Article.objects.create(author=self.author, title='Counted', content='text')
+
+    def counters(self):
+        self.article.refresh_from_db()
+        return self.article.comment_count, self.article.reply_count, self.article.last_comment_at
+
+    def test_counters_follow_creates_and_subtree_deletes(self):
+        root = Comment.objects.create(article=self.article, content='root', author=self.author)
+        reply = Comment.objects.create(article=self.article, content='reply', author=self.author, reply_to=root)
+        Comment.objects.create(article=self.article, content='nested', author=self.author, reply_to=reply)
+        other = Comment.objects.create(article=self.article, content='other root', author=self.author)
+        self.assertEqual(self.counters(), (4, 2, other.created_at))
+
+        other.delete()
+        self.assertEqual(self.counters(), (3, 2, Comment.objects.latest('created_at').created_at))
+        root.delete()  # takes both replies along
+        self.assertEqual(self.counters(), (0, 0, None))
+
+    def test_moving_a_reply_to_the_top_level_updates_reply_count(self):
+        root = Comment.objects.create(article=self.article, content='root', author=self.author)
+        reply = Comment.objects.create(article=self.article, content='reply', author=self.author, reply_to=root)
+        reply.reply_to = None
+        reply.save()
+        self.assertEqual(self.counters()[:2], (2, 0))
+
+    def test_recount_repairs_bulk_writes(self):
+        Comment.objects.bulk_create(
+            Comment(article=self.article, content=f'bulk {i}', author=self.author) for i in range(3))
+        self.assertEqual(self.counters()[0], 0)
+        self.assertEqual(counters.find_drift(), [self.article.id])
+        counters.recount()
+        self.assertEqual(self.counters()[:2], (3, 0))
+        self.assertEqual(counters.find_drift(), [])
+
+    def test_ordering_by_recent_discussion(self):
+        quiet = Article.objects.create(author=self.author, title='Quiet', content='text')
+        busy = Article.objects.create(author=self.author, title='Busy', content='text')
+        Comment.objects.create(article=self.article, content='first', author=self.author)
+        Comment.objects.create(article=busy, content='latest', author=self.author)
+
+        res = self.get_json('/api/articles/?ordering=-last_comment_at')
+        self.assertEqual([article['title'] for article in res.data['results']], ['Busy', 'Counted', 'Quiet'])
+        self.assertEqual(res.data['results'][0]['comment_count'], 1)
+        self.assertIsNone(res.data['results'][2]['last_comment_at'])
+
+    def test_recent_discussion_index_survives_the_migrations(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Article._meta.db_table)
+        self.assertEqual(constraints['blog_article_last_comment_idx']['columns'], ['last_comment_at', 'id'])
+        self.assertEqual(constraints['blog_article_last_comment_idx']['orders'], ['DESC', 'DESC'])
+
+
+class TagCloudTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.first = Article.objects.create(author=self.author, title='First', content='text')
+        self.second = Article.objects.create(author=self.author, title='Second', content='text')
+        self.first.tags.add('django', 'python', 'drf')
+        self.second.tags.add('django', 'python')
+
+    def cloud(self, query=''):
+        return [(tag['name'], tag['article_count']) for tag in self.get_json(f'/api/tags/{query}').data]
+
+    def test_counts_follow_tag_changes(self):
+        self.assertEqual(self.cloud(), [('django', 2), ('python', 2), ('drf', 1)])
+
+        self.first.tags.remove('python')
+        self.second.tags.clear()
+        self.assertEqual(self.cloud(), [('django', 1), ('drf', 1)])
+
+        self.first.delete()
+        self.assertEqual(self.cloud(), [])
+
+    def test_top_k_and_prefix(self):
+        self.assertEqual(self.cloud('?limit=1'), [('django', 2)])
+        self.assertEqual(self.cloud('?prefix=D'), [('django', 2), ('drf', 1)])
+
+    def test_served_from_the_counts_table(self):
+        self.get_json('/api/tags/')
+        response_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_json('/api/tags/?limit=10')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('taggit_taggeditem', queries.captured_queries[0]['sql'])
+
+    def test_recount_matches_incremental_counts(self):
+        before = self.cloud()
+        counters.recount_tags()
+        response_cache().clear()
+        self.assertEqual(self.cloud(), before)
+
+
+class ArticleBulkImportTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create(username='admin', is_superuser=True, is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def post_batch(self, items):
+        return self.client.post('/api/articles/bulk/', items, format='json', HTTP_ACCEPT='application/json')
+
+    def test_batch_is_written_with_a_fixed_number_of_queries(self):
+        # cached after the first lookup in a process
+        ContentType.objects.get_for_model(Article)
+        batch = [{'title': f'Imported {i}', 'content': 'text', 'tags': ['import', f'batch{i % 3}']}
+                 for i in range(5)]
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post_batch(batch).status_code, 201)
+
+        batch = [{'title': f'Imported more {i}', 'content': 'text', 'tags': ['import', f'more{i % 7}']}
+                 for i in range(60)]
+        with CaptureQueriesContext(connection) as large:
+            res = self.post_batch(batch)
+        self.assertEqual(res.data['created'], 60)
+        self.assertEqual(len(large), len(small))
+
+        article = Article.objects.get(title='Imported more 8')
+        self.assertEqual(res.data['results'][8], {'index': 8, 'status': 'created', 'id': article.id})
+        self.assertCountEqual(article.tags.names(), ['import', 'more1'])
+        self.assertEqual(self.get_json('/api/articles/?search=imported more').data['count'], 60)
+        self.assertEqual(self.get_json('/api/tags/?limit=1').data[0]['article_count'], 65)
+
+    def test_updates_replace_tags(self):
+        article = Article.objects.create(author=self.admin, title='Old', content='text')
+        article.tags.add('stale', 'kept')
+        res = self.post_batch([{'id': article.id, 'title': 'New', 'content': 'new text', 'tags': ['kept', 'fresh']}])
+        self.assertEqual(res.status_code, 200)
+        article.refresh_from_db()
+        self.assertEqual((article.title, article.content, article.excerpt), ('New', 'new text', 'new text'))
+        self.assertCountEqual(article.tags.names(), ['kept', 'fresh'])
+        self.assertEqual([tag['name'] for tag in self.get_json('/api/tags/').data], ['fresh', 'kept'])
+
+    def test_existing_tags_are_reused_case_insensitively(self):
+        article = Article.objects.create(author=self.admin, title='Tagged', content='text')
+        article.tags.add('Django')
+        self.post_batch([{'title': 'Imported', 'content': 'text', 'tags': ['django', 'DJANGO', 'New']}])
+        self.assertCountEqual(Article.objects.get(title='Imported').tags.names(), ['Django', 'New'])
+        top = self.get_json('/api/tags/').data[0]
+        self.assertEqual((top['name'], top['article_count']), ('Django', 2))
+
+    def test_invalid_items_reject_the_whole_batch(self):
+        Article.objects.create(author=self.admin, title='Taken', content='text')
+        res = self.post_batch([
+            {'title': 'Fine', 'content': 'text'},
+            {'title': 'Taken', 'content': 'text'},
+            {'title': 'Fine', 'content': 'text'},
+            {'content': 'no title'},
+            {'id': 999, 'title': 'Missing', 'content': 'text'},
+        ])
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual([result['status'] for result in res.data['results']],
+                         ['valid', 'error', 'error', 'error', 'error'])
+        self.assertIn('title', res.data['results'][3]['errors'])
+        self.assertIn('id', res.data['results'][4]['errors'])
+        self.assertEqual(Article.objects.count(), 1)
+
+    def test_members_cannot_import(self):
+        member = make_user('member')
+        member.groups.set([Group.objects.get_or_create(name='Members')[0]])
+        self.client.force_authenticate(member)
+        self.assertEqual(self.post_batch([{'title': 'Nope', 'content': 'text'}]).status_code, 403)
+
+
+class ExportTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create(username='admin', is_superuser=True, is_staff=True)
+        self.author = make_user('author')
+        self.articles = []
+        for i in range(5):
+            article = Article.objects.create(author=self.author, title=f'Export {i}', content='text')
+            article.tags.add('export', f'tag{i}')
+            root = Comment.objects.create(article=article, content='root', author=self.author)
+            Comment.objects.create(article=article, content='reply', author=self.author, reply_to=root)
+            self.articles.append(article)
+
+    def export(self, query=''):
+        self.client.force_authenticate(self.admin)
+        res = self.client.get(f'/api/articles/export/{query}')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(res.streaming_content).splitlines()]
+
+    def test_streams_articles_with_tags_and_comment_trees(self):
+        lines = self.export()
+        self.assertEqual([line['id'] for line in lines], [article.id for article in self.articles])
+        self.assertEqual(lines[2]['tags'], ['export', 'tag2'])
+        self.assertEqual(len(lines[2]['comments']), 1)
+        self.assertEqual(lines[2]['comments'][0]['replies'][0]['content'], 'reply')
+
+    def test_query_count_depends_on_chunks_not_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            lines = list(export_lines(chunk_size=2))
+        # one streamed article query, a tag prefetch per chunk of 2, one comment
+        # stream, and the savepoint the snapshot transaction becomes in a test
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(len(queries), 1 + 3 + 1 + 2)
+
+    def test_since_exports_only_changed_articles(self):
+        cutoff = timezone.now()
+        Comment.objects.create(article=self.articles[1], content='late', author=self.author)
+        self.articles[3].content = 'edited'
+        self.articles[3].save()
+
+        lines = self.export(f'?since={cutoff.isoformat().replace("+00:00", "Z")}')
+        self.assertEqual([line['id'] for line in lines], [self.articles[1].id, self.articles[3].id])
+        self.assertEqual(len(lines[0]['comments']), 2)
+
+    def test_since_reports_deletions(self):
+        cutoff = timezone.now()
+        Comment.objects.filter(article=self.articles[1], reply_to__isnull=False).delete()
+        deleted = self.articles[2].id
+        self.articles[2].delete()
+        Article.objects.filter(pk=self.articles[4].pk).delete()
+
+        lines = self.export(f'?since={cutoff.isoformat().replace("+00:00", "Z")}')
+        self.assertEqual([line['id'] for line in lines], [self.articles[1].id, deleted, self.articles[4].pk])
+        self.assertEqual(lines[0]['comments'][0].get('replies'), None)
+        self.assertEqual([line.get('deleted') for line in lines], [None, True, True])
+        # the deleted article's comments are covered by its own line
+        self.assertFalse(Deletion.objects.filter(article_id=deleted, comment_id__isnull=False).exists())
+
+        self.assertNotIn('deleted', self.export()[-1])
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.get('/api/articles/export/').status_code, 403)
+
+
+@override_settings(JOBS_MODE='eager')
+class ProfileVariantTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def upload(self, color='red', size=(800, 600)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'PNG')
+        return SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+
+    def register(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            res = self.client.post('/api/register/', {
+                'username': 'pictured', 'email': 'pictured@example.com',
+                'password': 'Pictured-pass-1', 'password2': 'Pictured-pass-1', 'profile_pic': self.upload(),
+            }, format='multipart')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(len(callbacks), 1)
+        return User.objects.get(username='pictured')
+
+    def test_upload_renders_content_hashed_webp_variants(self):
+        profile = self.register().profile
+        self.assertEqual(profile.profile_pic_variants['source'], profile.profile_pic.name)
+        for size in images.VARIANT_SIZES:
+            name = profile.profile_pic_variants[str(size)]
+            self.assertRegex(name, rf'^profile_pics/variants/[0-9a-f]{{20}}-{size}\.webp$')
+            with default_storage.open(name) as variant:
+                self.assertEqual(Image.open(variant).size, (size, size))
+
+    def test_avatars_use_the_small_variant(self):
+        user = self.register()
+        article = Article.objects.create(author=user, title='Pictured', content='text')
+        Comment.objects.create(article=article, content='hi', author=user)
+        expected = f'-{images.AVATAR_SIZE}.webp'
+        self.assertTrue(self.get_json(f'/api/articles/{article.id}/').data['author_profile_pic'].endswith(expected))
+        self.assertTrue(self.get_json(f'/api/articles/{article.id}/comments/').data[0]['author_profile_pic'].endswith(expected))
+
+    def files(self, profile):
+        profile.refresh_from_db()
+        return {profile.profile_pic.name, *profile.profile_pic_variants.values()}
+
+    def test_removed_picture_is_deleted_after_commit(self):
+        user = self.register()
+        names = self.files(user.profile)
+        self.assertEqual(len(names), 1 + len(images.VARIANT_SIZES))
+        serializer = UserSerializer(user, data={'profile': {'remove_profile_pic': True}}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+            self.assertTrue(all(default_storage.exists(name) for name in names))
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+        self.assertFalse(Profile.objects.get(user=user).profile_pic)
+
+    def test_replaced_picture_files_are_deleted(self):
+        profile = self.register().profile
+        old = self.files(profile)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_pic = self.upload('blue')
+            profile.save()
+        new = self.files(profile)
+        self.assertFalse(old & new)
+        self.assertEqual([default_storage.exists(name) for name in sorted(old)], [False] * len(old))
+        self.assertEqual([default_storage.exists(name) for name in sorted(new)], [True] * len(new))
+
+    def test_variants_shared_with_another_profile_are_kept(self):
+        profile = self.register().profile
+        other = make_user('same-picture').profile
+        with self.captureOnCommitCallbacks(execute=True):
+            other.profile_pic = self.upload()
+            other.save()
+        shared = self.files(profile) & self.files(other)
+        self.assertEqual(len(shared), len(images.VARIANT_SIZES))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.user.delete()
+        self.assertTrue(all(default_storage.exists(name) for name in self.files(other)))
+
+    def test_original_is_served_until_variants_exist(self):
+        user = make_user('plain')
+        self.assertEqual(images.variant_url(user.profile), user.profile.profile_pic.url)
+
+
+job_calls = []
+
+
+@jobs.task('tests.record')
+def record_job(value):
+    job_calls.append(value)
+
+
+@jobs.task('tests.broken', max_attempts=2, retry_delay=1)
+def broken_job():
+    raise ValueError('broken')
+
+
+@override_settings(JOBS_MODE='worker')
+class JobQueueTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        job_calls.clear()
+
+    def make_due(self):
+        Job.objects.filter(status=Job.QUEUED).update(run_at=timezone.now())
+
+    @override_settings(JOBS_MODE='eager')
+    def test_jobs_run_after_commit_and_dedupe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = jobs.enqueue('tests.record', 1, dedupe_key='record')
+            second = jobs.enqueue('tests.record', 2, dedupe_key='record')
+            self.assertEqual(job_calls, [])
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(job_calls, [1])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        job = jobs.enqueue('tests.broken')
+        with self.assertLogs('blog.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending('worker'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('ValueError: broken', job.last_error)
+        self.assertEqual(jobs.run_pending('worker'), 0)  # not due yet
+
+        self.make_due()
+        with self.assertLogs('blog.jobs', 'ERROR'):
+            jobs.run_pending('worker')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_lapsed_lease_is_claimed_by_another_worker(self):
+        job = jobs.enqueue('tests.record', 3)
+        self.assertEqual([claimed.pk for claimed in jobs.claim('crashed')], [job.pk])
+        self.assertEqual(jobs.claim('other'), [])
+
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        reclaimed = jobs.claim('other')
+        self.assertEqual(reclaimed[0].attempts, 2)
+        self.assertEqual(jobs.renew('crashed', [job.pk]), 0)
+        jobs.execute(reclaimed[0], 'other')
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertEqual(job_calls, [3])
+
+
+@override_settings(COMMENT_STREAM_POLL_SECONDS=0.01)
+class CommentStreamTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.article = Article.objects.create(author=self.author, title='Live', content='text')
+        self.url = f'/api/articles/{self.article.pk}/comments/stream/'
+
+    def open_stream(self, **extra):
+        response = self.client.get(self.url, **extra)
+        self.addCleanup(response.close)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.streaming_content
+
+    def test_saves_and_deletes_are_logged_as_deltas(self):
+        root = Comment.objects.create(article=self.article, content='root', author=self.author)
+        reply = Comment.objects.create(article=self.article, content='reply', author=self.author, reply_to=root)
+        reply.content = 'edited'
+        reply.save()
+        root_id, reply_id = root.pk, reply.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            root.delete()  # takes the reply along
+
+        logged = [(event.kind, event.comment_id) for event in CommentEvent.objects.order_by('id')]
+        self.assertEqual(logged[:3], [('created', root_id), ('created', reply_id), ('updated', reply_id)])
+        self.assertCountEqual(logged[3:], [('deleted', root_id), ('deleted', reply_id)])
+        created = CommentEvent.objects.filter(kind='created').first().data
+        self.assertEqual((created['content'], created['root'], created['author_name']), ('root', root_id, 'author'))
+
+        self.article.delete()
+        self.assertFalse(CommentEvent.objects.exists())
+
+    @override_settings(JOBS_MODE='worker')
+    def test_deleting_an_author_with_commented_articles(self):
+        reader = make_user('reader')
+        other = Article.objects.create(author=reader, title='Other', content='text')
+        Comment.objects.create(article=self.article, content='on their own article', author=self.author)
+        Comment.objects.create(article=self.article, content='from a reader', author=reader)
+        kept = Comment.objects.create(article=other, content='elsewhere', author=self.author)
+        CommentEvent.objects.all().delete()
+
+        self.client.force_authenticate(User.objects.create(username='admin', is_superuser=True, is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.delete(f'/api/users/{self.author.pk}/', HTTP_ACCEPT='application/json')
+        self.assertEqual(res.status_code, 204)
+        self.assertFalse(Article.objects.filter(pk=self.article.pk).exists())
+        # the deleted article's log went with it; comments elsewhere stay, anonymously
+        self.assertFalse(CommentEvent.objects.exists())
+        kept.refresh_from_db()
+        self.assertIsNone(kept.author_id)
+
+    def test_stream_resumes_after_last_event_id(self):
+        first = Comment.objects.create(article=self.article, content='seen', author=self.author)
+        second = Comment.objects.create(article=self.article, content='missed', author=self.author)
+        seen = CommentEvent.objects.get(comment_id=first.pk)
+
+        stream = self.open_stream(HTTP_LAST_EVENT_ID=str(seen.pk))
+        self.assertEqual(next(stream), f'retry: 3000\nid: {seen.pk}\n\n'.encode())
+        message = next(stream).decode()
+        self.assertTrue(message.startswith(f'id: {seen.pk + 1}\nevent: created\ndata: '))
+        self.assertEqual(json.loads(message.split('data: ', 1)[1])['id'], second.pk)
+        self.assertEqual(next(stream), b': keepalive\n\n')
+
+        # a new client starts at the latest event
+        stream = self.open_stream()
+        self.assertEqual(next(stream), f'retry: 3000\nid: {seen.pk + 1}\n\n'.encode())
+        self.assertEqual(next(stream), b': keepalive\n\n')
+
+    def test_sync_stream_ends_for_the_client_to_reconnect(self):
+        Comment.objects.create(article=self.article, content='seen', author=self.author)
+        latest = CommentEvent.objects.get().pk
+        with override_settings(COMMENT_STREAM_SYNC_SECONDS=0.05):
+            chunks = list(self.open_stream())
+        self.assertEqual(chunks[0], f'retry: 3000\nid: {latest}\n\n'.encode())
+        self.assertEqual(set(chunks[1:]), {b': keepalive\n\n'})
+
+    def test_stream_asks_for_a_refetch_when_events_were_pruned(self):
+        Comment.objects.create(article=self.article, content='old', author=self.author)
+        Comment.objects.create(article=self.article, content='new', author=self.author)
+        CommentEvent.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(events.prune(), 2)
+        Comment.objects.create(article=self.article, content='newest', author=self.author)
+
+        stream = self.open_stream(HTTP_LAST_EVENT_ID='1')
+        next(stream)
+        latest = CommentEvent.objects.get().pk
+        self.assertEqual(next(stream).decode(), f'id: {latest}\nevent: reset\ndata: {{}}\n\n')
+        self.assertEqual(next(stream), b': keepalive\n\n')
+
+    def test_missing_article(self):
+        self.assertEqual(self.client.get('/api/articles/999/comments/stream/').status_code, 404)
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_SLOW_REQUEST_MS=10000, METRICS_TOKEN='')
+class MetricsTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        author = make_user('author')
+        Article.objects.create(author=author, title='Measured', content='text')
+
+    def test_requests_get_server_timing_and_route_histograms(self):
+        res = self.get_json('/api/articles/')
+        timing = dict(part.strip().split(';', 1) for part in res['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'db', 'app', 'serialize', 'render', 'total'})
+        self.assertIn('desc="3 queries"', timing['db'])
+        self.get_json('/api/articles/0/')
+
+        res = self.client.get('/api/metrics')
+        self.assertEqual(res.status_code, 200)
+        text = res.content.decode()
+        self.assertIn('blog_http_requests_total{method="GET",route="article-list",action="list",status="200"} 1', text)
+        self.assertIn('blog_http_requests_total{method="GET",route="article-detail",action="retrieve",status="404"} 1',
+                      text)
+        self.assertIn('blog_http_request_duration_seconds_count{method="GET",route="article-list",action="list"} 1',
+                      text)
+        self.assertIn('blog_http_request_queries_total{method="GET",route="article-list",action="list"} 3', text)
+
+    def test_serializers_are_timed_apart_from_the_view(self):
+        def slow_pic(serializer, article):
+            time.sleep(0.05)
+            return None
+
+        with mock.patch('blog.serializers.ArticleSerializer.get_author_profile_pic', slow_pic):
+            res = self.get_json('/api/articles/')
+        timing = {name: float(part.split('dur=')[1].split(';')[0])
+                  for name, part in (part.strip().split(';', 1) for part in res['Server-Timing'].split(','))}
+        self.assertGreaterEqual(timing['serialize'], 50)
+        self.assertLess(timing['app'], 50)
+
+    def test_slow_requests_are_logged_with_their_queries(self):
+        with self.settings(METRICS_SLOW_REQUEST_MS=0), self.assertLogs('blog.metrics', 'WARNING') as logs:
+            self.get_json('/api/articles/')
+        self.assertIn('Slow request GET /api/articles/ (article-list list) -> 200', logs.output[0])
+        self.assertIn('SELECT COUNT(*)', logs.output[0])
+
+    def test_metrics_endpoint_token(self):
+        with self.settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+            res = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+            self.assertEqual(res.status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertFalse(self.get_json('/api/articles/').has_header('Server-Timing'))
+        self.assertEqual(self.client.get('/api/metrics').status_code, 404)
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+    'register': '2/hour', 'login': '3/min', 'login_user': '5/hour', 'token_refresh': None, 'comment': '2/min'}})
+class ThrottleTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.author.set_password('right-pass')
+        self.author.save()
+        self.article = Article.objects.create(author=self.author, title='Busy', content='text')
+
+    def test_login_is_limited_per_address(self):
+        for _ in range(3):
+            self.assertEqual(self.client.post('/api/token/', {'username': 'author', 'password': 'x'}).status_code, 401)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post('/api/token/', {'username': 'author', 'password': 'right-pass'})
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(len(ctx), 0)  # rejected before the user lookup and the hash
+        self.assertIn(int(res['Retry-After']), range(1, 21))
+        res = self.client.post('/api/token/', {'username': 'other', 'password': 'x'})
+        self.assertEqual(res.status_code, 429)
+
+    def test_one_account_is_limited_across_addresses(self):
+        for i in range(5):
+            res = self.client.post('/api/token/', {'username': 'Author', 'password': 'x'}, REMOTE_ADDR=f'10.0.0.{i}')
+            self.assertEqual(res.status_code, 401)
+        res = self.client.post('/api/token/', {'username': 'author', 'password': 'right-pass'},
+                               REMOTE_ADDR='10.0.1.1')
+        self.assertEqual(res.status_code, 429)
+        self.assertIn(int(res['Retry-After']), range(1, 721))
+
+        # other accounts from those addresses are not
+        res = self.client.post('/api/token/', {'username': 'other', 'password': 'x'}, REMOTE_ADDR='10.0.0.0')
+        self.assertEqual(res.status_code, 401)
+
+    def test_a_few_wrong_guesses_do_not_lock_the_owner_out(self):
+        for i in range(3):
+            res = self.client.post('/api/token/', {'username': 'author', 'password': 'x'}, REMOTE_ADDR=f'10.0.0.{i}')
+            self.assertEqual(res.status_code, 401)
+        res = self.client.post('/api/token/', {'username': 'author', 'password': 'right-pass'})
+        self.assertEqual(res.status_code, 200)
+
+    def test_register_is_limited_per_address(self):
+        for i in range(2):
+            self.client.post('/api/register/', {'username': f'u{i}'})
+        res = self.client.post('/api/register/', {'username': 'u3'})
+        self.assertEqual(res.status_code, 429)
+        self.assertIn(int(res['Retry-After']), range(1, 1801))
+
+    def test_comment_posts_are_limited_per_user(self):
+        self.client.force_authenticate(self.author)
+        self.client.post('/api/comments/', {'article': self.article.id, 'content': 'one'})
+        self.client.post(f'/api/articles/{self.article.id}/comments/', {'article': self.article.id, 'content': 'two'})
+        res = self.client.post('/api/comments/', {'article': self.article.id, 'content': 'three'})
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(Comment.objects.count(), 2)
+        # reads are not counted
+        self.assertEqual(self.get_json('/api/comments/').status_code, 200)
+
+    def test_buckets_refill(self):
+        store = throttling.store()
+        self.assertEqual(store.take(['a'], 2, 1.0, now=100), 0)
+        self.assertEqual(store.take(['a'], 2, 1.0, now=100), 0)
+        self.assertEqual(store.take(['a'], 2, 1.0, now=100.5), 0.5)
+        self.assertEqual(store.take(['a'], 2, 1.0, now=101), 0)
+
+        # all or nothing: "a" is empty, so "b" keeps both tokens
+        self.assertEqual(store.take(['a', 'b'], 2, 1.0, now=101), 1.0)
+        self.assertEqual(store.take(['b'], 2, 1.0, now=101), 0)
+        self.assertEqual(store.take(['b'], 2, 1.0, now=101), 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5)
+class ReplicaRouterTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        self.article = Article.objects.create(author=self.author, title='Replicated', content='text')
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_go_to_the_replica_until_the_request_writes(self):
+        self.assertEqual(self.router.db_for_read(Article), 'default')
+        token = routers.begin(None)
+        try:
+            self.assertEqual(self.router.db_for_read(Article), 'replica1')
+            self.assertEqual(self.router.db_for_write(Comment), 'default')
+            self.assertEqual(self.router.db_for_read(Article), 'default')
+        finally:
+            routers.end(token)
+        self.assertIsNone(routers._reads.get())
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        self.assertIsNone(routers.begin(None))
+        self.assertEqual(self.router.db_for_read(Article), 'default')
+
+    def test_writers_are_pinned_to_the_primary(self):
+        self.client.force_authenticate(self.author)
+        res = self.client.post('/api/comments/', {'article': self.article.id, 'content': 'first'})
+        self.assertEqual(res.status_code, 201)
+        self.assertIsNone(routers.begin(self.author.pk))
+        # failed writes and other users are not pinned
+        self.client.force_authenticate(make_user('reader'))
+        self.assertEqual(self.client.post('/api/comments/', {'content': 'no article'}).status_code, 400)
+        token = routers.begin(User.objects.get(username='reader').pk)
+        self.assertIsNotNone(token)
+        routers.end(token)
+
+    def test_responses_cached_soon_after_a_write_come_from_the_primary(self):
+        token = routers.begin(None)
+        try:
+            routers.use_primary_after(time.time_ns() - 60 * 1_000_000_000)
+            self.assertEqual(self.router.db_for_read(Article), 'replica1')
+            routers.use_primary_after(time.time_ns() - 1_000_000_000)
+            self.assertEqual(self.router.db_for_read(Article), 'default')
+        finally:
+            routers.end(token)
+
+# needs a replica1 alias (test_settings mirrors the test database as one) and
+# committed rows for it to read
+@skipUnless('replica1' in settings.DATABASES, 'needs a replica1 database alias')
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5, JOBS_MODE='worker',
+                   THROTTLE_STORE_PATH=THROTTLE_STORE_PATH)
+class ReplicaReadTests(APITransactionTestCase):
+    databases = {'default', 'replica1'} if 'replica1' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        response_cache().clear()
+        self.author = make_user('author')
+        self.article = Article.objects.create(author=self.author, title='Replicated', content='text')
+
+    def test_article_reads_use_the_replica_until_the_user_writes(self):
+        # past the pin window of the versions the response cache starts with
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            with CaptureQueriesContext(connections['replica1']) as replica:
+                res = self.client.get(f'/api/articles/{self.article.id}/', HTTP_ACCEPT='application/json')
+        self.assertEqual(res.data['title'], 'Replicated')
+        self.assertGreater(len(replica), 0)
+
+        self.client.force_authenticate(self.author)
+        self.client.post('/api/comments/', {'article': self.article.id, 'content': 'first'})
+        with CaptureQueriesContext(connections['replica1']) as replica:
+            res = self.client.get(f'/api/articles/{self.article.id}/comments/', HTTP_ACCEPT='application/json')
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(replica), 0)
+
+
+class AsyncReadViewTests(BlogAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user('author')
+        for i in range(4):
+            article = Article.objects.create(author=self.author, title=f'Async {i}', content='text')
+            article.tags.add('shared', f'tag{i}')
+        self.article = article
+        root = Comment.objects.create(article=article, content='root', author=self.author)
+        Comment.objects.create(article=article, content='reply', author=self.author, reply_to=root)
+        Comment.objects.create(article=article, content='second root', author=self.author)
+
+    async def get_async(self, path, **headers):
+        # resolve against blog.async_views the way blog.urls mounts it under /api/
+        match = get_resolver('blog.async_views').resolve(path.split('?')[0].removeprefix('/api'))
+        request = AsyncRequestFactory().get(path, headers={'Accept': 'application/json', **headers})
+        return await match.func(request, *match.args, **match.kwargs)
+
+    async def test_responses_match_the_drf_views(self):
+        paths = [
+            '/api/articles/', '/api/articles/?page=2', '/api/articles/?ordering=-last_comment_at',
+            f'/api/articles/{self.article.id}/', f'/api/articles/{self.article.id}/comments/',
+            f'/api/articles/{self.article.id}/comments/?page_size=1', '/api/comments/',
+            '/api/comments/?page_size=1', f'/api/comments/?article={self.article.id}',
+            f'/api/comments/?author={self.author.id}', '/api/comments/?author=x',
+            '/api/articles/?page=9', '/api/articles/0/',
+            '/api/articles/?view=summary', f'/api/articles/{self.article.id}/?fields=id,title', '/api/articles/?omit=x',
+        ]
+        for path in paths:
+            await sync_to_async(response_cache().clear)()
+            expected = await sync_to_async(self.get_json)(path)
+            await sync_to_async(response_cache().clear)()
+            response = await self.get_async(path)
+            self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content), path)
+            self.assertEqual(response['Allow'], expected['Allow'])
+
+    async def test_etags_work_across_both_paths(self):
+        url = f'/api/articles/{self.article.id}/'
+        expected = await sync_to_async(self.get_json)(url)
+        response = await self.get_async(url, **{'If-None-Match': expected['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+    async def test_other_requests_fall_back_to_drf(self):
+        html = await self.get_async('/api/articles/', Accept='text/html')
+        self.assertEqual(html['Content-Type'], 'text/html; charset=utf-8')
+        bad_token = await self.get_async('/api/articles/', Authorization='Bearer not-a-token')
+        self.assertEqual(bad_token.status_code, 401)
+        cursor = await self.get_async('/api/articles/?pagination=cursor')
+        self.assertIsNone(cursor.data['previous'])
@@ -0,0 +1,175 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Token-bucket rate limits for the endpoints that are expensive to hit
+# (password hashing on register and login) or to abuse (comment writes).
+# A rate of "10/min" is a bucket of 10 tokens refilled at 10 per minute, so
+# short bursts pass and sustained floods get 429 with Retry-After. DRF checks
+# throttles before the view runs, so a rejected login or signup never reaches
+# the password hasher.
+#
+# The buckets live in a small SQLite file (THROTTLE_STORE_PATH) shared by all
+# worker processes on the host; each check is one IMMEDIATE transaction. If the
+# store is unavailable requests are let through rather than locking users out.
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# share of checks that also delete buckets which have refilled completely
+PRUNE_PROBABILITY = 0.001
+
+
+def parse_rate(rate):
+    # "10/min" -> (capacity, tokens per second); None disables the throttle
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+class BucketStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def take(self, keys, capacity, refill, now=None):
+        # takes a token from every bucket in keys, or from none of them;
+        # returns 0 on success, else the seconds until all of them have one
+        now = time.time() if now is None else now
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            placeholders = ','.join('?' * len(keys))
+            rows = {key: (tokens, updated) for key, tokens, updated in conn.execute(
+                f'SELECT key, tokens, updated FROM bucket WHERE key IN ({placeholders})', keys)}
+            levels = {}
+            for key in keys:
+                tokens, updated = rows.get(key, (capacity, now))
+                levels[key] = min(capacity, tokens + max(now - updated, 0) * refill)
+
+            wait = max((1 - tokens) / refill for tokens in levels.values()) if levels else 0
+            if wait > 0:
+                conn.execute('COMMIT')
+                return wait
+
+            conn.executemany(
+                'INSERT INTO bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated, '
+                'full_at = excluded.full_at',
+                [(key, tokens - 1, now, now + (capacity - tokens + 1) / refill) for key, tokens in levels.items()])
+            if random.random() < PRUNE_PROBABILITY:
+                conn.execute('DELETE FROM bucket WHERE full_at < ?', (now,))
+            conn.execute('COMMIT')
+            return 0
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def clear(self):
+        self._connection().execute('DELETE FROM bucket')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store():
+    path = settings.THROTTLE_STORE_PATH
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = BucketStore(path)
+        return _stores[path]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # subclasses set scope (a key of DEFAULT_THROTTLE_RATES) and get_keys()
+    scope = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_keys(self, request, view):
+        # bucket names for this request; all of them must have a token
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        rate = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(self.scope))
+        if rate is None or not settings.THROTTLE_ENABLED:
+            return True
+        keys = [f'{self.scope}:{key}' for key in self.get_keys(request, view)]
+        if not keys:
+            return True
+        try:
+            self.wait_seconds = store().take(keys, *rate)
+        except sqlite3.Error:
+            logger.warning('Throttle store %s unavailable, letting the request through',
+                           settings.THROTTLE_STORE_PATH, exc_info=True)
+            return True
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class RegisterThrottle(TokenBucketThrottle):
+    scope = 'register'
+
+    def get_keys(self, request, view):
+        return [f'ip:{self.get_ident(request)}']
+
+
+class LoginThrottle(TokenBucketThrottle):
+    scope = 'login'
+
+    def get_keys(self, request, view):
+        return [f'ip:{self.get_ident(request)}']
+
+
+class LoginAccountThrottle(TokenBucketThrottle):
+    # per account name, against guessing one password from many addresses; a
+    # bigger, slower bucket than LoginThrottle's so a few wrong guesses from
+    # elsewhere don't lock the owner out
+    scope = 'login_user'
+
+    def get_keys(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if isinstance(username, str) and username:
+            return [f'user:{username.lower()[:150]}']
+        return []
+
+
+class TokenRefreshThrottle(TokenBucketThrottle):
+    scope = 'token_refresh'
+
+    def get_keys(self, request, view):
+        return [f'ip:{self.get_ident(request)}']
+
+
+class CommentThrottle(TokenBucketThrottle):
+    # comment writes only; by user, or by address for anonymous requests
+    scope = 'comment'
+
+    def get_keys(self, request, view):
+        if request.method != 'POST':
+            return []
+        if request.user and request.user.is_authenticated:
+            return [f'user:{request.user.pk}']
+        return [f'ip:{self.get_ident(request)}']
@@ -0,0 +1,24 @@
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from blog.roles import ROLES_CLAIM, load_roles
+
+
+class RoleRefreshToken(RefreshToken):
+    @property
+    def access_token(self):
+        # roles are read fresh every time an access token is minted, so group
+        # changes apply no later than the next refresh
+        access = super().access_token
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        access[ROLES_CLAIM] = sorted(load_roles(user_id))
+        return access
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RoleRefreshToken
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RoleRefreshToken
@@ -1,13 +1,21 @@
 from rest_framework.routers import DefaultRouter
 from .views import *
 from django.urls import path, include
+from django.conf import settings
 
 router = DefaultRouter()
 
 router.register('users', UserViewSet, basename='user')
 router.register('articles', ArticleViewSet, basename='article')
 router.register('comments', CommentViewSet, basename='comment')
+router.register('tags', TagViewSet, basename='tag')
 
 urlpatterns = [
+    path('articles/<int:pk>/comments/stream/', comment_stream, name='article-comment-stream'),
+    path('metrics', prometheus_metrics, name='metrics'),
     path('', include(router.urls)),
 ]
+
+if settings.ASYNC_READS:
+    # async GET handlers for articles and comments (see blog.async_views)
+    urlpatterns = [path('', include('blog.async_views'))] + urlpatterns
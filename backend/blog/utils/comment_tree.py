@@ -0,0 +1,18 @@
+def nest_comments(comments):
+    # comments must be in thread order (Comment.objects.in_thread_order()),
+    # so every parent is seen before any of its replies. Replies come out
+    # newest first, as roots do.
+    comments_by_id = {}
+    root_comments = []
+    for comment in comments:
+        comments_by_id[comment["id"]] = comment
+        parent_id = comment["reply_to"]
+        if parent_id is None:
+            root_comments.append(comment)
+        else:
+            parent = comments_by_id.get(parent_id)
+            if parent:
+                parent.setdefault("replies", []).append(comment)
+    for comment in comments_by_id.values():
+        comment.get("replies", []).reverse()
+    return root_comments
@@ -1,4 +1,15 @@
-from rest_framework.filters import SearchFilter
+import hmac
+from blog.search import ArticleSearchFilter
+from blog.bulk import ImportRejected, import_articles
+from blog.export import export_lines, parse_since
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from blog import events, metrics
+from blog.throttling import CommentThrottle, RegisterThrottle
+from blog.routers import ReplicaReadsMixin
+from django.utils import timezone
+from blog.cache import CachedResponseMixin, cache_response
 from django.contrib.auth.models import User
 from rest_framework import viewsets
 from blog.utils.try_parse_int import try_parse_int
@@ -7,12 +18,19 @@ from .serializers import *
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
+from blog.tokens import RoleRefreshToken
+from blog.roles import get_roles, has_role, permissions_for_roles
 from .serializers import *
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, DjangoModelPermissions, BasePermission, SAFE_METHODS, AllowAny
 from blog.utils.try_parse_int import try_parse_int
+from blog.utils.comment_tree import nest_comments
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from django.core.paginator import InvalidPage
 
 
 class IsEditorOrModerator(BasePermission):
@@ -21,14 +39,39 @@ class IsEditorOrModerator(BasePermission):
             return True
 
         if request.method in ['PUT', 'PATCH']:
-            return request.user.groups.filter(name__in=['Moderators', 'Editors']).exists()
+            return has_role(request, 'Moderators', 'Editors')
 
         if request.method in ['POST', 'DELETE']:
-            return request.user.groups.filter(name='Moderators').exists()
+            return has_role(request, 'Moderators')
 
         return False
 
 
+class RoleModelPermissions(DjangoModelPermissions):
+    # checks the role->permission matrix first (no queries with a JWT role
+    # claim) and only asks the auth backend for per-user grants on a miss
+    def has_permission(self, request, view):
+        if not request.user or (
+            not request.user.is_authenticated and self.authenticated_users_only
+        ):
+            return False
+
+        if getattr(view, '_ignore_model_permissions', False):
+            return True
+
+        queryset = self._queryset(view)
+        perms = self.get_required_permissions(request.method, queryset.model)
+        if permissions_for_roles(get_roles(request)).issuperset(perms):
+            return True
+        return request.user.has_perms(perms)
+
+
+class BulkImportPermissions(RoleModelPermissions):
+    # a batch can both create and update articles, so it needs both grants
+    def get_required_permissions(self, method, model_cls):
+        return super().get_required_permissions('POST', model_cls) + super().get_required_permissions('PUT', model_cls)
+
+
 class IsAdminOnly(BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_staff
@@ -39,9 +82,17 @@ class IsSelfOrSuperuser(BasePermission):
         return request.user == obj or request.user.is_superuser
 
 
+class UserPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile').prefetch_related(
+        'groups', 'user_permissions__content_type').order_by('id')
     serializer_class = UserSerializer
+    pagination_class = UserPagination
 
     def get_permissions(self):
         if self.action in ["list", "retrieve"]:
@@ -52,13 +103,14 @@ class UserViewSet(viewsets.ModelViewSet):
 class RegisterView(APIView):
     permission_classes = []
     serializer_class = RegisterSerializer
+    throttle_classes = [RegisterThrottle]
 
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
 
-        refresh = RefreshToken.for_user(user)
+        refresh = RoleRefreshToken.for_user(user)
         return Response({
             'user_id': user.id,
             'username': user.username,
@@ -71,12 +123,109 @@ class ArticlePagination(PageNumberPagination):
     page_size = 3
 
 
-class ArticleViewSet(viewsets.ModelViewSet):
-    queryset = Article.objects.all().order_by('-created_at')
+class ArticleOrderingFilter(OrderingFilter):
+    # ?ordering=-last_comment_at lists recently discussed articles first,
+    # served by blog_article_last_comment_idx; uncommented articles go last
+    ordering_fields = ['created_at', 'last_comment_at', 'comment_count']
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+
+        expressions = []
+        for field in ordering:
+            name = field.lstrip('-')
+            if name == 'last_comment_at':
+                column = F(name)
+                expressions.append(column.desc(nulls_last=True) if field.startswith('-') else column.asc(nulls_first=True))
+            else:
+                expressions.append(field)
+        # the id tie-breaker keeps pages stable (and matches the index)
+        expressions.append('-id' if ordering[-1].startswith('-') else 'id')
+        return queryset.order_by(*expressions)
+
+
+class ArticleCursorPagination(CursorPagination):
+    # keyset paging over blog_article_created_id_idx: no COUNT, no OFFSET scan
+    ordering = ('-created_at', '-id')
+    page_size = 3
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+    def get_ordering(self, request, queryset, view):
+        # a cursor only works on a unique, non-null ordering, so ?ordering= is ignored here
+        return self.ordering
+
+
+class CommentThreadPagination(PageNumberPagination):
+    # pages over root comments; each page carries its threads' replies in full
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+    def is_requested(self, request):
+        return (
+            self.page_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
+
+    def paginate_threads(self, queryset, request, view=None):
+        self.request = request
+        roots = queryset.filter(reply_to__isnull=True).order_by('-created_at', '-id').values('id')
+        paginator = self.django_paginator_class(roots, self.get_page_size(request))
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+
+        # the page slice stays lazy, so the thread fetch is a single query
+        return queryset.filter(root_id__in=self.page.object_list)
+
+
+class CommentCursorPagination(CursorPagination):
+    # keyset pages for /api/comments/, no COUNT and no OFFSET scan: thread roots
+    # (newest first, with their replies) or, with ?author=, that user's comments
+    ordering = ('-created_at', '-id')
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+
+class CommentFilter(BaseFilterBackend):
+    # ?article=<id> and ?author=<user id>
+    params = {'article': 'article_id', 'author': 'author_id'}
+
+    def filter_queryset(self, request, queryset, view):
+        for param, field in self.params.items():
+            if param in request.query_params:
+                value = try_parse_int(request.query_params[param])
+                if value is None:
+                    raise ValidationError({param: ['Expected an id.']})
+                queryset = queryset.filter(**{field: value})
+        return queryset
+
+
+class ArticleViewSet(ReplicaReadsMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = Article.objects.select_related('author__profile').prefetch_related('tags').order_by('-created_at')
     serializer_class = ArticleSerializer
     pagination_class = ArticlePagination
-    filter_backends = [SearchFilter]
-    search_fields = ['title', 'content', 'tags__name', 'author']
+    filter_backends = [ArticleSearchFilter, ArticleOrderingFilter]
+    search_fields = ['title', 'content', 'tags__name', 'author__username']
+
+    @property
+    def paginator(self):
+        # ?pagination=cursor (or following a cursor link) opts into keyset
+        # paging; page numbers stay the default for existing clients
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params if self.request is not None else {}
+            if 'cursor' in params or params.get('pagination') == 'cursor':
+                self._paginator = ArticleCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_permissions(self):
         if self.request.user.is_superuser:
@@ -85,46 +234,116 @@ class ArticleViewSet(viewsets.ModelViewSet):
         if self.action in ["list", "retrieve"]:
             return [AllowAny()]
         elif self.action in ["create", "update", "partial_update", "destroy"]:
-            return [IsAuthenticatedOrReadOnly(), IsEditorOrModerator(), DjangoModelPermissions()]
+            return [IsAuthenticatedOrReadOnly(), IsEditorOrModerator(), RoleModelPermissions()]
+        elif self.action == "bulk":
+            return [IsAuthenticatedOrReadOnly(), IsEditorOrModerator(), BulkImportPermissions()]
+        elif self.action == "export":
+            return [IsAuthenticated(), IsAdminOnly()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        # the comments action only needs the article row itself
+        if self.action == 'comments':
+            return Article.objects.all()
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = self.select_columns(queryset, self.get_serializer().fields)
+        return queryset
+
+    def select_columns(self, queryset, fields):
+        # load only what the (possibly ?fields= narrowed) serializer reads;
+        # the ordering columns always come along, the cursor paginator reads them
+        columns = {'id', 'created_at', 'last_comment_at', 'comment_count'}
+        queryset = queryset.select_related(None).prefetch_related(None)
+        for name in fields:
+            if name == 'author':
+                columns.add('author__username')
+                queryset = queryset.select_related('author')
+            elif name == 'author_profile_pic':
+                columns.update(['author__profile__profile_pic', 'author__profile__profile_pic_variants'])
+                queryset = queryset.select_related('author__profile')
+            elif name == 'tags':
+                queryset = queryset.prefetch_related('tags')
+            else:
+                columns.add(name)
+        return queryset.only(*columns)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def get_serializer_class(self):
         if self.action == 'comments':
             return CommentSerializer
+        if self.action in ('list', 'retrieve') and 'view' in self.request.query_params:
+            view = self.request.query_params['view']
+            if view == 'summary':
+                return ArticleSummarySerializer
+            if view != 'full':
+                raise ValidationError({'view': ['Expected "summary" or "full".']})
         return super().get_serializer_class()
 
     def get_serializer_context(self):
         return {"request": self.request}
 
-    @action(detail=True, methods=['get', 'post'], url_path='comments')
+    @cache_response('articles')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response('article:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        # body: a list of {title, content, tags} (with "id" to update); all or nothing
+        try:
+            results = import_articles(request.data, request.user)
+        except ImportRejected as exc:
+            return Response({'created': 0, 'updated': 0, 'results': exc.results}, status=status.HTTP_400_BAD_REQUEST)
+
+        created = sum(result['status'] == 'created' for result in results)
+        return Response(
+            {'created': created, 'updated': len(results) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        # NDJSON stream of every article with tags and comment tree; ?since= for incrementals
+        try:
+            since = parse_since(request.query_params.get('since'))
+        except ValueError as exc:
+            return Response({'since': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        started_at = timezone.now()
+        response = StreamingHttpResponse(export_lines(since), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="articles.ndjson"'
+        # pass this back as ?since= for the next incremental export
+        response['X-Export-Started-At'] = started_at.isoformat()
+        return response
+
+    @action(detail=True, methods=['get', 'post'], url_path='comments', throttle_classes=[CommentThrottle])
+    @cache_response('comments:{pk}')
     def comments(self, request, pk=None):
         article = self.get_object()
 
         if request.method == 'GET':
-            comments = article.comments.all()
-            serializer = CommentSerializer(comments, many=True)
-
-            # tree structure:
-            comments_dict = {comment["id"]: comment for comment in serializer.data}
-            root_comments = []
-            for comment in serializer.data:
-                parent_id = comment["reply_to"]
-                if parent_id is None:
-                    root_comments.append(comment)
-                else:
-                    parent = comments_dict.get(parent_id)
-                    if parent:
-                        if "replies" not in parent:
-                            parent["replies"] = []
-                        parent["replies"].append(comment)
+            comments = article.comments.select_related('author__profile')
+
+            paginator = CommentThreadPagination()
+            paginate = paginator.is_requested(request)
+            if paginate:
+                comments = paginator.paginate_threads(comments, request, view=self)
+
+            serializer = CommentSerializer(comments.in_thread_order(), many=True)
+            root_comments = nest_comments(serializer.data)
 
+            if paginate:
+                return paginator.get_paginated_response(root_comments)
             return Response(root_comments)
 
         elif request.method == 'POST':
-            serializer = CommentSerializer(data=request.data, context={'request': request})
+            serializer = CommentSerializer(data=request.data, context={'request': request, 'article': article})
             if serializer.is_valid():
                 serializer.save(article=article, author=request.user)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -137,10 +356,7 @@ class CanManageComment(BasePermission):
             return True
 
         if request.method == 'POST':
-            return request.user and request.user.is_authenticated and (
-                request.user.groups.filter(
-                    name__in=['Members', 'Moderators']).exists()
-            )
+            return request.user and request.user.is_authenticated and has_role(request, 'Members', 'Moderators')
 
         if request.method in ['PUT', 'PATCH', 'DELETE']:
             return request.user and request.user.is_authenticated
@@ -152,18 +368,20 @@ class CanManageComment(BasePermission):
             return True
 
         if request.method in ['PUT', 'PATCH', 'DELETE']:
-            if request.user.groups.filter(name='Members').exists():
-                return obj.author == request.user
+            if has_role(request, 'Members'):
+                return obj.author_id == request.user.id
 
-            return request.user.groups.filter(name__in=['Moderators', 'Editors']).exists()
+            return has_role(request, 'Moderators', 'Editors')
 
         return False
 
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+class CommentViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.select_related('author__profile')
     serializer_class = CommentSerializer
-
+    pagination_class = CommentCursorPagination
+    filter_backends = [CommentFilter]
+    throttle_classes = [CommentThrottle]
 
     def get_permissions(self):
         if self.request.user.is_superuser:
@@ -177,24 +395,27 @@ class CommentViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def by_thread(self):
+        # the list pages over threads unless it is one user's comments
+        return 'author' not in self.request.query_params
+
+    def list_queryset(self, queryset):
+        # what the paginator pages over: root ids, or the comments themselves
+        if self.by_thread():
+            return queryset.filter(reply_to__isnull=True).values('id', 'created_at')
+        return queryset
+
+    def thread_queryset(self, roots):
+        # the page's threads in full, in one query over blog_comment_root_path_idx
+        return self.get_queryset().filter(root_id__in=[root['id'] for root in roots]).in_thread_order()
+
     def list(self, request, *args, **kwargs):
-        # tree structure:
-        res = super().list(request, *args, **kwargs)
-        comments = res.data
-        comments_dict = {comment["id"]: comment for comment in comments}
-        root_comments = []
-        for comment in comments:
-            parent_id = comment["reply_to"]
-            if parent_id is None:
-                root_comments.append(comment)
-            else:
-                parent = comments_dict.get(parent_id)
-                if parent:
-                    if "replies" not in parent:
-                        parent["replies"] = []
-                    parent["replies"].append(comment)
-        res.data = root_comments
-        return res
+        page = self.paginate_queryset(self.list_queryset(self.filter_queryset(self.get_queryset())))
+        if self.by_thread():
+            data = nest_comments(self.get_serializer(self.thread_queryset(page), many=True).data)
+        else:
+            data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
 
     def create(self, request, *args, **kwargs):
         # prevent Article and reply_to Comment mismatch
@@ -215,3 +436,60 @@ class CommentViewSet(viewsets.ModelViewSet):
                 )
 
         return super().create(request, *args, **kwargs)
+
+
+class TagViewSet(CachedResponseMixin, viewsets.GenericViewSet):
+    # tag cloud from the TagStat counts table: ?limit= for the top K, ?prefix= to autocomplete
+    queryset = TagStat.objects.filter(article_count__gt=0).order_by('-article_count', 'key')
+    serializer_class = TagStatSerializer
+    permission_classes = [AllowAny]
+    default_limit = 50
+    max_limit = 500
+
+    def get_limit(self):
+        limit = try_parse_int(self.request.query_params.get('limit'))
+        if not limit or limit < 1:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        prefix = self.request.query_params.get('prefix', '').strip().lower()
+        if prefix:
+            queryset = queryset.filter(key__startswith=prefix)
+        return queryset[:self.get_limit()]
+
+    @cache_response('tags')
+    def list(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.get_queryset(), many=True).data)
+
+
+def comment_stream(request, pk):
+    # text/event-stream of the article's comment changes (see blog.events);
+    # EventSource resends the last id it saw as Last-Event-ID on reconnect
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    if not Article.objects.filter(pk=pk).exists():
+        return JsonResponse({'detail': 'No Article matches the given query.'}, status=404)
+
+    last_id = events.parse_event_id(request.headers.get('Last-Event-ID', request.GET.get('last_event_id')))
+    if isinstance(request, ASGIRequest):
+        stream = events.astream(pk, last_id)
+    else:
+        stream = events.stream(pk, last_id)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # don't let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def prometheus_metrics(request):
+    # blog.metrics histograms in the Prometheus text format
+    if not settings.METRICS_ENABLED:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoFinalProject_blog.settings')
+os.environ.setdefault('ASYNC_READS', 'True')
+# a persistent connection per thread doesn't suit async workers; use DB_POOL
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
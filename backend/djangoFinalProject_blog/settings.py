@@ -10,9 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 from datetime import timedelta
+import copy
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 BASE_BACKEND_URL = config("BASE_BACKEND_URL", default="http://127.0.0.1:8000")
 
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # outermost, so its timings cover the rest of the stack
+    'blog.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,9 +68,36 @@ CORS_ALLOWED_ORIGINS = [
 
 ROOT_URLCONF = 'djangoFinalProject_blog.urls'
 
+# serve article and comment reads from async views (blog.async_views); asgi.py
+# turns this on, under WSGI each async view would need its own event loop
+ASYNC_READS = config('ASYNC_READS', default=False, cast=bool)
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# background jobs (blog.jobs): 'thread' runs them on a small pool in the web
+# process, 'worker' leaves them to `manage.py run_jobs`, 'eager' runs them
+# inline after commit
+JOBS_MODE = config('JOBS_MODE', default='thread')
+JOBS_THREADS = config('JOBS_THREADS', default=2, cast=int)
+# a claimed job is handed to another worker if its lease isn't renewed in time
+JOBS_LEASE_SECONDS = config('JOBS_LEASE_SECONDS', default=300, cast=int)
+
+# request metrics (blog.metrics): Server-Timing headers, a slow request log and
+# per-route histograms at /api/metrics; when off the middleware drops out
+# entirely. Set METRICS_TOKEN to require it as a bearer token on /api/metrics.
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+METRICS_SLOW_REQUEST_MS = config('METRICS_SLOW_REQUEST_MS', default=500, cast=int)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# comment event streams (blog.events): how often an idle stream re-checks the
+# event log (picks up writes from other processes), and how long events are
+# kept for Last-Event-ID resume
+COMMENT_STREAM_POLL_SECONDS = config('COMMENT_STREAM_POLL_SECONDS', default=10, cast=float)
+# under WSGI each stream holds a worker thread; clients reconnect after this
+COMMENT_STREAM_SYNC_SECONDS = config('COMMENT_STREAM_SYNC_SECONDS', default=300, cast=float)
+COMMENT_EVENT_RETENTION_HOURS = config('COMMENT_EVENT_RETENTION_HOURS', default=24, cast=int)
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -90,16 +120,82 @@ WSGI_APPLICATION = 'djangoFinalProject_blog.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
-        'HOST': config('DB_HOST', default='localhost'),
-        'PORT': config('DB_PORT', default='5432'),
+DB_ENGINE = config('DB_ENGINE', default='postgresql')
+
+if DB_ENGINE == 'sqlite':
+    # local experiments and benchmarks without a Postgres server
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # keep connections open across requests, checked before reuse
+            # (asgi.py sets 0: persistent connections don't suit async workers)
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if config('DB_POOL', default=False, cast=bool):
+        # psycopg's connection pool instead (pip install "psycopg[pool]"),
+        # which also suits ASGI; connections are checked as they are handed out
+        from psycopg_pool import ConnectionPool
+
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+            'check': ConnectionPool.check_connection,
+        }}
+
+# Read replicas for article and comment GETs (blog.routers): host or host:port
+# entries that share the primary's credentials, or database files with sqlite
+# (the primary's own file is enough to try the routing locally).
+DATABASE_REPLICAS = []
+for number, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv()), 1):
+    if DB_ENGINE == 'sqlite':
+        location = {'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    # tests read the test database through the replica aliases
+    DATABASES[f'replica{number}'] = {**copy.deepcopy(DATABASES['default']), **location, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+# how long a user who wrote reads from the primary; keep it above the replication lag
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# Cached API responses (blog.cache). Local memory is per process; with several
+# workers on one box use RESPONSE_CACHE=file so they share invalidations.
+RESPONSE_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
 }
+RESPONSE_CACHE = config('RESPONSE_CACHE', default='locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKENDS.get(RESPONSE_CACHE, RESPONSE_CACHE),
+        'LOCATION': config('RESPONSE_CACHE_LOCATION', default=os.path.join(BASE_DIR, '.response_cache')),
+        'TIMEOUT': config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int),
+    },
+}
+
+BLOG_RESPONSE_CACHE = 'responses'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -113,8 +209,23 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.BrowsableAPIRenderer',
         'rest_framework.renderers.JSONRenderer',
     ],
+    # token buckets for blog.throttling, "<burst>/<period>"; an empty value turns one off
+    'DEFAULT_THROTTLE_RATES': {
+        'register': config('THROTTLE_REGISTER_RATE', default='10/hour') or None,
+        'login': config('THROTTLE_LOGIN_RATE', default='10/min') or None,
+        'login_user': config('THROTTLE_LOGIN_USER_RATE', default='50/hour') or None,
+        'token_refresh': config('THROTTLE_TOKEN_REFRESH_RATE', default='30/min') or None,
+        'comment': config('THROTTLE_COMMENT_RATE', default='20/min') or None,
+    },
+    # reverse proxies in front of the app, whose X-Forwarded-For entries give the
+    # client address; 0 uses REMOTE_ADDR (clients can't spoof their bucket)
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 }
 
+# rate limit buckets (blog.throttling), shared by the worker processes on a host
+THROTTLE_ENABLED = config('THROTTLE_ENABLED', default=True, cast=bool)
+THROTTLE_STORE_PATH = config('THROTTLE_STORE_PATH', default=os.path.join(BASE_DIR, '.throttle.sqlite3'))
+
 LOGIN_REDIRECT_URL = '/api/'
 LOGOUT_REDIRECT_URL = '/api/'
 
@@ -124,6 +235,8 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "ROTATE_REFRESH_TOKENS": False,
     "BLACKLIST_AFTER_ROTATION": False,
+    "TOKEN_OBTAIN_SERIALIZER": "blog.tokens.RoleTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "blog.tokens.RoleTokenRefreshSerializer",
 }
 
 TAGGIT_CASE_INSENSITIVE = True
@@ -0,0 +1,10 @@
+import copy
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# `manage.py test` settings: a replica alias that mirrors the test database,
+# so blog.tests.ReplicaReadTests exercises the replica read path without a
+# replica server (routing stays off unless a test turns it on)
+if 'replica1' not in DATABASES:
+    DATABASES['replica1'] = {**copy.deepcopy(DATABASES['default']), 'TEST': {'MIRROR': 'default'}}
@@ -23,12 +23,14 @@ from rest_framework_simplejwt.views import (
 )
 from django.contrib import admin
 from blog.views import RegisterView
+from blog.throttling import LoginAccountThrottle, LoginThrottle, TokenRefreshThrottle
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('blog.urls')),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/', TokenObtainPairView.as_view(throttle_classes=[LoginThrottle, LoginAccountThrottle]), name='token_obtain_pair'),
+    path('api/token/refresh/', TokenRefreshView.as_view(throttle_classes=[TokenRefreshThrottle]),
+         name='token_refresh'),
     path('api/register/', RegisterView.as_view(),
          name='register'),
     path('api/auth/', include('rest_framework.urls')),
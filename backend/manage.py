@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoFinalProject_blog.settings')
+    test = sys.argv[1:2] == ['test']
+    os.environ.setdefault(
+        'DJANGO_SETTINGS_MODULE', 'djangoFinalProject_blog.test_settings' if test else 'djangoFinalProject_blog.settings')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
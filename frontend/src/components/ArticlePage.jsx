@@ -1,6 +1,6 @@
-import { useEffect, useState, useContext } from "react";
+import { useEffect, useState, useContext, useRef } from "react";
 import { getArticleById, deleteArticle } from "../services/articleService";
-import { getComments, createComment, editComment, deleteComment } from "../services/commentService";
+import { getComments, createComment, editComment, deleteComment, subscribeToComments } from "../services/commentService";
 import { useParams, useNavigate } from "react-router-dom";
 import AuthContext from "../context/AuthContext";
 import "bootstrap/dist/css/bootstrap.min.css";
@@ -10,6 +10,50 @@ import { toast } from "react-toastify";
 
 const BASE_BACKEND_URL = import.meta.env.VITE_BACKEND_URL || "http://127.0.0.1:8000";
 
+const processComment = (comment) => ({
+    ...comment,
+    author_profile_pic: comment.author_profile_pic
+        ? `${BASE_BACKEND_URL}${comment.author_profile_pic}`
+        : null,
+    replies: comment.replies ? comment.replies.map(processComment) : []
+});
+
+const removeComment = (comments, commentId) => comments
+    .filter(comment => comment.id !== commentId)
+    .map(comment => ({ ...comment, replies: removeComment(comment.replies, commentId) }));
+
+const findComment = (comments, commentId) => {
+    for (const comment of comments) {
+        if (comment.id === commentId) return comment;
+        const found = findComment(comment.replies, commentId);
+        if (found) return found;
+    }
+    return null;
+};
+
+const insertComment = (comments, comment) => {
+    if (!comment.reply_to) return [comment, ...comments];
+    return comments.map(parent => parent.id === comment.reply_to
+        ? { ...parent, replies: [comment, ...parent.replies] }
+        : { ...parent, replies: insertComment(parent.replies, comment) });
+};
+
+// applies one stream event to the comment tree; safe to apply twice
+const applyCommentEvent = (comments, kind, data) => {
+    const existing = findComment(comments, data.id);
+    if (kind === "deleted") return existing ? removeComment(comments, data.id) : comments;
+    if (kind === "created" && existing) return comments;
+
+    const comment = processComment({ ...data, replies: existing ? existing.replies : [] });
+    if (existing && existing.reply_to === comment.reply_to) {
+        const replace = (nodes) => nodes.map(node => node.id === comment.id
+            ? comment
+            : { ...node, replies: replace(node.replies) });
+        return replace(comments);
+    }
+    return insertComment(existing ? removeComment(comments, data.id) : comments, comment);
+};
+
 function ArticlePage() {
     const { id } = useParams();
     const navigate = useNavigate();
@@ -21,30 +65,43 @@ function ArticlePage() {
     const [editingComment, setEditingComment] = useState(null);
     const [replyingTo, setReplyingTo] = useState(null);
     const [replyText, setReplyText] = useState("");
+    // stream events that arrive while the comments are being fetched
+    const pendingEvents = useRef(null);
 
     useEffect(() => {
         setIsLoading(true);
         getArticleById(id)
             .then((res) => setArticle(res.data))
             .catch((err) => console.error("Error fetching article:", err));
+        // subscribe first so that nothing posted during the fetch is missed
+        const unsubscribe = subscribeToComments(id, (kind, data) => {
+            if (kind === "reset") {
+                fetchComments();
+            } else if (pendingEvents.current) {
+                pendingEvents.current.push([kind, data]);
+            } else {
+                setComments(comments => applyCommentEvent(comments, kind, data));
+            }
+        });
         fetchComments();
+        return unsubscribe;
     }, [id]);
 
     const fetchComments = () => {
+        pendingEvents.current = pendingEvents.current || [];
         getComments(id)
             .then((res) => {
-                const processComments = (comments) => {
-                    return comments.map(comment => ({
-                        ...comment,
-                        author_profile_pic: comment.author_profile_pic
-                            ? `${BASE_BACKEND_URL}${comment.author_profile_pic}`
-                            : null,
-                        replies: comment.replies ? processComments(comment.replies) : []
-                    }));
-                };
-                setComments(processComments(res.data));
+                const events = pendingEvents.current || [];
+                pendingEvents.current = null;
+                setComments(events.reduce(
+                    (comments, [kind, data]) => applyCommentEvent(comments, kind, data),
+                    res.data.map(processComment)
+                ));
+            })
+            .catch((err) => {
+                pendingEvents.current = null;
+                console.error("Error fetching comments:", err);
             })
-            .catch((err) => console.error("Error fetching comments:", err))
             .finally(() => setIsLoading(false));
     };
 
@@ -62,9 +119,9 @@ function ArticlePage() {
     const handlePostComment = () => {
         if (!newComment.trim()) return;
         createComment(id, newComment)
-            .then(() => {
+            .then((res) => {
                 setNewComment("");
-                fetchComments();
+                setComments(comments => applyCommentEvent(comments, "created", res.data));
             })
             .catch(err => console.error("Error posting comment:", err));
     };
@@ -72,9 +129,9 @@ function ArticlePage() {
     const handleEditComment = (commentId) => {
         if (!editingComment.text.trim()) return;
         editComment(commentId, editingComment.text)
-            .then(() => {
+            .then((res) => {
                 setEditingComment(null);
-                fetchComments();
+                setComments(comments => applyCommentEvent(comments, "updated", res.data));
             })
             .catch(err => console.error("Error editing comment:", err));
     };
@@ -83,7 +140,7 @@ function ArticlePage() {
         if (window.confirm("Are you sure you want to delete this comment?")) {
             deleteComment(commentId)
                 .then(() => {
-                    fetchComments();
+                    setComments(comments => applyCommentEvent(comments, "deleted", { id: commentId }));
                     toast("Comment Deleted Successfully");
                 })
                 .catch(err => console.error("Error deleting comment:", err));
@@ -93,10 +150,10 @@ function ArticlePage() {
     const handleReply = (parentId) => {
         if (!replyText.trim()) return;
         createComment(id, replyText, parentId)
-            .then(() => {
+            .then((res) => {
                 setReplyingTo(null);
                 setReplyText("");
-                fetchComments();
+                setComments(comments => applyCommentEvent(comments, "created", res.data));
             })
             .catch(err => console.error("Error posting reply:", err));
     };
@@ -183,8 +240,13 @@ function ArticlePage() {
             ) : article ? (
                 <>
                     <h1>{article.title}</h1>
-                    <h5 className="text-muted">By {article.author} • {new Date(article.created_at).toLocaleDateString()}</h5>
-                    <p className="mt-3">{article.content}</p>
+                    <h5 className="text-muted">By {article.author} • {new Date(article.created_at).toLocaleDateString()} • {article.reading_time} min read</h5>
+                    {/* rendered and escaped by the API; plain text until a row is rendered */}
+                    {article.content_html ? (
+                        <div className="mt-3" dangerouslySetInnerHTML={{ __html: article.content_html }} />
+                    ) : (
+                        <p className="mt-3">{article.content}</p>
+                    )}
 
                     <p>
                         <strong>Tags: </strong>
@@ -1,6 +1,5 @@
 import { useEffect, useState, useContext } from "react";
 import { getAllArticles, deleteArticle } from "../services/articleService";
-import { getComments } from "../services/commentService";
 import { useNavigate } from "react-router-dom";
 import AuthContext from "../context/AuthContext";
 import "bootstrap/dist/css/bootstrap.min.css";
@@ -76,27 +75,15 @@ function Home() {
 }
 
 function ArticlePreview({ article, navigate, groups, onDelete }) {
-    const [commentCount, setCommentCount] = useState(null);
     const { isSuperuser } = useContext(AuthContext);
 
-    useEffect(() => {
-        getComments(article.id)
-            .then((res) => {
-                const countComments = (comments) => {
-                    return comments.reduce((count, comment) => count + 1 + countComments(comment.replies || []), 0);
-                };
-                setCommentCount(countComments(res.data));
-            })
-            .catch((err) => console.error(`Error fetching comments for ${article.id}:`, err));
-    }, [article.id]);
-
     return (
         <div className="col-md-4 mb-3">
             <div className="card shadow-sm" style={{ cursor: "pointer" }}>
                 <div className="card-body" onClick={() => navigate(`/article/${article.id}`)}>
                     <h5 className="card-title">{article.title}</h5>
-                    <h6 className="card-subtitle mb-2 text-muted">By {article.author}</h6>
-                    <p className="card-text">{article.content.split(" ").slice(0, 50).join(" ")}...</p>
+                    <h6 className="card-subtitle mb-2 text-muted">By {article.author} • {article.reading_time} min read</h6>
+                    <p className="card-text">{article.excerpt}</p>
 
                     <p>
                         <strong>Tags: </strong>
@@ -108,7 +95,7 @@ function ArticlePreview({ article, navigate, groups, onDelete }) {
                         ))}
                     </p>
 
-                    <p className="text-muted">💬 {commentCount !== null ? commentCount : "Loading..."} comments</p>
+                    <p className="text-muted">💬 {article.comment_count} comments</p>
 
                     <div className="d-flex justify-content-between mt-3">
                         {(groups.includes("Editors") || groups.includes("Moderators") || isSuperuser) && (
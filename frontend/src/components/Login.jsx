@@ -20,7 +20,11 @@ function Login() {
             navigate("/");
             toast("Welcome back!");
         } catch (err) {
-            setError("Invalid username or password");
+            if (err.response?.status === 429) {
+                setError(`Too many login attempts. Try again in ${err.response.headers["retry-after"]} seconds.`);
+            } else {
+                setError("Invalid username or password");
+            }
         }
     };
 
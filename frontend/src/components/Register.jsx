@@ -99,7 +99,12 @@ function Register() {
                 login(tokens.access, tokens.refresh);
                 navigate("/");
             } catch (err) {
-                setErrors({ submit: "Registration failed. Please try again." });
+                if (err.response?.status === 429) {
+                    const minutes = Math.ceil(err.response.headers["retry-after"] / 60);
+                    setErrors({ submit: `Too many sign-ups from your network. Try again in ${minutes} minutes.` });
+                } else {
+                    setErrors({ submit: "Registration failed. Please try again." });
+                }
             } finally {
                 setSubmitting(false);
                 toast("Welcome!");
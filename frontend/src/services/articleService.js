@@ -1,7 +1,8 @@
 import api from "./api";
 
+// list pages only show previews, so they ask for the summary representation
 export function getAllArticles(url = null) {
-    return api.get(url || "/api/articles/");
+    return api.get(url || "/api/articles/?view=summary");
 }
 
 export function getArticleById(id) {
@@ -9,12 +10,12 @@ export function getArticleById(id) {
 }
 
 export function getArticlesByTag(tag, url = null) {
-    const searchUrl = url || `/api/articles/?search=${tag}`;
+    const searchUrl = url || `/api/articles/?search=${tag}&view=summary`;
     return api.get(searchUrl);
 }
 
 export function getArticlesBySearch(query) {
-    return api.get(`/api/articles/?search=${query}`);
+    return api.get(`/api/articles/?search=${query}&view=summary`);
 }
 
 export function createArticle(articleData) {
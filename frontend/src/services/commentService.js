@@ -45,3 +45,14 @@ export function deleteComment(commentId) {
         },
     });
 }
+
+// server-sent comment changes for one article; onEvent(kind, data) with kind
+// created / updated / deleted, or reset when the client should refetch.
+// Returns a function that closes the stream.
+export function subscribeToComments(articleId, onEvent) {
+    const source = new EventSource(`${api.defaults.baseURL}/api/articles/${articleId}/comments/stream/`);
+    ["created", "updated", "deleted", "reset"].forEach(kind => {
+        source.addEventListener(kind, (event) => onEvent(kind, JSON.parse(event.data)));
+    });
+    return () => source.close();
+}